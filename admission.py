@@ -0,0 +1,85 @@
+from array import array
+import config
+import time
+
+ROUTE_CLASS_CONTROL = 0
+ROUTE_CLASS_STATIC = 1
+
+route_class_name = ('control', 'static')
+
+# (tokens per second, burst) indexed by ROUTE_CLASS_*.
+route_class_limits = (
+    (config.admission_control_rate, config.admission_control_burst),
+    (config.admission_static_rate, config.admission_static_burst)
+)
+
+# Fixed size table of clients, each with one bucket per route class. Tokens
+# are kept in thousandths so refilling is integer arithmetic. Prefork
+# workers each have their own table, see config.web_server_workers.
+table_size = config.admission_table_size
+client_ips = [None] * table_size
+bucket_tokens = array('l', [0] * (table_size * 2))
+bucket_updated_ms = array('L', [0] * (table_size * 2))
+
+admitted = array('L', [0, 0])
+rejected = array('L', [0, 0])
+
+
+def get_route_class(path):
+    for prefix in config.admission_control_prefixes:
+        if path.startswith(prefix):
+            return ROUTE_CLASS_CONTROL
+
+    return ROUTE_CLASS_STATIC
+
+
+def get_client_slot(ip, now):
+    try:
+        return client_ips.index(ip)
+    except ValueError:
+        pass
+
+    # Evict the least recently seen client, by its latest request of either
+    # class, so a client flooding one class can't look idle by the other.
+    slot = 0
+    oldest = 0
+    for index in range(table_size):
+        if client_ips[index] is None:
+            slot = index
+            break
+
+        age = min(
+            time.ticks_diff(now, bucket_updated_ms[index * 2]),
+            time.ticks_diff(now, bucket_updated_ms[index * 2 + 1])
+        )
+        if age > oldest:
+            slot = index
+            oldest = age
+
+    client_ips[slot] = ip
+    for route_class in (ROUTE_CLASS_CONTROL, ROUTE_CLASS_STATIC):
+        bucket_tokens[slot * 2 + route_class] = \
+            route_class_limits[route_class][1] * 1000
+        bucket_updated_ms[slot * 2 + route_class] = now
+
+    return slot
+
+
+def admit(http_client):
+    now = time.ticks_ms()
+    route_class = get_route_class(http_client.GetRequestPath())
+    rate, burst = route_class_limits[route_class]
+
+    bucket = get_client_slot(http_client.GetIPAddr(), now) * 2 + route_class
+    elapsed_ms = time.ticks_diff(now, bucket_updated_ms[bucket])
+    tokens = min(bucket_tokens[bucket] + elapsed_ms * rate, burst * 1000)
+    bucket_updated_ms[bucket] = now
+
+    if tokens < 1000:
+        bucket_tokens[bucket] = tokens
+        rejected[route_class] += 1
+        return False
+
+    bucket_tokens[bucket] = tokens - 1000
+    admitted[route_class] += 1
+    return True
@@ -0,0 +1,168 @@
+from array import array
+from machine import Pin
+import time
+
+_CONVERSION_REGISTER = 0x00
+_CONFIG_REGISTER = 0x01
+_LO_THRESH_REGISTER = 0x02
+_HI_THRESH_REGISTER = 0x03
+
+_CONFIG_MUX_SINGLE = (0x4000, 0x5000, 0x6000, 0x7000)
+_CONFIG_MODE_CONTINUOUS = 0x0000
+_CONFIG_COMP_QUE_1 = 0x0000
+
+_GAINS = {
+    6144: 0x0000,
+    4096: 0x0200,
+    2048: 0x0400,
+    1024: 0x0600,
+    512: 0x0800,
+    256: 0x0a00
+}
+
+_DATA_RATES = {
+    8: 0x0000,
+    16: 0x0020,
+    32: 0x0040,
+    64: 0x0060,
+    128: 0x0080,
+    250: 0x00a0,
+    475: 0x00c0,
+    860: 0x00e0
+}
+
+
+class ADS1115:
+    """Continuous conversion with the ALERT/RDY pin signalling each result.
+
+    Every ready sample is read from the pin IRQ. With several channels the
+    multiplexer moves on to the next channel after each sample, and the
+    first conversion after a switch is discarded. Each `decimation` samples
+    of a channel are averaged into one window entry.
+    """
+
+    def __init__(self, i2c, address=0x48, channels=(0,), full_scale_mv=4096,
+                 data_rate=128, decimation=4, window=32, scan_discard=1):
+        if decimation & (decimation - 1) or window & (window - 1):
+            raise ValueError("decimation and window must be powers of two")
+
+        self.i2c = i2c
+        self.address = address
+        self.channels = channels
+        self.full_scale_mv = full_scale_mv
+        self.decimation = decimation
+        self.decimation_shift = decimation.bit_length() - 1
+        self.window = window
+        self.scan_discard = scan_discard if len(channels) > 1 else 0
+
+        self.configs = []
+        for channel in channels:
+            config = _CONFIG_MUX_SINGLE[channel] | _GAINS[full_scale_mv] \
+                | _CONFIG_MODE_CONTINUOUS | _DATA_RATES[data_rate] \
+                | _CONFIG_COMP_QUE_1
+            self.configs.append(bytearray((config >> 8, config & 0xff)))
+
+        count = len(channels)
+        self.samples = array('h', [0] * (count * window))
+        self.sample_counts = array('L', [0] * count)
+        self.accumulators = array('l', [0] * count)
+        self.accumulated = array('H', [0] * count)
+        self.sample_callbacks = []
+
+        self.current = 0
+        self.discard = 0
+        self.ready_us = 0
+        self.pin = None
+        self._buffer = bytearray(2)
+
+    def _write_register(self, register, value):
+        self._buffer[0] = value >> 8
+        self._buffer[1] = value & 0xff
+        self.i2c.writeto_mem(self.address, register, self._buffer)
+
+    def start(self, pin):
+        # ALERT/RDY pulses low after each conversion when the high threshold
+        # MSB is set and the low threshold MSB is clear.
+        self._write_register(_LO_THRESH_REGISTER, 0x0000)
+        self._write_register(_HI_THRESH_REGISTER, 0x8000)
+
+        self.current = 0
+        self.discard = self.scan_discard
+        self.i2c.writeto_mem(self.address, _CONFIG_REGISTER, self.configs[0])
+
+        self.pin = pin
+        pin.irq(handler=self.ready_handler, trigger=Pin.IRQ_FALLING)
+
+    def stop(self):
+        if self.pin is not None:
+            self.pin.irq(handler=None)
+            self.pin = None
+
+    def read_raw(self):
+        self.i2c.readfrom_mem_into(
+            self.address, _CONVERSION_REGISTER, self._buffer
+        )
+        value = (self._buffer[0] << 8) | self._buffer[1]
+        if value & 0x8000:
+            value -= 0x10000
+        return value
+
+    def ready_handler(self, pin):
+        self.ready_us = time.ticks_us()
+        value = self.read_raw()
+
+        if self.discard:
+            self.discard -= 1
+            return
+
+        index = self.current
+        if len(self.channels) > 1:
+            self.current = (index + 1) % len(self.channels)
+            self.discard = self.scan_discard
+            self.i2c.writeto_mem(
+                self.address, _CONFIG_REGISTER, self.configs[self.current]
+            )
+
+        self.add_sample(index, value)
+
+    def add_sample(self, index, value):
+        self.accumulators[index] += value
+        self.accumulated[index] += 1
+        if self.accumulated[index] < self.decimation:
+            return
+
+        value = self.accumulators[index] >> self.decimation_shift
+        self.accumulators[index] = 0
+        self.accumulated[index] = 0
+
+        count = self.sample_counts[index]
+        self.samples[index * self.window + (count & (self.window - 1))] = value
+        self.sample_counts[index] = count + 1
+
+        for callback in self.sample_callbacks:
+            callback(self.channels[index], value)
+
+    def latest(self, channel):
+        index = self.channels.index(channel)
+        count = self.sample_counts[index]
+        if not count:
+            return None
+        return self.samples[index * self.window + ((count - 1) & (self.window - 1))]
+
+    def window_average(self, channel, count=None):
+        index = self.channels.index(channel)
+        available = min(self.sample_counts[index], self.window)
+        if count is None or count > available:
+            count = available
+        if not count:
+            return None
+
+        end = self.sample_counts[index]
+        offset = index * self.window
+        total = 0
+        for position in range(end - count, end):
+            total += self.samples[offset + (position & (self.window - 1))]
+        return total // count
+
+    def to_millivolts(self, value):
+        return value * self.full_scale_mv // 32768
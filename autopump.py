@@ -0,0 +1,142 @@
+from machine import Timer
+import config
+import controller
+import sensor
+import time
+
+
+class HysteresisControl:
+    """Switches on past on_threshold and off past off_threshold.
+
+    With on_above the output switches on when the value rises to
+    on_threshold, otherwise when it falls to it. A change is only made once
+    the output has been in its current state for min_on_ms/min_off_ms.
+    """
+
+    def __init__(self, on_threshold, off_threshold, min_on_ms, min_off_ms,
+                 on_above=True):
+        self.sign = 1 if on_above else -1
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.min_on_ms = min_on_ms
+        self.min_off_ms = min_off_ms
+        self.enable = False
+        self.changed_ms = None
+
+    def set(self, enable, now_ms):
+        if enable != self.enable:
+            self.enable = enable
+            self.changed_ms = now_ms
+
+    def update(self, value, now_ms):
+        if self.changed_ms is None:
+            elapsed_ms = None
+        else:
+            elapsed_ms = time.ticks_diff(now_ms, self.changed_ms)
+
+        if self.enable:
+            if self.sign * value <= self.sign * self.off_threshold \
+                    and (elapsed_ms is None or elapsed_ms >= self.min_on_ms):
+                self.set(False, now_ms)
+
+        elif self.sign * value >= self.sign * self.on_threshold \
+                and (elapsed_ms is None or elapsed_ms >= self.min_off_ms):
+            self.set(True, now_ms)
+
+        return self.enable
+
+
+autopump_enable = False
+control = None
+failsafe_timer = None
+failsafe_trips = 0
+
+reaction_us = None
+reaction_us_max = 0
+
+
+def initialize_autopump():
+    global control
+    global failsafe_timer
+
+    if control is not None:
+        print('Autopump is already initialized')
+
+    else:
+        print('Initializing autopump...')
+
+        control = HysteresisControl(
+            config.autopump_on_threshold,
+            config.autopump_off_threshold,
+            config.autopump_min_on_ms,
+            config.autopump_min_off_ms,
+            on_above=config.autopump_on_above
+        )
+        failsafe_timer = Timer(config.autopump_timer_id)
+        sensor.ads1115.sample_callbacks.append(sample_handler)
+
+        if config.autopump_enable:
+            toggle_autopump_enable()
+
+        print('Autopump initialized')
+
+
+def arm_failsafe():
+    failsafe_timer.init(
+        mode=Timer.ONE_SHOT,
+        period=config.autopump_failsafe_timeout_ms,
+        callback=failsafe_handler
+    )
+
+
+def failsafe_handler(timer):
+    # No sample arrived within the timeout, fail safe with the pump off.
+    global failsafe_trips
+
+    if autopump_enable:
+        failsafe_trips += 1
+        control.set(False, time.ticks_ms())
+        controller.set_enable(config.autopump_output, False)
+
+
+def sample_handler(channel, value):
+    # Runs in the ADS1115 sample-ready path.
+    global reaction_us
+    global reaction_us_max
+
+    if not autopump_enable or channel != config.autopump_channel:
+        return
+
+    arm_failsafe()
+
+    enable = control.update(value, time.ticks_ms())
+    if enable != controller.is_enabled(config.autopump_output):
+        controller.set_enable(config.autopump_output, enable)
+
+        reaction_us = time.ticks_diff(time.ticks_us(), sensor.ads1115.ready_us)
+        if reaction_us > reaction_us_max:
+            reaction_us_max = reaction_us
+
+
+def toggle_autopump_enable():
+    global autopump_enable
+
+    autopump_enable = not autopump_enable
+
+    if autopump_enable:
+        control.set(
+            controller.is_enabled(config.autopump_output), time.ticks_ms()
+        )
+        arm_failsafe()
+    else:
+        failsafe_timer.deinit()
+
+
+def get_status():
+    return {
+        'enable': autopump_enable,
+        'output_enable': controller.is_enabled(config.autopump_output),
+        'failsafe_trips': failsafe_trips,
+        'reaction_us': reaction_us,
+        'reaction_us_max': reaction_us_max
+    }
@@ -0,0 +1,220 @@
+"""Closed-loop pump control against the simulated ADS1115.
+
+First steps HysteresisControl through a table of values and times for
+both threshold directions, then boots the sensor and autopump in the
+simulation and drives the ADS1115 model's input across the thresholds.
+Every pump change is checked against the thresholds and the minimum
+on/off times, and stopping the sensor has to trip the failsafe:
+
+    python -m bench.autopump_check
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ON_THRESHOLD = 12000
+OFF_THRESHOLD = 16000
+# The pump switches on when the level falls to ON_THRESHOLD.
+LOW = 10000
+MIDDLE = 14000
+HIGH = 20000
+
+
+def check_table(failures):
+    from autopump import HysteresisControl
+
+    # (value, now_ms, expected enable) for on_above=False, min_on_ms=100,
+    # min_off_ms=200, switched on at 0 ms.
+    falling = (
+        (20000, 50, True),  # on for 50 ms only
+        (16000, 100, False), (10000, 150, False),  # off for 50 ms only
+        (10000, 299, False), (14000, 300, False), (12000, 310, True),
+        (15999, 500, True), (16000, 501, False)
+    )
+    # The same with on_above=True and the thresholds swapped, switched on
+    # just before the ticks wrap around.
+    start_ms = (1 << 30) - 120
+    rising = (
+        (10000, 99, True), (12000, 100, False), (17000, 299, False),
+        (16000, 300, True), (13000, 450, True), (12000, 451, False)
+    )
+
+    for on_above, rows, offset_ms in ((False, falling, 0),
+                                      (True, rising, start_ms)):
+        if on_above:
+            control = HysteresisControl(OFF_THRESHOLD, ON_THRESHOLD, 100,
+                                        200, on_above=True)
+        else:
+            control = HysteresisControl(ON_THRESHOLD, OFF_THRESHOLD, 100,
+                                        200, on_above=False)
+        control.set(True, offset_ms)
+
+        for value, now_ms, expected in rows:
+            now_ms = time.ticks_add(offset_ms, now_ms)
+            if control.update(value, now_ms) != expected:
+                failures.append(
+                    'on_above=%s: %d at %d ms gave %s, expected %s' % (
+                        on_above, value, now_ms, not expected, expected
+                    )
+                )
+
+
+def run(min_on_ms, min_off_ms, failsafe_ms, slack_ms):
+    sys.path.insert(0, ROOT)
+    import sim
+
+    level = [HIGH]
+    sim.install(wlan=False, signal=lambda channel, seconds: level[0])
+
+    import config
+
+    config.ads1115_data_rate = 475
+    config.ads1115_decimation = 2
+    config.output_min_dwell_ms = 0
+    config.autopump_on_above = False
+    config.autopump_on_threshold = ON_THRESHOLD
+    config.autopump_off_threshold = OFF_THRESHOLD
+    config.autopump_min_on_ms = min_on_ms
+    config.autopump_min_off_ms = min_off_ms
+    config.autopump_failsafe_timeout_ms = failsafe_ms
+    config.autopump_enable = False
+
+    import autopump
+    import controller
+    import sensor
+
+    failures = []
+    check_table(failures)
+
+    sensor.initialize_ads1115()
+
+    last_value = [None]
+    changes = []
+
+    def record_sample(channel, value):
+        if channel == config.autopump_channel:
+            last_value[0] = value
+
+    def record_change(output, enable):
+        if output == config.autopump_output:
+            changes.append((time.ticks_ms(), enable, last_value[0]))
+
+    # Ahead of autopump, so last_value is the sample it decided on.
+    sensor.ads1115.sample_callbacks.append(record_sample)
+    controller.add_change_callback(record_change)
+    autopump.initialize_autopump()
+
+    def wait_change(count, timeout_ms):
+        deadline = time.ticks_add(time.ticks_ms(), timeout_ms)
+        while len(changes) < count \
+                and time.ticks_diff(deadline, time.ticks_ms()) > 0:
+            time.sleep(0.005)
+        return len(changes) >= count
+
+    def expect(count, timeout_ms, what):
+        if not wait_change(count, timeout_ms):
+            failures.append('no pump change: ' + what)
+            return False
+        if len(changes) > count:
+            failures.append('extra pump change: ' + what)
+        return True
+
+    autopump.toggle_autopump_enable()
+    enabled_ms = time.ticks_ms()
+
+    # Above the off threshold and inside the hysteresis band, nothing moves.
+    time.sleep(0.3)
+    level[0] = MIDDLE
+    time.sleep(0.3)
+    if changes:
+        failures.append('pump switched on above the on threshold')
+        changes.clear()
+
+    level[0] = LOW
+    if expect(1, slack_ms, 'on below the on threshold'):
+        # Straight back above the off threshold, held on for min_on_ms.
+        level[0] = HIGH
+        if expect(2, min_on_ms + slack_ms, 'off above the off threshold'):
+            # Straight back below, held off for min_off_ms.
+            level[0] = LOW
+            expect(3, min_off_ms + slack_ms, 'on again below the threshold')
+
+    # The sensor stops with the pump on, the failsafe switches it off.
+    trips = autopump.failsafe_trips
+    if len(changes) == 3:
+        sensor.ads1115.stop()
+        stopped_ms = time.ticks_ms()
+        if expect(4, failsafe_ms + slack_ms, 'failsafe'):
+            if changes[3][1] \
+                    or time.ticks_diff(changes[3][0], stopped_ms) \
+                    < failsafe_ms - slack_ms:
+                failures.append('failsafe did not switch off on time')
+        if autopump.failsafe_trips != trips + 1:
+            failures.append('failsafe trip not counted')
+    else:
+        sensor.ads1115.stop()
+
+    # The pump was off when autopump was enabled, so the first change has
+    # no minimum time to wait for.
+    previous_ms = None
+    for changed_ms, enable, value in changes[:3]:
+        if previous_ms is None:
+            dwell_ms = None
+        else:
+            dwell_ms = time.ticks_diff(changed_ms, previous_ms)
+
+        if enable:
+            if value is None or value > ON_THRESHOLD:
+                failures.append('switched on at %s' % value)
+            if dwell_ms is not None and dwell_ms < min_off_ms:
+                failures.append('off for %d ms only' % dwell_ms)
+        else:
+            if value is None or value < OFF_THRESHOLD:
+                failures.append('switched off at %s' % value)
+            if dwell_ms < min_on_ms:
+                failures.append('on for %d ms only' % dwell_ms)
+        previous_ms = changed_ms
+
+    status = autopump.get_status()
+
+    return {
+        'changes': [
+            {
+                'after_ms': time.ticks_diff(changed_ms, enabled_ms),
+                'enable': enable,
+                'value': value
+            }
+            for changed_ms, enable, value in changes
+        ],
+        'failsafe_trips': status['failsafe_trips'],
+        'reaction_us_max': status['reaction_us_max'],
+        'failures': failures
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--min-on-ms', type=int, default=300)
+    parser.add_argument('--min-off-ms', type=int, default=600)
+    parser.add_argument('--failsafe-ms', type=int, default=400)
+    parser.add_argument('--slack-ms', type=int, default=150)
+    args = parser.parse_args()
+
+    result = run(args.min_on_ms, args.min_off_ms, args.failsafe_ms,
+                 args.slack_ms)
+    print(json.dumps(result, indent=2))
+
+    if result['failures']:
+        print('FAILED: wrong pump control transitions')
+        os._exit(1)
+
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
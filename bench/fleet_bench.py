@@ -0,0 +1,83 @@
+"""Fleet client throughput against many simulated controllers.
+
+Starts one simulated controller per device (see bench.http_bench --serve),
+then reads the state of all of them and pushes scenes at each parallelism:
+
+    python -m bench.fleet_bench --devices 16 --parallelism 1,4,16
+"""
+
+import argparse
+import json
+import time
+
+from bench.http_bench import start_server
+from fleet import FleetClient, summarize
+
+
+def run(ports, parallelisms, rounds):
+    results = []
+    addresses = ['127.0.0.1:%d' % port for port in ports]
+
+    for parallelism in parallelisms:
+        with FleetClient(addresses, parallelism=parallelism) as client:
+            for operation in ('state', 'scene'):
+                started = time.perf_counter()
+                failed = 0
+                for round in range(rounds):
+                    if operation == 'state':
+                        round_results = client.get_state()
+                    else:
+                        round_results = client.set_scene(
+                            {'pump': bool(round & 1), 'led': not round & 1}
+                        )
+                    failed += len(summarize(round_results)['failed'])
+                elapsed = time.perf_counter() - started
+
+                result = {
+                    'operation': operation,
+                    'parallelism': parallelism,
+                    'devices': len(addresses),
+                    'devices_per_s': len(addresses) * rounds / elapsed,
+                    'failed': failed,
+                    'connects': sum(
+                        device.connects for device in client.devices
+                    )
+                }
+                results.append(result)
+                print('%-6s parallelism %-3d %8.1f devices/s failed %d' % (
+                    operation, parallelism, result['devices_per_s'], failed
+                ), flush=True)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--devices', type=int, default=16)
+    parser.add_argument('--parallelism', default='1,4,16')
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--port', type=int, default=18100)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    ports = [args.port + index for index in range(args.devices)]
+    processes = [start_server('threaded', port) for port in ports]
+    try:
+        results = run(
+            ports,
+            [int(count) for count in args.parallelism.split(',')],
+            args.rounds
+        )
+    finally:
+        for process in processes:
+            process.kill()
+            process.wait()
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'time': time.time(), 'results': results}, file,
+                      indent=2)
+
+
+if __name__ == '__main__':
+    main()
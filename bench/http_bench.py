@@ -0,0 +1,281 @@
+"""Load benchmark for MicroWebSrv running the firmware in the simulation.
+
+Each server mode runs in its own process (python -m bench.http_bench
+--serve MODE PORT). Concurrent client threads then drive each path at
+each connection count, and a slow-client scenario holds connections open
+with partial request lines while measuring a normal request. Results are
+printed and written as JSON, which --compare diffs against an earlier
+run:
+
+    python -m bench.http_bench --output before.json
+    python -m bench.http_bench --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PATHS = ('/', '/toggle_led_enable', '/static.txt', '/missing')
+MODES = ('threaded', 'prefork')
+
+
+def serve(mode, port):
+    sys.path.insert(0, ROOT)
+    import sim
+
+    path = sim.install(port=port, wlan=False)
+    os.makedirs(os.path.join(path, 'www'), exist_ok=True)
+    with open(os.path.join(path, 'www', 'static.txt'), 'wb') as file:
+        file.write(b'x' * 4096)
+
+    import config
+
+    # Measure the server, not the rate limits.
+    config.admission_control_rate = 1000000
+    config.admission_control_burst = 1000000
+    config.admission_static_rate = 1000000
+    config.admission_static_burst = 1000000
+    config.output_min_dwell_ms = 0
+
+    import udp_control
+    import web_server
+
+    if mode == 'prefork':
+        config.web_server_workers = max(2, os.cpu_count())
+    elif mode != 'threaded':
+        raise ValueError('unknown mode: %s' % mode)
+
+    web_server.start_web_server()
+
+    # See bench.udp_bench.
+    config.udp_control_port = port + 1
+    udp_control.initialize_udp_control()
+
+    print('ready', flush=True)
+    while True:
+        time.sleep(1)
+
+
+def request(port, path, timeout=10):
+    # -> (status code, latency in seconds)
+    started = time.perf_counter()
+    with socket.create_connection(('127.0.0.1', port), timeout=timeout) as sock:
+        sock.sendall(b'GET ' + path.encode() + b' HTTP/1.1\r\nHost: bench\r\n\r\n')
+        response = b''
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            response += data
+    latency = time.perf_counter() - started
+    try:
+        code = int(response.split(b' ', 2)[1])
+    except (IndexError, ValueError):
+        code = 0
+    return code, latency
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None
+    }
+
+
+def load(port, path, connections, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < deadline:
+            try:
+                code, latency = request(port, path)
+            except OSError:
+                code, latency = 0, None
+            with lock:
+                if code and code < 500:
+                    latencies.append(latency)
+                else:
+                    errors[0] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return summarize(latencies, errors[0], time.perf_counter() - started)
+
+
+def slow_clients(port, count, hold):
+    # Each slow client sends part of a request line and then stalls,
+    # which the server only gives up on after its 2 s socket timeout.
+    sockets = []
+    for _ in range(count):
+        sock = socket.create_connection(('127.0.0.1', port))
+        sock.sendall(b'GET / HT')
+        sockets.append(sock)
+
+    time.sleep(0.1)
+    try:
+        code, latency = request(port, '/toggle_led_enable', timeout=hold)
+    except OSError:
+        code, latency = 0, None
+
+    for sock in sockets:
+        sock.close()
+
+    return {
+        'slow_clients': count,
+        'code': code,
+        'latency_ms': latency * 1000 if latency is not None else None
+    }
+
+
+def start_server(mode, port):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'bench.http_bench', '--serve', mode, str(port)],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    for line in process.stdout:
+        if line.strip() == 'ready':
+            break
+    # Keep draining the server output so it never blocks on a full pipe.
+    threading.Thread(
+        target=lambda: process.stdout.read(), daemon=True
+    ).start()
+    time.sleep(0.2)
+    return process
+
+
+def run(modes, paths, connection_counts, duration, port, slow_counts):
+    results = []
+
+    for mode in modes:
+        process = start_server(mode, port)
+        try:
+            for path in paths:
+                for connections in connection_counts:
+                    result = load(port, path, connections, duration)
+                    result.update(
+                        mode=mode, path=path, connections=connections
+                    )
+                    results.append(result)
+                    print(format_result(result), flush=True)
+
+            for count in slow_counts:
+                result = slow_clients(port, count, hold=count * 3 + 5)
+                result.update(mode=mode, path='slowloris')
+                results.append(result)
+                print(format_result(result), flush=True)
+        finally:
+            process.kill()
+            process.wait()
+
+    return results
+
+
+def result_key(result):
+    return (result['mode'], result['path'],
+            result.get('connections', result.get('slow_clients')))
+
+
+def format_result(result):
+    if result['path'] == 'slowloris':
+        return '%-10s slowloris x%-3d code %s latency %s ms' % (
+            result['mode'], result['slow_clients'], result['code'],
+            '%.1f' % result['latency_ms']
+            if result['latency_ms'] is not None else '-'
+        )
+
+    return '%-10s %-20s c=%-3d %8.1f req/s p50 %s p95 %s p99 %s errors %d' % (
+        result['mode'], result['path'], result['connections'], result['rps'],
+        *('%.2f' % result[key] if result[key] is not None else '-'
+          for key in ('p50_ms', 'p95_ms', 'p99_ms')),
+        result['errors']
+    )
+
+
+def compare(results, baseline):
+    previous = {result_key(result): result for result in baseline['results']}
+
+    for result in results:
+        before = previous.get(result_key(result))
+        if before is None or result['path'] == 'slowloris':
+            continue
+        if before['rps'] and before['p99_ms'] and result['p99_ms']:
+            print('%-10s %-20s c=%-3d req/s %+6.1f%% p99 %+6.1f%%' % (
+                result['mode'], result['path'], result['connections'],
+                (result['rps'] / before['rps'] - 1) * 100,
+                (result['p99_ms'] / before['p99_ms'] - 1) * 100
+            ))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--serve', nargs=2, metavar=('MODE', 'PORT'))
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--paths', default=','.join(PATHS))
+    parser.add_argument('--connections', default='1,4,16')
+    parser.add_argument('--duration', type=float, default=3)
+    parser.add_argument('--slow-clients', default='1,3')
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--output')
+    parser.add_argument('--compare')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve[0], int(args.serve[1]))
+        return
+
+    results = run(
+        args.modes.split(','),
+        args.paths.split(','),
+        [int(count) for count in args.connections.split(',')],
+        args.duration,
+        args.port,
+        [int(count) for count in args.slow_clients.split(',') if count]
+    )
+    report = {'revision': git_revision(), 'time': time.time(), 'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
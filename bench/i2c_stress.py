@@ -0,0 +1,131 @@
+"""Concurrent access to the shared I2C bus in the simulation.
+
+The ADS1115 samples at its data rate from the ALERT/RDY IRQ (high
+priority) while threads read the DS3231 time (low priority) and write its
+registers (normal priority). Every simulated transaction takes a while and
+some fail with a NACK, the bus manager has to keep transactions from
+overlapping, retry the NACKs and serve the sensor first:
+
+    python -m bench.i2c_stress --seconds 5 --threads 4
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(histogram, fraction):
+    # -> upper bound of the bucket holding the fraction of observations
+    target = histogram.count * fraction
+    cumulative = 0
+    for index, count in enumerate(histogram.counts):
+        cumulative += count
+        if cumulative >= target and count:
+            return histogram.bounds[index] \
+                if index < len(histogram.bounds) else None
+    return 0
+
+
+def run(seconds, threads, transaction_us, nack_every):
+    sys.path.insert(0, ROOT)
+    import sim
+
+    sim.install(wlan=False)
+
+    import config
+    import hwrtc
+    import machine
+    import sensor
+
+    config.ads1115_data_rate = 475
+    machine.I2C.transaction_s = transaction_us / 1000000
+
+    hwrtc.initialize_ds3231()
+    sensor.initialize_ads1115()
+
+    ds3231 = hwrtc.ds3231
+    writer = config.get_i2c()
+    stop = threading.Event()
+    errors = []
+    operations = [0]
+
+    def read_time():
+        while not stop.is_set():
+            try:
+                ds3231.datetime()
+                operations[0] += 1
+            except OSError as exception:
+                errors.append(exception)
+
+    def write_register():
+        count = 0
+        while not stop.is_set():
+            count += 1
+            if nack_every and count % nack_every == 0:
+                machine.I2C.nacks[0x68] = 1
+            try:
+                writer.writeto_mem(0x68, 0x07, b'\x00')
+                operations[0] += 1
+            except OSError as exception:
+                errors.append(exception)
+
+    workers = [threading.Thread(target=read_time) for _ in range(threads)]
+    workers.append(threading.Thread(target=write_register))
+    samples_before = sensor.ads1115.sample_counts[0]
+    for worker in workers:
+        worker.start()
+
+    time.sleep(seconds)
+    stop.set()
+    for worker in workers:
+        worker.join()
+
+    sensor.ads1115.stop()
+    time.sleep(0.1)
+
+    result = {
+        'overlaps': machine.I2C.overlaps,
+        'errors': len(errors),
+        'operations': operations[0],
+        'samples': sensor.ads1115.sample_counts[0] - samples_before,
+        'devices': {}
+    }
+    for address, stats in config.i2c.stats.items():
+        result['devices']['0x%02x' % address] = {
+            'transactions': stats.latency_us.count,
+            'retries': stats.retries,
+            'errors': stats.errors,
+            'wait_p50_us': percentile(stats.wait_us, 0.5),
+            'wait_p99_us': percentile(stats.wait_us, 0.99),
+            'latency_p99_us': percentile(stats.latency_us, 0.99)
+        }
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--transaction-us', type=int, default=200)
+    parser.add_argument('--nack-every', type=int, default=50)
+    args = parser.parse_args()
+
+    result = run(args.seconds, args.threads, args.transaction_us,
+                 args.nack_every)
+    print(json.dumps(result, indent=2))
+
+    if result['overlaps'] or result['errors']:
+        print('FAILED: overlapping or failed transactions')
+        os._exit(1)
+
+    os._exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Round-trip time of the UDP control protocol against the HTTP toggle route.
+
+Starts a simulated controller (see bench.http_bench --serve) and toggles
+the same output over each transport in turn:
+
+    python -m bench.udp_bench --count 2000
+"""
+
+import argparse
+import json
+import socket
+import sys
+import time
+
+from bench.http_bench import ROOT, percentile, request, start_server
+
+sys.path.insert(0, ROOT)
+import udp_protocol
+
+
+def http_rtt(port, count):
+    latencies = []
+    for _ in range(count):
+        code, latency = request(port, '/toggle_led_enable')
+        if code == 200:
+            latencies.append(latency)
+
+    return latencies
+
+
+def udp_rtt(port, count, key=None, output=1, client=0):
+    latencies = []
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.settimeout(1)
+
+    for sequence in range(1, count + 1):
+        packet = udp_protocol.pack_request(
+            udp_protocol.COMMAND_TOGGLE, output, 0, client, sequence, key
+        )
+        started = time.perf_counter()
+        udp.sendto(packet, ('127.0.0.1', port))
+        while True:
+            try:
+                reply = udp_protocol.unpack_reply(udp.recv(64), key)
+            except socket.timeout:
+                reply = None
+                break
+            if reply is not None and reply[2] == sequence & 0xffff:
+                break
+
+        if reply is not None and reply[1] == udp_protocol.STATUS_OK:
+            latencies.append(time.perf_counter() - started)
+
+    udp.close()
+    return latencies
+
+
+def summarize(transport, latencies, count):
+    latencies.sort()
+    return {
+        'transport': transport,
+        'requests': count,
+        'ok': len(latencies),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+
+def server_handle_us(port):
+    # -> mean device side handling time of the UDP requests
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        sock.sendall(b'GET /metrics HTTP/1.0\r\n\r\n')
+        body = b''
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            body += data
+
+    values = {}
+    for line in body.decode().splitlines():
+        if line.startswith('udp_control_handle_us_sum') \
+                or line.startswith('udp_control_handle_us_count'):
+            name, value = line.rsplit(' ', 1)
+            values[name.split('{')[0]] = int(value)
+
+    if not values.get('udp_control_handle_us_count'):
+        return None
+
+    return values['udp_control_handle_us_sum'] \
+        / values['udp_control_handle_us_count']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--count', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    process = start_server('threaded', args.port)
+    try:
+        results = [
+            summarize('http', http_rtt(args.port, args.count), args.count),
+            summarize('udp', udp_rtt(args.port + 1, args.count), args.count)
+        ]
+        handle_us = server_handle_us(args.port)
+    finally:
+        process.kill()
+        process.wait()
+
+    for result in results:
+        print('%-4s %d/%d ok p50 %.3f ms p99 %.3f ms' % (
+            result['transport'], result['ok'], result['requests'],
+            result['p50_ms'], result['p99_ms']
+        ))
+    if handle_us is not None:
+        print('udp handling on the server %.1f us mean' % handle_us)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({
+                'time': time.time(),
+                'results': results,
+                'udp_handle_us_mean': handle_us
+            }, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
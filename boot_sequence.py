@@ -0,0 +1,121 @@
+import _thread
+import time
+
+STEP_PENDING = 0
+STEP_RUNNING = 1
+STEP_DONE = 2
+STEP_FAILED = 3
+STEP_SKIPPED = 4
+
+step_state_name = {}
+step_state_name[STEP_PENDING] = 'Pending'
+step_state_name[STEP_RUNNING] = 'Running'
+step_state_name[STEP_DONE] = 'Done'
+step_state_name[STEP_FAILED] = 'Failed'
+step_state_name[STEP_SKIPPED] = 'Skipped'
+
+# time.ticks_us() when the local buttons became responsive. On device
+# ticks_us() counts from reset, so this is the time to first button response.
+button_ready_us = None
+
+
+class BootStep:
+    def __init__(self, name, function, requires, background):
+        self.name = name
+        self.function = function
+        self.requires = requires
+        self.background = background
+        self.state = STEP_PENDING
+        self.started_us = 0
+        self.elapsed_us = 0
+
+
+class BootSequence:
+    def __init__(self):
+        self.steps = []
+        self.steps_by_name = {}
+        self.lock = _thread.allocate_lock()
+        self.started_us = time.ticks_us()
+
+    def add_step(self, name, function, requires=(), background=False):
+        # Steps become ready in declaration order once all of their
+        # requirements are done, background steps run on their own thread.
+        step = BootStep(name, function, requires, background)
+        self.steps.append(step)
+        self.steps_by_name[name] = step
+        return step
+
+    def run(self):
+        self.started_us = time.ticks_us()
+        self.schedule()
+
+    def next_ready_step(self):
+        for step in self.steps:
+            if step.state != STEP_PENDING:
+                continue
+
+            required_states = [
+                self.steps_by_name[name].state for name in step.requires
+            ]
+            if STEP_FAILED in required_states \
+                    or STEP_SKIPPED in required_states:
+                step.state = STEP_SKIPPED
+                print('Boot step skipped:', step.name)
+                continue
+
+            if all(state == STEP_DONE for state in required_states):
+                step.state = STEP_RUNNING
+                return step
+
+        return None
+
+    def schedule(self):
+        while True:
+            with self.lock:
+                step = self.next_ready_step()
+
+            if step is None:
+                return
+
+            if step.background:
+                _thread.start_new_thread(self.run_step, (step,))
+            else:
+                self.run_step(step)
+
+    def run_step(self, step):
+        step.started_us = time.ticks_diff(time.ticks_us(), self.started_us)
+        started_us = time.ticks_us()
+
+        try:
+            step.function()
+            state = STEP_DONE
+        except Exception as exception:
+            print('Boot step failed:', step.name, exception)
+            state = STEP_FAILED
+
+        step.elapsed_us = time.ticks_diff(time.ticks_us(), started_us)
+        with self.lock:
+            step.state = state
+
+        print('Boot step', step.name, 'took', step.elapsed_us, 'us')
+        self.schedule()
+
+    def is_finished(self):
+        return all(step.state >= STEP_DONE for step in self.steps)
+
+    def report(self):
+        print('Boot sequence:')
+        for step in self.steps:
+            print(
+                ' ', step.name, step_state_name[step.state],
+                'started at', step.started_us, 'us',
+                'took', step.elapsed_us, 'us'
+            )
+
+        print('Time to first button response:', button_ready_us, 'us')
+
+
+def mark_button_ready():
+    global button_ready_us
+
+    button_ready_us = time.ticks_us()
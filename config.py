@@ -1,18 +1,160 @@
-from machine import I2C, Pin
+from machine import Pin
 from tinypico import I2C_SCL, I2C_SDA
 
-i2c = I2C(scl=Pin(I2C_SCL), sda=Pin(I2C_SDA))
+i2c = None
+i2c_frequency = 400000
+i2c_retries = 2
+
+
+def get_i2c(priority=None):
+    # The bus is only constructed when the first I2C device is initialized.
+    # Every device gets its own proxy queueing transactions on the bus, see
+    # i2c_bus for the priorities.
+    global i2c
+
+    from i2c_bus import I2CBus, PRIORITY_NORMAL
+
+    if i2c is None:
+        i2c = I2CBus(
+            Pin(I2C_SCL), Pin(I2C_SDA),
+            freq=i2c_frequency,
+            retries=i2c_retries
+        )
+
+    return i2c.device(PRIORITY_NORMAL if priority is None else priority)
+
 
 ds3231_interrupt = Pin(15, Pin.IN, Pin.PULL_UP)
 ads1115_interrupt = Pin(27, Pin.IN, Pin.PULL_UP)
 
-pump_enable = Pin(14, Pin.OUT, Pin.PULL_DOWN, value=0)
-led_channel_0_enable = Pin(33, Pin.OUT, Pin.PULL_DOWN, value=0)
-led_channel_1_enable = Pin(32, Pin.OUT, Pin.PULL_DOWN, value=0)
+# (name, label, output pins, button pin or None), every output gets a
+# /toggle_<name>_enable route and one bit in the controller state word.
+outputs = (
+    ('pump', 'Pump', (14,), 26),
+    ('led', 'LEDs', (33, 32), 25)
+)
+
+ds3231_address = 0x68
+
+ads1115_address = 0x48
+ads1115_channels = (0,)
+ads1115_full_scale_mv = 4096
+ads1115_data_rate = 128
+ads1115_decimation = 4
+ads1115_window = 32
+
+# Outputs driven by PWM with gamma corrected fades instead of on/off.
+pwm_outputs = ('led',)
+pwm_frequency = 1000
+pwm_tick_ms = 10
+pwm_timer_id = 2
+pwm_on_brightness = 255
+pwm_fade_ms = 500
+
+autopump_enable = False
+autopump_output = 'pump'
+autopump_channel = 0
+autopump_on_above = False
+autopump_on_threshold = 12000
+autopump_off_threshold = 16000
+autopump_min_on_ms = 5000
+autopump_min_off_ms = 30000
+autopump_failsafe_timeout_ms = 5000
+autopump_timer_id = 0
 
-pump_interrupt = Pin(26, Pin.IN, Pin.PULL_UP)
-led_interrupt = Pin(25, Pin.IN, Pin.PULL_UP)
+# The battery backed RAM of a DS1307 instead of flash. A DS1307 answers at
+# the DS3231's address, so the two can't share a bus.
+state_store_nvram = False
+state_store_nvram_address = 0x68
+state_store_path = '/state'
+state_store_coalesce_ms = 1000
+state_store_min_interval_ms = 60000
+state_store_timer_id = 1
+
+history_log_path = '/log'
+history_segment_count = 8
+history_segment_pages = 32
+history_page_size = 512
+history_sample_interval_s = 10
+history_rollups = (
+    ('minute', 60, 60),
+    ('hour', 3600, 168),
+    ('day', 86400, 31)
+)
 
 wlan_reconnects = 3
 wlan_ssid = ''
 wlan_password = ''
+wlan_connect_timeout_ms = 15000
+wlan_backoff_initial_ms = 1000
+wlan_backoff_max_ms = 60000
+wlan_poll_interval_ms = 250
+wlan_rssi_threshold = -80
+wlan_rssi_weak_polls = 40
+
+profile_imports = False
+
+slow_request_log_size = 8
+
+web_server_port = 80
+web_server_path = '/flash/www'
+web_server_idle_interval_sec = 1
+web_server_max_connections = 4
+# Dynamic responses of at least this many bytes are sent with gzip or
+# deflate Content-Encoding if the client accepts it, None disables it.
+web_server_compress_min_size = 512
+web_server_compress_window_bits = 10
+web_server_compress_cache_size = 4
+# .pyhtml template sources kept in RAM, 0 reads them on every request.
+web_server_pyhtml_cache_size = 4
+# CPython gateways only, more than 1 forks that many SO_REUSEPORT workers.
+web_server_workers = 1
+# The supervisor applies the workers' output changes to drivers, history,
+# the state store and MQTT this often. Admission limits are per worker, a
+# client gets workers times the rate and burst below.
+web_server_supervisor_interval_ms = 100
+# Prefork workers that stop serving this long are killed and restarted.
+web_server_worker_timeout_sec = 30
+
+admission_table_size = 16
+admission_control_prefixes = ('/toggle_',)
+admission_control_rate = 2
+admission_control_burst = 4
+admission_static_rate = 10
+admission_static_burst = 20
+
+output_min_dwell_ms = 250
+
+gc_policy_enabled = True
+gc_threshold_bytes = 32768
+gc_idle_collect_bytes = 8192
+# /heap measures the largest free block by allocating trial buffers, which
+# can starve other requests and interrupt handlers, so it is opt-in.
+gc_heap_probe_enabled = False
+
+# UDP control protocol (see udp_protocol), None disables it. With a key
+# (bytes) every packet has to carry its HMAC. Clients use ids below
+# udp_control_clients, each its own.
+udp_control_port = 4210
+udp_control_key = None
+udp_control_clients = 8
+udp_control_subscribers = 4
+udp_control_subscriber_timeout_ms = 60000
+udp_control_poll_ms = 100
+
+# MQTT bridge, needs umqtt.simple, None disables it. Topics are
+# <prefix>/<output>/state (on/off, retained), <prefix>/<output>/set
+# (on/off/toggle), <prefix>/sensor/<channel> (mV, retained) and
+# <prefix>/status (online/offline, retained).
+mqtt_broker = None
+mqtt_port = 1883
+mqtt_user = None
+mqtt_password = None
+mqtt_client_id = None
+mqtt_topic_prefix = 'nft-controller'
+mqtt_keepalive_s = 60
+mqtt_queue_size = 32
+mqtt_batch_size = 8
+mqtt_poll_ms = 100
+mqtt_retry_ms = 5000
+mqtt_sensor_interval_ms = 10000
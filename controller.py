@@ -1,24 +1,394 @@
+from array import array
+from gpio_bank import create_gpio_bank, get_pin_masks
 from machine import Pin
+import _thread
 import config
+import machine
+import metrics
 import time
 
-pump_enable = False
-led_enable = False
+# Outputs are declared by config.outputs, output i is bit i of state.
+output_names = [output[0] for output in config.outputs]
+output_index = {}
+output_masks = []
+output_drivers = [None] * len(config.outputs)
 
+for index, (name, label, pins, interrupt) in enumerate(config.outputs):
+    output_index[name] = index
+    output_masks.append(get_pin_masks(pins))
 
-def toggle_pump_enable():
-    global pump_enable
+gpio_bank = create_gpio_bank(
+    [pin for name, label, pins, interrupt in config.outputs for pin in pins]
+)
 
-    pump_enable = not pump_enable
-    config.pump_enable.value(pump_enable)
+# Output bitmask and its version. The version is odd while a write is in
+# progress and grows by 2 for every change, so readers can detect changes by
+# comparing versions and take snapshots without locking, see get_snapshot().
+STATE = 0
+VERSION = 1
+state_word = array('L', [0, 0])
+# Only set once the state word is shared between processes.
+state_lock = None
+# Outputs changed by forked workers that the sharing process hasn't applied
+# to drivers and callbacks yet, see apply_forwarded_changes().
+forwarded = None
+forwarding = False
 
+# Reads of a state word mid-write retry this often before disabling IRQs.
+SNAPSHOT_RETRIES = 64
 
-def toggle_led_enable():
-    global led_enable
+# Serializes writes. A write requested by a scheduled callback (soft IRQ)
+# that interrupted a write of the same thread can't wait for it, it is
+# merged into deferred_write (mask, new_state, toggle) instead and applied
+# by the interrupted write before that returns.
+write_lock = _thread.allocate_lock()
+write_thread = None
+deferred_write = array('L', [0, 0, 0])
+# ticks_ms() of each output's last change. Ticks stay below 2 ** 30, so
+# NEVER isn't one.
+NEVER = 0xffffffff
+changed_ms = array('L', [NEVER] * len(output_names))
 
-    led_enable = not led_enable
-    config.led_channel_0_enable.value(led_enable)
-    config.led_channel_1_enable.value(led_enable)
+change_callbacks = []
+
+
+def add_change_callback(callback):
+    # Callbacks are called with the output name and its new state, possibly
+    # from an IRQ handler, so they must be short.
+    change_callbacks.append(callback)
+
+
+def notify_change(output, enable):
+    for callback in change_callbacks:
+        callback(output, enable)
+
+
+def set_output_driver(name, driver):
+    # The output is no longer written through the GPIO bank, driver is
+    # called with its new state instead, e.g. to fade a PWM channel.
+    index = output_index[name]
+    output_masks[index] = (0, 0)
+    output_drivers[index] = driver
+
+
+def dwell_elapsed(index):
+    # Outputs may not change again within config.output_min_dwell_ms, so a
+    # flood of requests or a bouncing button can't rapid-cycle the relay.
+    return changed_ms[index] == NEVER \
+        or time.ticks_diff(time.ticks_ms(), changed_ms[index]) \
+        >= config.output_min_dwell_ms
+
+
+def share_state():
+    # CPython only: moves the state word and the dwell times into anonymous
+    # shared memory and guards writes with a process shared lock, so
+    # processes forked afterwards (see MicroWebSrv.StartPrefork) see each
+    # other's changes and hold to one dwell time.
+    global state_word
+    global state_lock
+    global forwarded
+    global changed_ms
+
+    import mmap
+    import multiprocessing
+
+    memory = mmap.mmap(-1, mmap.PAGESIZE)
+    shared = memoryview(memory).cast('L')
+    shared[STATE] = state_word[STATE]
+    shared[VERSION] = state_word[VERSION]
+    shared[2] = 0
+    for index in range(len(output_names)):
+        shared[3 + index] = changed_ms[index]
+
+    state_lock = multiprocessing.Lock()
+    state_word = shared[:2]
+    forwarded = shared[2:3]
+    changed_ms = shared[3:3 + len(output_names)]
+
+
+def forward_changes():
+    # In a forked worker: drivers and change callbacks (persistence, MQTT)
+    # only run in the process that shared the state word, the worker leaves
+    # its changes in forwarded for apply_forwarded_changes() there.
+    global forwarding
+
+    forwarding = True
+    del change_callbacks[:]
+    for index in range(len(output_names)):
+        output_drivers[index] = None
+
+
+def apply_forwarded_changes():
+    # Called periodically in the process that shared the state word, which
+    # owns the pins on a gateway.
+    if forwarded is None or not forwarded[0]:
+        return
+
+    irq_state = machine.disable_irq()
+    state_lock.acquire()
+    try:
+        changed = forwarded[0]
+        forwarded[0] = 0
+        current_state = state_word[STATE]
+        write_pins(changed, current_state)
+    finally:
+        state_lock.release()
+        machine.enable_irq(irq_state)
+
+    apply_changes(changed, current_state)
+
+
+def apply_changes(changed, current_state):
+    # Calls the drivers and change callbacks of the changed outputs.
+    for index in range(len(output_names)):
+        bit = 1 << index
+        if changed & bit:
+            if output_drivers[index] is not None:
+                output_drivers[index](bool(current_state & bit))
+            notify_change(output_names[index], bool(current_state & bit))
+
+
+def reset_locks():
+    # In a forked process, where the thread writing at the fork doesn't
+    # exist. state_lock is shared with the parent and stays.
+    global write_lock
+    global write_thread
+
+    write_lock = _thread.allocate_lock()
+    write_thread = None
+
+
+def get_snapshot():
+    # -> (state, version), consistent without disabling IRQs: retries while
+    # a write is in progress or if one completed during the read.
+    for _ in range(SNAPSHOT_RETRIES):
+        version = state_word[VERSION]
+        if version & 1:
+            continue
+
+        current_state = state_word[STATE]
+        if state_word[VERSION] == version:
+            return current_state, version
+
+    # The write can't finish while this caller spins, e.g. it interrupted
+    # the write. Read as writers do, an odd version is still unfinished and
+    # reported as the version it started from.
+    irq_state = machine.disable_irq()
+    if state_lock is not None:
+        state_lock.acquire()
+    try:
+        return state_word[STATE], state_word[VERSION] & 0xfffffffe
+    finally:
+        if state_lock is not None:
+            state_lock.release()
+        machine.enable_irq(irq_state)
+
+
+def get_state():
+    return get_snapshot()[0]
+
+
+def get_version():
+    return state_word[VERSION]
+
+
+def is_enabled(name, current_state=None):
+    # current_state lets callers test a snapshot they already hold.
+    if current_state is None:
+        current_state = get_state()
+
+    return bool(current_state & (1 << output_index[name]))
+
+
+def defer_write(mask, new_state, toggle):
+    # Merges the write into deferred_write as if it ran after the writes
+    # already in there.
+    irq_state = machine.disable_irq()
+    try:
+        pending_mask, pending_state, pending_toggle = deferred_write
+        deferred_write[0] = pending_mask | mask
+        deferred_write[1] = (pending_state & pending_mask & ~mask) \
+            | ((new_state ^ pending_toggle) & mask)
+        deferred_write[2] = pending_toggle ^ toggle
+    finally:
+        machine.enable_irq(irq_state)
+
+
+def take_deferred_write():
+    irq_state = machine.disable_irq()
+    try:
+        write = tuple(deferred_write)
+        deferred_write[0] = 0
+        deferred_write[1] = 0
+        deferred_write[2] = 0
+    finally:
+        machine.enable_irq(irq_state)
+
+    return write
+
+
+def write_outputs(mask, new_state, toggle=0, dwell=False):
+    # Outputs in mask take their bit from new_state, outputs in toggle flip.
+    # With dwell, outputs within their dwell time are left out of the write.
+    # -> (state, version) after the write, or None when an output was left
+    # out or the write was handed to the write in progress on this thread
+    # (see deferred_write).
+    global write_thread
+
+    thread = _thread.get_ident()
+    if not write_lock.acquire(0):
+        if write_thread != thread:
+            write_lock.acquire()
+        else:
+            if dwell:
+                held = get_held_outputs(mask, new_state, toggle)
+                mask &= ~held
+                toggle &= ~held
+            defer_write(mask, new_state, toggle)
+            # Unless the interrupted write finished in the meantime.
+            if not write_lock.acquire(0):
+                return None
+            mask, new_state, toggle = take_deferred_write()
+            dwell = False
+
+    changed = 0
+    held = 0
+    while True:
+        write_thread = thread
+        try:
+            while True:
+                old_state, current_state, version, write_held = \
+                    update_state_word(mask, new_state, toggle, dwell)
+                held |= write_held
+                dwell = False
+                changed ^= old_state ^ current_state
+
+                mask, new_state, toggle = take_deferred_write()
+                if not mask | toggle:
+                    break
+        finally:
+            # No scheduled callback can run between these two statements,
+            # one after the release doesn't take itself for nested.
+            write_thread = None
+            write_lock.release()
+
+        # A write deferred after the last check, unless another writer has
+        # taken the lock and applies it.
+        if not deferred_write[0] | deferred_write[2] \
+                or not write_lock.acquire(0):
+            break
+        mask, new_state, toggle = take_deferred_write()
+
+    # Drivers and callbacks run after the write, writes they make are not
+    # nested in it.
+    if changed:
+        apply_changes(changed, current_state)
+
+    if held:
+        return None
+
+    return current_state, version
+
+
+def get_held_outputs(mask, new_state, toggle):
+    # -> the outputs the write would change within their dwell time
+    current_state = state_word[STATE]
+    changing = (((current_state & ~mask) | (new_state & mask)) ^ toggle) \
+        ^ current_state
+
+    held = 0
+    for index in range(len(output_names)):
+        bit = 1 << index
+        if changing & bit and not dwell_elapsed(index):
+            held |= bit
+
+    return held
+
+
+def write_pins(changed, current_state):
+    # Sets or clears the pins of the changed outputs, one register write per
+    # bank.
+    set_mask0 = 0
+    set_mask1 = 0
+    clear_mask0 = 0
+    clear_mask1 = 0
+
+    for index in range(len(output_names)):
+        bit = 1 << index
+        if not changed & bit:
+            continue
+
+        mask0, mask1 = output_masks[index]
+        if current_state & bit:
+            set_mask0 |= mask0
+            set_mask1 |= mask1
+        else:
+            clear_mask0 |= mask0
+            clear_mask1 |= mask1
+
+    gpio_bank.write(set_mask0, set_mask1, clear_mask0, clear_mask1)
+
+
+def update_state_word(mask, new_state, toggle, dwell=False):
+    # The read-modify-write of the state word and the register write happen
+    # with IRQs disabled, so a button IRQ and the web server thread can't
+    # lose each other's changes. With dwell, outputs within their dwell time
+    # are left out, checked under state_lock so that holds across processes.
+    # -> (old state, state, version, held outputs)
+    held = 0
+    irq_state = machine.disable_irq()
+    if state_lock is not None:
+        state_lock.acquire()
+    try:
+        if dwell:
+            held = get_held_outputs(mask, new_state, toggle)
+            mask &= ~held
+            toggle &= ~held
+
+        old_state = state_word[STATE]
+        current_state = ((old_state & ~mask) | (new_state & mask)) ^ toggle
+        changed = old_state ^ current_state
+
+        if changed:
+            now = time.ticks_ms()
+            for index in range(len(output_names)):
+                # Set with the write, the next writer checks the dwell time
+                # against it.
+                if changed & (1 << index):
+                    changed_ms[index] = now
+
+            state_word[VERSION] = (state_word[VERSION] + 1) & 0xffffffff
+            write_pins(changed, current_state)
+            state_word[STATE] = current_state
+            state_word[VERSION] = (state_word[VERSION] + 1) & 0xffffffff
+            if forwarding:
+                forwarded[0] |= changed
+
+        version = state_word[VERSION]
+    finally:
+        if state_lock is not None:
+            state_lock.release()
+        machine.enable_irq(irq_state)
+
+    return old_state, current_state, version, held
+
+
+def set_state(new_state):
+    # Applies a whole bitmask at once, e.g. a restored state or a scene.
+    # Outputs still within their dwell time keep their current state.
+    return write_outputs((1 << len(output_names)) - 1, new_state, dwell=True)
+
+
+def toggle_enable(name):
+    # -> (state, version) after the toggle, or None within the dwell time
+    return write_outputs(0, 0, 1 << output_index[name], dwell=True)
+
+
+def set_enable(name, enable):
+    # -> (state, version) after the change, or None within the dwell time
+    bit = 1 << output_index[name]
+
+    return write_outputs(bit, bit if enable else 0, dwell=True)
 
 
 def debounce_pin(pin, milliseconds):
@@ -35,23 +405,23 @@ def debounce_pin(pin, milliseconds):
         time.sleep_ms(1)
 
 
-def pump_interrupt_handler(pin):
-    # debounce_pin(pin, 17)
-    toggle_pump_enable()
+def create_interrupt_handler(index):
+    name = output_names[index]
 
+    def interrupt_handler(pin):
+        metrics.record_irq(index)
+        # debounce_pin(pin, 17)
+        toggle_enable(name)
 
-def led_interrupt_handler(pin):
-    # debounce_pin(pin, 17)
-    toggle_led_enable()
+    return interrupt_handler
 
 
-def register_pump_led_interrupt_handlers():
-    config.pump_interrupt.irq(
-        handler=pump_interrupt_handler,
-        trigger=Pin.IRQ_FALLING
-    )
+def register_interrupt_handlers():
+    for index, (name, label, pins, interrupt) in enumerate(config.outputs):
+        if interrupt is None:
+            continue
 
-    config.led_interrupt.irq(
-        handler=led_interrupt_handler,
-        trigger=Pin.IRQ_FALLING
-    )
+        Pin(interrupt, Pin.IN, Pin.PULL_UP).irq(
+            handler=create_interrupt_handler(index),
+            trigger=Pin.IRQ_FALLING
+        )
@@ -0,0 +1,186 @@
+"""Concurrent client for a fleet of controllers, built on their HTTP API.
+
+Requests to different devices run in parallel on at most `parallelism`
+threads, requests to the same device run in order over one HTTP connection,
+which is kept open if the server allows it and reopened otherwise. Every
+device request gets `timeout` seconds and up to `retries` further attempts.
+
+    client = FleetClient(['10.0.0.21', '10.0.0.22:8080'], parallelism=8)
+    results = client.set_scene({'pump': True, 'led': False})
+    print(summarize(results))
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import http.client
+import json
+import threading
+import time
+
+
+class FleetError(Exception):
+    pass
+
+
+class Result:
+    __slots__ = ('device', 'value', 'error', 'attempts', 'elapsed')
+
+    def __init__(self, device, value=None, error=None, attempts=0, elapsed=0):
+        self.device = device
+        self.value = value
+        self.error = error
+        self.attempts = attempts
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_dict(self):
+        return {
+            'device': self.device,
+            'ok': self.ok,
+            'value': self.value,
+            'error': self.error,
+            'attempts': self.attempts,
+            'elapsed_ms': self.elapsed * 1000
+        }
+
+
+class Device:
+    """One controller, its connection is only used by one thread at a time."""
+
+    def __init__(self, address, timeout):
+        host, _, port = address.partition(':')
+        self.address = address
+        self.host = host
+        self.port = int(port) if port else 80
+        self.timeout = timeout
+        self.connection = None
+        self.lock = threading.Lock()
+        self.connects = 0
+
+    def get_json(self, path):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.timeout
+            )
+            self.connects += 1
+
+        try:
+            self.connection.request('GET', path)
+            response = self.connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException):
+            self.close()
+            raise
+
+        if response.will_close:
+            # MicroWebSrv answers every request with Connection: close.
+            self.close()
+
+        if response.status != 200:
+            raise FleetError('%s returned %d' % (path, response.status))
+
+        return json.loads(body)
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class FleetClient:
+    def __init__(self, addresses, parallelism=8, timeout=2.0, retries=2,
+                 retry_delay=0.1):
+        self.devices = [Device(address, timeout) for address in addresses]
+        self.parallelism = parallelism
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.executor = ThreadPoolExecutor(max_workers=parallelism)
+
+    def close(self):
+        self.executor.shutdown()
+        for device in self.devices:
+            device.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def call(self, device, function):
+        started = time.perf_counter()
+        error = None
+
+        with device.lock:
+            for attempt in range(1, self.retries + 2):
+                try:
+                    value = function(device)
+                except (OSError, ValueError, http.client.HTTPException,
+                        FleetError) as exception:
+                    error = '%s: %s' % (type(exception).__name__, exception)
+                    if attempt <= self.retries:
+                        time.sleep(self.retry_delay * attempt)
+                    continue
+
+                return Result(device.address, value, None, attempt,
+                              time.perf_counter() - started)
+
+        return Result(device.address, None, error, attempt,
+                      time.perf_counter() - started)
+
+    def map(self, function):
+        # Calls function(device) for every device. -> [Result] in the order
+        # of the addresses
+        return list(self.executor.map(
+            lambda device: self.call(device, function), self.devices
+        ))
+
+    def get(self, path):
+        return self.map(lambda device: device.get_json(path))
+
+    def get_state(self):
+        # -> Results with {'version': n, 'outputs': {name: enable}}
+        return self.get('/state')
+
+    def set_scene(self, outputs):
+        # outputs is {name: enable}. Outputs that already match are left
+        # alone, so a scene can be pushed again after a partial failure.
+        def set_outputs(device):
+            state = device.get_json('/state')
+            for name, enable in outputs.items():
+                if name not in state['outputs']:
+                    raise FleetError('no output %s' % name)
+                if state['outputs'][name] == enable:
+                    continue
+
+                response = device.get_json('/toggle_%s_enable' % name)
+                if response['enable'] != enable:
+                    # Within the output's dwell time, or a button changed it
+                    # back, the retry reads the state again.
+                    raise FleetError('%s did not change' % name)
+
+            return device.get_json('/state')
+
+        return self.map(set_outputs)
+
+
+def summarize(results):
+    elapsed = sorted(result.elapsed for result in results)
+    failed = [result for result in results if not result.ok]
+
+    def percentile(fraction):
+        if not elapsed:
+            return None
+        return elapsed[min(int(len(elapsed) * fraction), len(elapsed) - 1)] \
+            * 1000
+
+    return {
+        'devices': len(results),
+        'ok': len(results) - len(failed),
+        'failed': {result.device: result.error for result in failed},
+        'retried': sum(1 for result in results if result.attempts > 1),
+        'p50_ms': percentile(0.50),
+        'max_ms': percentile(1.0)
+    }
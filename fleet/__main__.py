@@ -0,0 +1,60 @@
+"""Reads state from or pushes a scene to many controllers.
+
+    python -m fleet state 10.0.0.21 10.0.0.22:8080
+    python -m fleet scene 10.0.0.21 10.0.0.22:8080 --set pump=on led=off
+    python -m fleet get /sensor 10.0.0.21 10.0.0.22:8080
+"""
+
+import argparse
+import json
+import sys
+
+from fleet import FleetClient, summarize
+
+
+def parse_scene(values):
+    scene = {}
+    for value in values:
+        name, _, enable = value.partition('=')
+        if enable not in ('on', 'off'):
+            raise argparse.ArgumentTypeError('expected name=on|off: ' + value)
+        scene[name] = enable == 'on'
+
+    return scene
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('command', choices=('state', 'scene', 'get'))
+    parser.add_argument('arguments', nargs='+',
+                        help='[path for get] device addresses')
+    parser.add_argument('--set', nargs='+', default=())
+    parser.add_argument('--parallelism', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=2.0)
+    parser.add_argument('--retries', type=int, default=2)
+    args = parser.parse_args()
+
+    addresses = args.arguments
+    if args.command == 'get':
+        path, addresses = addresses[0], addresses[1:]
+
+    with FleetClient(addresses, args.parallelism, args.timeout,
+                     args.retries) as client:
+        if args.command == 'state':
+            results = client.get_state()
+        elif args.command == 'scene':
+            results = client.set_scene(parse_scene(args.set))
+        else:
+            results = client.get(path)
+
+    json.dump({
+        'results': [result.to_dict() for result in results],
+        'summary': summarize(results)
+    }, sys.stdout, indent=2)
+    print()
+
+    return 0 if all(result.ok for result in results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+from array import array
+import config
+import gc
+import metrics
+
+gc_policy_enabled = False
+alloc_after_collect = 0
+
+# Worst request latency in microseconds, indexed by gc_policy_enabled.
+worst_request_us = array('L', [0, 0])
+
+
+def enable_gc_policy():
+    global gc_policy_enabled
+
+    print('Enabling GC policy...')
+
+    # The allocator only collects on its own once gc_threshold_bytes have
+    # been allocated, idle() collects well before that between requests.
+    gc.threshold(config.gc_threshold_bytes)
+    collect()
+    gc_policy_enabled = True
+
+    print('GC policy enabled')
+
+
+def disable_gc_policy():
+    global gc_policy_enabled
+
+    gc.threshold(-1)
+    gc_policy_enabled = False
+
+    print('GC policy disabled')
+
+
+def collect():
+    global alloc_after_collect
+
+    metrics.collect_garbage()
+    alloc_after_collect = gc.mem_alloc()
+
+
+def idle():
+    # Called by the web server between requests and when accept() times out.
+    # Collecting small allocation budgets often keeps each pause short.
+    if gc_policy_enabled \
+            and gc.mem_alloc() - alloc_after_collect \
+            >= config.gc_idle_collect_bytes:
+        collect()
+
+
+def record_request(http_client):
+    total_us = http_client.GetTotalUs()
+
+    if total_us > worst_request_us[gc_policy_enabled]:
+        worst_request_us[gc_policy_enabled] = total_us
+
+
+def largest_free_block(limit):
+    # Binary search for the largest single allocation the heap can satisfy.
+    low = 0
+    high = limit
+
+    while low < high:
+        size = (low + high + 1) // 2
+        try:
+            bytearray(size)
+            low = size
+        except MemoryError:
+            high = size - 1
+
+    return low
+
+
+def get_heap_report():
+    collect()
+
+    mem_free = gc.mem_free()
+
+    if config.gc_heap_probe_enabled:
+        largest = largest_free_block(mem_free)
+        fragmentation = 1 - largest / mem_free if mem_free else 0
+        collect()
+    else:
+        largest = None
+        fragmentation = None
+
+    return {
+        'free': mem_free,
+        'alloc': gc.mem_alloc(),
+        'largest_free_block': largest,
+        'fragmentation': fragmentation,
+        'gc_policy_enabled': gc_policy_enabled,
+        'gc_collections': metrics.gc_collections,
+        'gc_collect_us': metrics.gc_collect_us,
+        'worst_request_us': {
+            'gc_policy_enabled': worst_request_us[1],
+            'gc_policy_disabled': worst_request_us[0]
+        }
+    }
@@ -0,0 +1,72 @@
+from machine import Pin
+import sys
+
+# ESP32 GPIO output set/clear registers for pins 0-31 and 32-39.
+_GPIO_OUT_W1TS = 0x3ff44008
+_GPIO_OUT_W1TC = 0x3ff4400c
+_GPIO_OUT1_W1TS = 0x3ff44014
+_GPIO_OUT1_W1TC = 0x3ff44018
+
+
+def get_pin_masks(pins):
+    # -> (mask of pins 0-31, mask of pins 32-39)
+    mask0 = 0
+    mask1 = 0
+
+    for pin in pins:
+        if pin < 32:
+            mask0 |= 1 << pin
+        else:
+            mask1 |= 1 << (pin - 32)
+
+    return mask0, mask1
+
+
+class ESP32GPIOBank:
+    """Sets or clears all pins of a mask with one register write per bank."""
+
+    def __init__(self, pins):
+        from machine import mem32
+
+        self.mem32 = mem32
+        self.pins = [Pin(pin, Pin.OUT, Pin.PULL_DOWN, value=0) for pin in pins]
+
+    def write(self, set_mask0, set_mask1, clear_mask0, clear_mask1):
+        if set_mask0:
+            self.mem32[_GPIO_OUT_W1TS] = set_mask0
+        if clear_mask0:
+            self.mem32[_GPIO_OUT_W1TC] = clear_mask0
+        if set_mask1:
+            self.mem32[_GPIO_OUT1_W1TS] = set_mask1
+        if clear_mask1:
+            self.mem32[_GPIO_OUT1_W1TC] = clear_mask1
+
+
+class PinGPIOBank:
+    """Same interface through Pin.value(), for ports without mem32."""
+
+    def __init__(self, pins):
+        self.pins = {pin: Pin(pin, Pin.OUT, Pin.PULL_DOWN, value=0) for pin in pins}
+
+    def write(self, set_mask0, set_mask1, clear_mask0, clear_mask1):
+        for number, pin in self.pins.items():
+            if number < 32:
+                bit = 1 << number
+                set_mask = set_mask0
+                clear_mask = clear_mask0
+            else:
+                bit = 1 << (number - 32)
+                set_mask = set_mask1
+                clear_mask = clear_mask1
+
+            if set_mask & bit:
+                pin.value(1)
+            elif clear_mask & bit:
+                pin.value(0)
+
+
+def create_gpio_bank(pins):
+    if sys.platform == 'esp32':
+        return ESP32GPIOBank(pins)
+
+    return PinGPIOBank(pins)
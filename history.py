@@ -0,0 +1,131 @@
+from array import array
+from rollup import Rollup
+from tslog import TimeSeriesLog
+import config
+import controller
+import sensor
+import time
+
+# Log channels 0-3 are the ADS1115 inputs, output i is logged as 0/1 on
+# channel OUTPUT_CHANNEL + i.
+OUTPUT_CHANNEL = 16
+
+log = None
+last_sample_s = array('L', [0] * 4)
+
+# {series: {resolution: Rollup}}, series are 'adc<channel>' and output names.
+rollups = {}
+channel_rollups = {}
+output_on_since = {}
+
+
+def initialize_history():
+    global log
+
+    if log is not None:
+        print('History is already initialized')
+
+    else:
+        print('Initializing history...')
+
+        log = TimeSeriesLog(
+            config.history_log_path,
+            segment_count=config.history_segment_count,
+            segment_pages=config.history_segment_pages,
+            page_size=config.history_page_size
+        )
+
+        series = list(controller.output_names)
+        if sensor.ads1115 is not None:
+            series += ['adc%d' % channel for channel in sensor.ads1115.channels]
+            sensor.ads1115.sample_callbacks.append(sample_handler)
+
+        for name in series:
+            rollups[name] = {}
+            for resolution, bucket_s, bucket_count in config.history_rollups:
+                rollups[name][resolution] = Rollup(bucket_s, bucket_count)
+
+        if sensor.ads1115 is not None:
+            for channel in sensor.ads1115.channels:
+                channel_rollups[channel] = \
+                    tuple(rollups['adc%d' % channel].values())
+
+        controller.add_change_callback(output_change_handler)
+
+        # Outputs restored on at boot never report a change, their on-time
+        # counts from here.
+        now = time.time()
+        current_state = controller.get_state()
+        for output in controller.output_names:
+            if controller.is_enabled(output, current_state):
+                output_on_since.setdefault(output, now)
+
+        print('History initialized')
+
+
+def sample_handler(channel, value):
+    now = time.time()
+
+    for rollup in channel_rollups[channel]:
+        rollup.add(now, value)
+
+    if now - last_sample_s[channel] < config.history_sample_interval_s:
+        return
+
+    last_sample_s[channel] = now
+    log.append(channel, value, now)
+
+
+def output_change_handler(output, enable):
+    now = time.time()
+
+    log.append(
+        OUTPUT_CHANNEL + controller.output_index[output], int(enable), now
+    )
+
+    if enable:
+        output_on_since[output] = now
+    else:
+        close_output_interval(output, now)
+        output_on_since.pop(output, None)
+
+
+def close_output_interval(output, now):
+    on_since = output_on_since.get(output)
+
+    if on_since is not None:
+        for rollup in rollups[output].values():
+            rollup.add_duration(on_since, now)
+        output_on_since[output] = now
+
+
+def get_rollup(series, resolution, count=None):
+    # Output buckets hold their on-time in seconds as sum.
+    rollup = rollups.get(series, {}).get(resolution)
+    if rollup is None:
+        return None
+
+    now = time.time()
+    if series in output_on_since:
+        close_output_interval(series, now)
+
+    return {
+        'bucket_s': rollup.bucket_s,
+        'buckets': rollup.get_buckets(now, count)
+    }
+
+
+def flush():
+    if log is not None:
+        log.flush()
+
+
+def find_spans(start, end):
+    if log is None:
+        return []
+
+    return log.find_spans(start, end)
+
+
+def read_spans(spans):
+    return log.read_spans(spans)
@@ -1,3 +1,4 @@
+from i2c_bus import PRIORITY_LOW
 from machine import RTC
 from urtc import seconds2tuple, DS3231
 import config
@@ -34,7 +35,9 @@ def initialize_ds3231():
     else:
         print('Initializing DS3231...')
 
-        ds3231 = DS3231(config.i2c)
+        ds3231 = DS3231(
+            config.get_i2c(PRIORITY_LOW), address=config.ds3231_address
+        )
 
         print('DS3231 initialized')
         print('DS3231 time:', ds3231.datetime())
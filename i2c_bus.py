@@ -0,0 +1,181 @@
+from machine import I2C
+from metrics import Histogram
+import _thread
+import machine
+import time
+
+# Lower values go first. Sensor reads from IRQ handlers use PRIORITY_HIGH,
+# RTC housekeeping uses PRIORITY_LOW.
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# errno of a missing ACK: ENODEV on a bare address, EIO or ETIMEDOUT on
+# a NACK or a held bus.
+_NACK_ERRNOS = (5, 19, 110, 116)
+
+
+class DeviceStats:
+    def __init__(self):
+        self.latency_us = Histogram()
+        self.wait_us = Histogram()
+        self.retries = 0
+        self.errors = 0
+
+
+class I2CBus:
+    """Serializes transactions on one bus, waiting callers are served by
+    priority. A transaction runs to completion, but a high priority caller
+    gets the bus before any waiting lower priority one, including on the
+    thread that holds it, e.g. a scheduled IRQ handler between two RTC
+    transactions."""
+
+    def __init__(self, scl, sda, freq=400000, retries=2):
+        self.scl = scl
+        self.sda = sda
+        self.freq = freq
+        self.retries = retries
+        self.i2c = I2C(scl=scl, sda=sda, freq=freq)
+
+        self.owner = None
+        self.depth = 0
+        # (priority, arrival, thread, lock) of blocked callers, sorted
+        self.waiters = []
+        self.arrivals = 0
+        self.stats = {}
+
+    def acquire(self, priority):
+        # The bookkeeping is done with IRQs disabled rather than under a
+        # lock: a handler scheduled onto the thread in between would block
+        # on that lock forever.
+        me = _thread.get_ident()
+
+        irq_state = machine.disable_irq()
+        if self.owner is None or self.owner == me:
+            self.owner = me
+            self.depth += 1
+            machine.enable_irq(irq_state)
+            return
+
+        waiter = _thread.allocate_lock()
+        waiter.acquire()
+        entry = (priority, self.arrivals, me, waiter)
+        self.arrivals += 1
+
+        index = len(self.waiters)
+        while index and self.waiters[index - 1][:2] > entry[:2]:
+            index -= 1
+        self.waiters.insert(index, entry)
+        machine.enable_irq(irq_state)
+
+        # release() hands the bus over by releasing this lock.
+        waiter.acquire()
+
+    def release(self):
+        irq_state = machine.disable_irq()
+        self.depth -= 1
+        if not self.depth:
+            if self.waiters:
+                priority, arrival, self.owner, waiter = self.waiters.pop(0)
+                self.depth = 1
+                waiter.release()
+            else:
+                self.owner = None
+        machine.enable_irq(irq_state)
+
+    def reset_owner(self):
+        # In a forked process, where the threads that held or waited for
+        # the bus don't exist.
+        self.owner = None
+        self.depth = 0
+        self.waiters = []
+
+    def get_stats(self, address):
+        stats = self.stats.get(address)
+        if stats is None:
+            stats = DeviceStats()
+            self.stats[address] = stats
+
+        return stats
+
+    def transaction(self, priority, address, function, *args):
+        # Calls function(machine.I2C, *args) with the bus held, retrying
+        # on a missing ACK.
+        started_us = time.ticks_us()
+        self.acquire(priority)
+        acquired_us = time.ticks_us()
+        stats = self.get_stats(address)
+
+        try:
+            attempt = 0
+            while True:
+                try:
+                    result = function(self.i2c, *args)
+                    break
+                except OSError as exception:
+                    if exception.args[0] not in _NACK_ERRNOS \
+                            or attempt >= self.retries:
+                        stats.errors += 1
+                        raise
+
+                    attempt += 1
+                    stats.retries += 1
+        finally:
+            self.release()
+
+        stats.wait_us.observe(time.ticks_diff(acquired_us, started_us))
+        stats.latency_us.observe(time.ticks_diff(time.ticks_us(), acquired_us))
+        return result
+
+    def set_frequency(self, freq):
+        self.acquire(PRIORITY_HIGH)
+        try:
+            self.i2c = I2C(scl=self.scl, sda=self.sda, freq=freq)
+            self.freq = freq
+        finally:
+            self.release()
+
+    def device(self, priority=PRIORITY_NORMAL):
+        return I2CDevice(self, priority)
+
+
+class I2CDevice:
+    """The machine.I2C methods the drivers use, run as bus transactions at
+    a fixed priority."""
+
+    def __init__(self, bus, priority):
+        self.bus = bus
+        self.priority = priority
+
+    def scan(self):
+        return self.bus.transaction(self.priority, None, I2C.scan)
+
+    def readfrom(self, addr, nbytes):
+        return self.bus.transaction(
+            self.priority, addr, I2C.readfrom, addr, nbytes
+        )
+
+    def readfrom_into(self, addr, buf):
+        return self.bus.transaction(
+            self.priority, addr, I2C.readfrom_into, addr, buf
+        )
+
+    def writeto(self, addr, buf):
+        return self.bus.transaction(
+            self.priority, addr, I2C.writeto, addr, buf
+        )
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        return self.bus.transaction(
+            self.priority, addr, I2C.readfrom_mem, addr, memaddr, nbytes
+        )
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        return self.bus.transaction(
+            self.priority, addr, I2C.readfrom_mem_into, addr, memaddr, buf
+        )
+
+    def writeto_mem(self, addr, memaddr, buf):
+        return self.bus.transaction(
+            self.priority, addr, I2C.writeto_mem, addr, memaddr, buf
+        )
@@ -0,0 +1,59 @@
+import gc
+import os
+import sys
+import time
+
+import_profile = []
+
+
+def profile_import(name):
+    # Modules imported by name before their dependents are measured alone,
+    # later imports of the same module hit sys.modules and cost nothing.
+    gc.collect()
+    mem_free = gc.mem_free()
+    started_us = time.ticks_us()
+
+    loaded = set(sys.modules)
+
+    module = __import__(name)
+
+    elapsed_us = time.ticks_diff(time.ticks_us(), started_us)
+    heap = mem_free - gc.mem_free()
+    # Dependencies imported for the first time are part of the measurement.
+    included = sorted(
+        other for other in sys.modules if other not in loaded and other != name
+    )
+    import_profile.append((name, elapsed_us, heap, included))
+
+    return module
+
+
+def profile_imports(names):
+    for name in names:
+        if name not in sys.modules:
+            profile_import(name)
+
+
+def get_firmware_modules():
+    # The modules the Makefile compiles and manifest.py freezes, listed by
+    # the generated firmware_modules. Running from source, the .py files
+    # next to main.py.
+    try:
+        from firmware_modules import modules
+        return modules
+    except ImportError:
+        pass
+
+    return sorted(
+        name[:-3] for name in os.listdir()
+        if name.endswith('.py')
+        and name not in ('boot.py', 'main.py', 'manifest.py')
+    )
+
+
+def report():
+    print('Import profile:')
+    for name, elapsed_us, heap, included in import_profile:
+        print(' ', name, elapsed_us / 1000, 'ms', heap, 'bytes')
+        if included:
+            print('    including', ', '.join(included))
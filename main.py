@@ -1,25 +1,106 @@
-import config
+import import_profiler
+
+# config creates the Pins, so it is measured too, before its flag is known.
+config = import_profiler.profile_import('config')
+
+if config.profile_imports:
+    import_profiler.profile_imports(import_profiler.get_firmware_modules())
+    import_profiler.report()
+
+from boot_sequence import BootSequence
+import autopump
+import boot_sequence
 import controller
+import history
 import hwrtc
-import network
+import mqtt_bridge
+import pwm_fader
+import sensor
+import state_store
+import udp_control
 import web_server
 import wlan
 
 
+def register_button_interrupt_handlers():
+    controller.register_interrupt_handlers()
+    boot_sequence.mark_button_ready()
+
+
+def start_wlan():
+    wlan.initialize_wlan()
+    wlan.start_wlan_manager()
+
+
 def main():
+    boot = BootSequence()
+
+    # Outputs are restored and local control comes up first, neither waits
+    # for the network.
+    boot.add_step('pwm', pwm_fader.initialize_pwm)
+    boot.add_step(
+        'restore_state',
+        state_store.restore_state,
+        requires=('pwm',)
+    )
+    boot.add_step('buttons', register_button_interrupt_handlers)
+    boot.add_step('hwrtc', hwrtc.initialize_hwrtc)
+    boot.add_step('ds3231', hwrtc.initialize_ds3231)
+    boot.add_step(
+        'hwrtc_from_ds3231',
+        hwrtc.synchronize_hwrtc_from_ds3231,
+        requires=('hwrtc', 'ds3231')
+    )
+    boot.add_step('ads1115', sensor.initialize_ads1115)
+    boot.add_step(
+        'autopump',
+        autopump.initialize_autopump,
+        requires=('ads1115',)
+    )
+    boot.add_step(
+        'history',
+        history.initialize_history,
+        requires=('hwrtc_from_ds3231', 'ads1115')
+    )
+
     if config.wlan_ssid and config.wlan_password:
-        wlan.initialize_wlan()
-        wlan.connect_to_wlan()
-
-    hwrtc.initialize_hwrtc()
-    hwrtc.initialize_ds3231()
-    hwrtc.synchronize_hwrtc_ds3231()
-
-    controller.register_pump_led_interrupt_handlers()
-    if config.wlan_ssid \
-            and config.wlan_password \
-            and wlan.wlan.status() == network.STAT_GOT_IP:
-        web_server.start_web_server()
+        boot.add_step('wlan', start_wlan)
+        boot.add_step(
+            'wlan_connected',
+            wlan.wait_for_wlan_connection,
+            requires=('wlan',),
+            background=True
+        )
+        boot.add_step(
+            'ntp',
+            hwrtc.synchronize_hwrtc_ds3231,
+            requires=('wlan_connected', 'hwrtc_from_ds3231')
+        )
+        boot.add_step(
+            'web_server',
+            web_server.start_web_server,
+            requires=('wlan_connected',)
+        )
+        boot.add_step(
+            'mqtt_bridge',
+            mqtt_bridge.initialize_mqtt_bridge,
+            requires=('wlan',)
+        )
+        boot.add_step(
+            'udp_control',
+            udp_control.initialize_udp_control,
+            requires=('wlan_connected',)
+        )
+        boot.add_step(
+            'report',
+            boot.report,
+            requires=('ntp', 'web_server', 'udp_control')
+        )
+
+    boot.run()
+
+    if boot.is_finished():
+        boot.report()
 
 
 main()
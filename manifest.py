@@ -0,0 +1,34 @@
+# Freezes the firmware modules into a MicroPython build, e.g.
+# make -C ports/esp32 BOARD=UM_TINYPICO FROZEN_MANIFEST=/path/to/manifest.py
+include('$(PORT_DIR)/boards/manifest.py')
+
+module('admission.py')
+module('ads1115.py')
+module('autopump.py')
+module('boot_sequence.py')
+module('config.py')
+module('controller.py')
+module('gc_policy.py')
+module('history.py')
+module('gpio_bank.py')
+module('hwrtc.py')
+module('i2c_bus.py')
+module('import_profiler.py')
+module('metrics.py')
+module('microWebSrv.py')
+module('microWebSrvStatic.py')
+module('mqtt_bridge.py')
+module('pwm_fader.py')
+module('rollup.py')
+module('sensor.py')
+module('slow_requests.py')
+module('state_store.py')
+module('tslog.py')
+module('udp_control.py')
+module('udp_protocol.py')
+module('urtc.py')
+module('web_server.py')
+module('wlan.py')
+
+# Generated by make, the module list import_profiler walks.
+module('firmware_modules.py', base_path='build')
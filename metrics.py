@@ -0,0 +1,277 @@
+from array import array
+from microWebSrv import MicroWebSrv
+import config
+import gc
+import time
+
+# Upper bounds in microseconds, the last bucket of a histogram is +Inf.
+latency_buckets_us = (
+    100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000,
+    500000, 1000000, 2500000
+)
+
+# Indexed like config.outputs.
+irq_name = [output[0] for output in config.outputs]
+irq_counts = array('L', [0] * len(irq_name))
+
+phase_name = ('accept_wait',) + MicroWebSrv._phaseNames
+
+route_stats = {}
+response_codes = {}
+
+gc_collections = 0
+gc_collect_us = 0
+
+accept_backlog = 0
+accept_backlog_max = 0
+accept_backlog_wait_us = 1000
+
+
+class Histogram:
+    def __init__(self, bounds=latency_buckets_us):
+        self.bounds = bounds
+        self.counts = array('L', [0] * (len(bounds) + 1))
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        bounds = self.bounds
+        index = 0
+        end = len(bounds)
+
+        while index < end and value > bounds[index]:
+            index += 1
+
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+
+class RouteStats:
+    def __init__(self):
+        self.requests = 0
+        self.bytes_sent = 0
+        self.latency = [Histogram() for _ in phase_name]
+
+
+def get_route_stats(route):
+    stats = route_stats.get(route)
+
+    if stats is None:
+        stats = RouteStats()
+        route_stats[route] = stats
+
+    return stats
+
+
+def record_request(http_client):
+    global accept_backlog
+    global accept_backlog_max
+
+    route = http_client.GetRoute()
+    if route is None:
+        # Static files and errors share one series to bound the label set.
+        route = 'other'
+
+    stats = get_route_stats(route)
+    stats.requests += 1
+    stats.bytes_sent += http_client.GetResponseBytesSent()
+
+    accept_wait_us = http_client.GetAcceptWaitUs()
+    stats.latency[0].observe(accept_wait_us)
+
+    timings = http_client.GetPhaseTimings()
+    for index in range(len(timings)):
+        stats.latency[index + 1].observe(timings[index])
+
+    code = http_client.GetResponseCode()
+    response_codes[code] = response_codes.get(code, 0) + 1
+
+    # accept() returning without waiting means the connection was already
+    # queued, consecutive such accepts estimate the listen backlog depth.
+    if accept_wait_us < accept_backlog_wait_us:
+        accept_backlog += 1
+        if accept_backlog > accept_backlog_max:
+            accept_backlog_max = accept_backlog
+    else:
+        accept_backlog = 0
+
+
+def record_irq(irq):
+    irq_counts[irq] += 1
+
+
+def collect_garbage():
+    global gc_collections
+    global gc_collect_us
+
+    started_us = time.ticks_us()
+    gc.collect()
+    gc_collect_us += time.ticks_diff(time.ticks_us(), started_us)
+    gc_collections += 1
+
+
+def render_histogram(lines, name, labels, histogram):
+    cumulative = 0
+    for index, bound in enumerate(histogram.bounds):
+        cumulative += histogram.counts[index]
+        lines.append('%s_bucket{%s,le="%d"} %d' % (
+            name, labels, bound, cumulative
+        ))
+
+    lines.append('%s_bucket{%s,le="+Inf"} %d' % (
+        name, labels, histogram.count
+    ))
+    lines.append('%s_sum{%s} %d' % (name, labels, histogram.sum))
+    lines.append('%s_count{%s} %d' % (name, labels, histogram.count))
+
+
+def render():
+    import admission
+    import boot_sequence
+    import gc_policy
+    import udp_control
+    import udp_protocol
+    import web_server
+
+    lines = []
+
+    lines.append('# TYPE http_requests_total counter')
+    for route, stats in route_stats.items():
+        lines.append('http_requests_total{route="%s"} %d' % (
+            route, stats.requests
+        ))
+
+    lines.append('# TYPE http_response_bytes_total counter')
+    for route, stats in route_stats.items():
+        lines.append('http_response_bytes_total{route="%s"} %d' % (
+            route, stats.bytes_sent
+        ))
+
+    lines.append('# TYPE http_responses_total counter')
+    for code, count in response_codes.items():
+        lines.append('http_responses_total{code="%s"} %d' % (code, count))
+
+    lines.append('# TYPE http_request_phase_us histogram')
+    for route, stats in route_stats.items():
+        for index, name in enumerate(phase_name):
+            render_histogram(
+                lines,
+                'http_request_phase_us',
+                'route="%s",phase="%s"' % (route, name),
+                stats.latency[index]
+            )
+
+    lines.append('# TYPE http_admission_total counter')
+    for index, name in enumerate(admission.route_class_name):
+        lines.append('http_admission_total{class="%s",result="admitted"} %d' % (
+            name, admission.admitted[index]
+        ))
+        lines.append('http_admission_total{class="%s",result="rejected"} %d' % (
+            name, admission.rejected[index]
+        ))
+
+    if web_server.web_server is not None:
+        stats = web_server.web_server.GetCompressionStats()
+        lines.append('# TYPE http_compressed_responses_total counter')
+        lines.append('http_compressed_responses_total %d' % (
+            stats[MicroWebSrv.COMPRESS_RESPONSES]
+        ))
+        lines.append('# TYPE http_compression_cache_hits_total counter')
+        lines.append('http_compression_cache_hits_total %d' % (
+            stats[MicroWebSrv.COMPRESS_CACHE_HITS]
+        ))
+        lines.append('# TYPE http_compression_bytes_total counter')
+        lines.append('http_compression_bytes_total{side="in"} %d' % (
+            stats[MicroWebSrv.COMPRESS_BYTES_IN]
+        ))
+        lines.append('http_compression_bytes_total{side="out"} %d' % (
+            stats[MicroWebSrv.COMPRESS_BYTES_OUT]
+        ))
+
+    if web_server.web_server is not None:
+        stats = web_server.web_server.GetPyHTMLStats()
+        lines.append('# TYPE pyhtml_cache_total counter')
+        lines.append('pyhtml_cache_total{result="hit"} %d' % (
+            stats[MicroWebSrv.PYHTML_HITS]
+        ))
+        lines.append('pyhtml_cache_total{result="miss"} %d' % (
+            stats[MicroWebSrv.PYHTML_MISSES]
+        ))
+        lines.append('# TYPE pyhtml_renders_total counter')
+        lines.append('pyhtml_renders_total %d' % stats[MicroWebSrv.PYHTML_RENDERS])
+        lines.append('# TYPE pyhtml_render_us_total counter')
+        lines.append('pyhtml_render_us_total %d' % (
+            stats[MicroWebSrv.PYHTML_RENDER_US]
+        ))
+
+    lines.append('# TYPE http_accept_backlog gauge')
+    lines.append('http_accept_backlog %d' % accept_backlog)
+    lines.append('# TYPE http_accept_backlog_max gauge')
+    lines.append('http_accept_backlog_max %d' % accept_backlog_max)
+
+    lines.append('# TYPE heap_free_bytes gauge')
+    lines.append('heap_free_bytes %d' % gc.mem_free())
+    lines.append('# TYPE heap_alloc_bytes gauge')
+    lines.append('heap_alloc_bytes %d' % gc.mem_alloc())
+    lines.append('# TYPE gc_collections_total counter')
+    lines.append('gc_collections_total %d' % gc_collections)
+    lines.append('# TYPE gc_collect_us_total counter')
+    lines.append('gc_collect_us_total %d' % gc_collect_us)
+    lines.append('# TYPE gc_policy_enabled gauge')
+    lines.append('gc_policy_enabled %d' % gc_policy.gc_policy_enabled)
+    lines.append('# TYPE http_request_worst_us gauge')
+    for enabled in (0, 1):
+        lines.append('http_request_worst_us{gc_policy="%d"} %d' % (
+            enabled, gc_policy.worst_request_us[enabled]
+        ))
+
+    lines.append('# TYPE udp_control_requests_total counter')
+    for index, name in enumerate(udp_protocol.status_name):
+        lines.append('udp_control_requests_total{status="%s"} %d' % (
+            name, udp_control.status_counts[index]
+        ))
+    lines.append('# TYPE udp_control_dropped_total counter')
+    lines.append('udp_control_dropped_total %d' % udp_control.dropped)
+    lines.append('# TYPE udp_control_replayed_total counter')
+    lines.append('udp_control_replayed_total %d' % udp_control.replayed)
+    lines.append('# TYPE udp_control_handle_us histogram')
+    render_histogram(
+        lines, 'udp_control_handle_us', 'command="all"', udp_control.handle_us
+    )
+
+    if config.i2c is not None:
+        lines.append('# TYPE i2c_transaction_us histogram')
+        for address, stats in config.i2c.stats.items():
+            render_histogram(
+                lines, 'i2c_transaction_us', 'device="%s"' % address,
+                stats.latency_us
+            )
+        lines.append('# TYPE i2c_wait_us histogram')
+        for address, stats in config.i2c.stats.items():
+            render_histogram(
+                lines, 'i2c_wait_us', 'device="%s"' % address, stats.wait_us
+            )
+        lines.append('# TYPE i2c_retries_total counter')
+        for address, stats in config.i2c.stats.items():
+            lines.append('i2c_retries_total{device="%s"} %d' % (
+                address, stats.retries
+            ))
+        lines.append('# TYPE i2c_errors_total counter')
+        for address, stats in config.i2c.stats.items():
+            lines.append('i2c_errors_total{device="%s"} %d' % (
+                address, stats.errors
+            ))
+
+    lines.append('# TYPE irq_events_total counter')
+    for index, name in enumerate(irq_name):
+        lines.append('irq_events_total{irq="%s"} %d' % (
+            name, irq_counts[index]
+        ))
+
+    if boot_sequence.button_ready_us is not None:
+        lines.append('# TYPE boot_button_ready_us gauge')
+        lines.append('boot_button_ready_us %d' % boot_sequence.button_ready_us)
+
+    lines.append('')
+    return '\n'.join(lines)
@@ -5,21 +5,26 @@ Copyright © 2018 Jean-Christophe Bos & HC² (www.hc2.fr)
 
 
 from    json        import loads, dumps
-from    os          import stat
 from    _thread     import start_new_thread
+from    binascii    import crc32
+from    os          import stat
 import  socket
 import  gc
 import  re
 
 try :
-    from microWebTemplate import MicroWebTemplate
+    from time import ticks_us, ticks_diff
 except :
-    pass
+    from time import perf_counter
+    def ticks_us() :
+        return int(perf_counter() * 1000000)
+    def ticks_diff(a, b) :
+        return a - b
 
-try :
-    from microWebSocket import MicroWebSocket
-except :
-    pass
+# microWebTemplate and microWebSocket are only imported on first use
+# (see MicroWebSrv._getMicroWebTemplate/_getMicroWebSocket), like static
+# file serving and the error pages in microWebSrvStatic, to keep the cold
+# start and the heap of the controller routes small.
 
 class MicroWebSrvRoute :
     def __init__(self, route, method, func, routeArgNames, routeRegex) :
@@ -36,40 +41,6 @@ class MicroWebSrv :
     # ===( Constants )============================================================
     # ============================================================================
 
-    _indexPages = [
-        "index.pyhtml",
-        "index.html",
-        "index.htm",
-        "default.pyhtml",
-        "default.html",
-        "default.htm"
-    ]
-
-    _mimeTypes = {
-        ".txt"   : "text/plain",
-        ".htm"   : "text/html",
-        ".html"  : "text/html",
-        ".css"   : "text/css",
-        ".csv"   : "text/csv",
-        ".js"    : "application/javascript",
-        ".xml"   : "application/xml",
-        ".xhtml" : "application/xhtml+xml",
-        ".json"  : "application/json",
-        ".zip"   : "application/zip",
-        ".pdf"   : "application/pdf",
-        ".ts"    : "application/typescript",
-        ".woff"  : "font/woff",
-        ".woff2" : "font/woff2",
-        ".ttf"   : "font/ttf",
-        ".otf"   : "font/otf",
-        ".jpg"   : "image/jpeg",
-        ".jpeg"  : "image/jpeg",
-        ".png"   : "image/png",
-        ".gif"   : "image/gif",
-        ".svg"   : "image/svg+xml",
-        ".ico"   : "image/x-icon"
-    }
-
     _html_escape_chars = {
         "&" : "&amp;",
         '"' : "&quot;",
@@ -80,6 +51,29 @@ class MicroWebSrv :
 
     _pyhtmlPagesExt = '.pyhtml'
 
+    _serviceUnavailableResponse = b"HTTP/1.1 503 Service Unavailable\r\n" \
+                                  b"Content-Length: 0\r\n"                   \
+                                  b"Connection: close\r\n\r\n"
+
+    PHASE_FIRST_LINE = 0
+    PHASE_HEADER     = 1
+    PHASE_ROUTE      = 2
+    PHASE_HANDLER    = 3   # includes the writes done by the handler
+    PHASE_WRITE      = 4
+    PHASE_COMPRESS   = 5   # part of the handler phase
+
+    _phaseNames = ('first_line', 'header', 'route', 'handler', 'write', 'compress')
+
+    COMPRESS_RESPONSES = 0
+    COMPRESS_CACHE_HITS = 1
+    COMPRESS_BYTES_IN  = 2
+    COMPRESS_BYTES_OUT = 3
+
+    PYHTML_HITS      = 0
+    PYHTML_MISSES    = 1
+    PYHTML_RENDERS   = 2
+    PYHTML_RENDER_US = 3
+
     # ============================================================================
     # ===( Class globals  )=======================================================
     # ============================================================================
@@ -148,18 +142,107 @@ class MicroWebSrv :
     # ------------------------------------------------------------------------------
 
     @staticmethod
-    def _fileExists(path) :
+    def _isPyHTMLFile(filename) :
+        return filename.lower().endswith(MicroWebSrv._pyhtmlPagesExt)
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _getMicroWebTemplate() :
+        global MicroWebTemplate
+        try :
+            return MicroWebTemplate
+        except NameError :
+            pass
         try :
-            stat(path)
-            return True
+            from microWebTemplate import MicroWebTemplate
         except :
-            return False
+            MicroWebTemplate = None
+        return MicroWebTemplate
 
     # ----------------------------------------------------------------------------
 
     @staticmethod
-    def _isPyHTMLFile(filename) :
-        return filename.lower().endswith(MicroWebSrv._pyhtmlPagesExt)
+    def _getCompressor() :
+        # -> compress(data, gzip, windowBits) or None without deflate support
+        global _compress
+        try :
+            return _compress
+        except NameError :
+            pass
+        try :
+            import deflate   # MicroPython built with deflate compression
+            import io
+            if not hasattr(deflate.DeflateIO, 'write') :
+                raise ImportError()
+            # DeflateIO has no flush or reset, so every response allocates
+            # a window of its own.
+            def _compress(data, gzip, windowBits) :
+                out = io.BytesIO()
+                d = deflate.DeflateIO(out, deflate.GZIP if gzip else deflate.ZLIB, windowBits)
+                d.write(data)
+                d.close()
+                return out.getvalue()
+        except ImportError :
+            try :
+                from zlib import compressobj, adler32, DEFLATED, Z_FULL_FLUSH   # CPython
+                from _thread import allocate_lock
+                from struct import pack
+                # One raw deflate stream per window size and process. A full
+                # flush ends each response on a byte boundary with no
+                # references back into it, so the response is closed with
+                # an empty final block and wrapped as a stream of its own.
+                compressors = { }
+                lock        = allocate_lock()
+                def _compress(data, gzip, windowBits) :
+                    if not lock.acquire(0) :
+                        # Another thread is compressing.
+                        c = compressobj(6, DEFLATED, windowBits + 16 if gzip else windowBits)
+                        return c.compress(data) + c.flush()
+                    try :
+                        c = compressors.get(windowBits)
+                        if c is None :
+                            c = compressobj(6, DEFLATED, -windowBits)
+                            compressors[windowBits] = c
+                        body = c.compress(data) + c.flush(Z_FULL_FLUSH)
+                    finally :
+                        lock.release()
+                    if gzip :
+                        return b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff' + body + b'\x03\x00' \
+                               + pack('<II', crc32(data), len(data) & 0xffffffff)
+                    cmf = (windowBits - 8) << 4 | 8
+                    flg = 0x80 + 31 - (cmf * 256 + 0x80) % 31
+                    return bytes((cmf, flg)) + body + b'\x03\x00' + pack('>I', adler32(data))
+            except ImportError :
+                _compress = None
+        return _compress
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _getMicroWebSrvStatic() :
+        global microWebSrvStatic
+        try :
+            return microWebSrvStatic
+        except NameError :
+            pass
+        import microWebSrvStatic
+        return microWebSrvStatic
+
+    # ----------------------------------------------------------------------------
+
+    @staticmethod
+    def _getMicroWebSocket() :
+        global MicroWebSocket
+        try :
+            return MicroWebSocket
+        except NameError :
+            pass
+        try :
+            from microWebSocket import MicroWebSocket
+        except :
+            MicroWebSocket = None
+        return MicroWebSocket
 
     # ============================================================================
     # ===( Constructor )==========================================================
@@ -180,6 +263,34 @@ class MicroWebSrv :
         self.WebSocketThreaded          = True
         self.AcceptWebSocketCallback    = None
         self.LetCacheStaticContentLevel = 2
+        self.BeforePhaseHooks           = [ ]
+        self.AfterPhaseHooks            = [ ]
+        self.RequestDoneHooks           = [ ]
+        self.IdleHooks                  = [ ]
+        self.IdleIntervalSec            = None
+        self.MaxConnections             = 4
+        self.AdmissionCallback          = None
+        self.ClientBufferSize           = 1024
+        self.ReusePort                  = False
+        self.WorkerRestartDelaySec      = 1
+        self.WorkerTimeoutSec           = 30
+        self.AfterForkHooks             = [ ]
+        self.SupervisorHooks            = [ ]
+        self.SupervisorIntervalSec      = 0.5
+        self.CompressMinSize            = None
+        self.CompressWindowBits         = 10
+        self.CompressCacheSize          = 4
+        self.PyHTMLCacheSize            = 4
+
+        self._compressCache     = [ ]
+        self._compressCacheNext = 0
+        self._compressStats     = [0, 0, 0, 0]
+        self._pyhtmlCache       = [ ]
+        self._pyhtmlStats       = [0, 0, 0, 0]
+
+        self._clientPool    = [ ]
+        self._workerPids    = None
+        self._supervisorPid = None
 
         self._routeHandlers = []
         routeHandlers += self._docoratedRouteHandlers
@@ -208,26 +319,81 @@ class MicroWebSrv :
         self._started = True
         while True :
             try :
+                acceptStart = ticks_us()
                 client, cliAddr = self._server.accept()
+                acceptWaitUs = ticks_diff(ticks_us(), acceptStart)
             except Exception as ex :
-                if ex.args and ex.args[0] == 113 :
+                if ex.args and ex.args[0] in (9, 113) :   # EBADF on CPython once Stop() closed it
                     break
+                self._runIdleHooks()   # accept timed out after IdleIntervalSec
+                continue
+            c = self._acquireClient()
+            if not c :
+                self._rejectConnection(client)
                 continue
-            self._client(self, client, cliAddr)
+            c._processRequest(client, cliAddr, acceptWaitUs)
+            for hook in self.RequestDoneHooks :
+                try :
+                    hook(c)
+                except Exception as ex :
+                    print('MicroWebSrv request done hook exception: %s' % ex)
+            self._runIdleHooks()
         self._started = False
 
+    # ----------------------------------------------------------------------------
+
+    def _acquireClient(self) :
+        for c in self._clientPool :
+            if c._isFree() :
+                return c
+        return None
+
+    # ----------------------------------------------------------------------------
+
+    def _rejectConnection(self, client) :
+        try :
+            client.settimeout(2)
+            client.send(MicroWebSrv._serviceUnavailableResponse)
+        except :
+            pass
+        try :
+            client.close()
+        except :
+            pass
+
+    # ----------------------------------------------------------------------------
+
+    def _runIdleHooks(self) :
+        for hook in self.IdleHooks :
+            try :
+                hook()
+            except Exception as ex :
+                print('MicroWebSrv idle hook exception: %s' % ex)
+
     # ============================================================================
     # ===( Functions )============================================================
     # ============================================================================
 
     def Start(self, threaded=False) :
         if not self._started :
+            if not self._clientPool :
+                # All connection memory is allocated once, here.
+                self._clientPool = [ MicroWebSrv._client(self)
+                                     for i in range(self.MaxConnections) ]
             self._server = socket.socket()
             self._server.setsockopt( socket.SOL_SOCKET,
                                      socket.SO_REUSEADDR,
                                      1 )
+            if self.ReusePort :
+                # Every prefork worker binds its own socket to the same
+                # port, the kernel spreads the connections over them.
+                self._server.setsockopt( socket.SOL_SOCKET,
+                                         socket.SO_REUSEPORT,
+                                         1 )
             self._server.bind(self._srvAddr)
             self._server.listen(16)
+            if self.IdleIntervalSec :
+                self._server.settimeout(self.IdleIntervalSec)
             if threaded :
                 MicroWebSrv._startThread(self._serverProcess)
             else :
@@ -235,7 +401,116 @@ class MicroWebSrv :
 
     # ----------------------------------------------------------------------------
 
+    def StartPrefork(self, workers, threaded=False, onWorkerStart=None) :
+        # CPython on Linux only: forks worker processes that each Start()
+        # a SO_REUSEPORT socket, and restarts workers that exit, or that
+        # haven't run their idle hooks for WorkerTimeoutSec, until Stop()
+        # is called from the supervising process. Anything shared between
+        # workers has to be set up before, see controller.share_state().
+        # Other threads of the supervisor don't exist in a worker, locks
+        # they held at the fork are replaced by the AfterForkHooks. The
+        # supervisor runs its SupervisorHooks every SupervisorIntervalSec.
+        if threaded :
+            MicroWebSrv._startThread(self.StartPrefork, (workers, False, onWorkerStart))
+            return
+        import mmap
+        import os
+        import signal
+        import time
+        self.ReusePort   = True
+        self._workerPids = { }
+        # Time each worker last ran its idle hooks, by worker slot.
+        self._heartbeats = memoryview(mmap.mmap(-1, 8 * workers)).cast('d')
+        try :
+            while self._workerPids is not None :
+                slots = [ slot for started, slot in self._workerPids.values() ]
+                for slot in range(workers) :
+                    if slot in slots :
+                        continue
+                    self._heartbeats[slot] = time.time()
+                    pid = os.fork()
+                    if pid == 0 :
+                        code = 0
+                        try :
+                            self._workerPids   = None
+                            self._workerSlot   = slot
+                            self._supervisorPid = os.getppid()
+                            for hook in self.AfterForkHooks :
+                                hook()
+                            self.IdleHooks.append(self._checkSupervisor)
+                            if self.IdleIntervalSec is None :
+                                self.IdleIntervalSec = 1
+                            if onWorkerStart :
+                                onWorkerStart()
+                            self.Start(threaded=False)
+                        except BaseException as ex :
+                            print('MicroWebSrv worker exception: %s' % ex)
+                            code = 1
+                        os._exit(code)
+                    self._workerPids[pid] = (time.time(), slot)
+                time.sleep(self.SupervisorIntervalSec)
+                for hook in self.SupervisorHooks :
+                    try :
+                        hook()
+                    except Exception as ex :
+                        print('MicroWebSrv supervisor hook exception: %s' % ex)
+                now = time.time()
+                for pid, (started, slot) in list(self._workerPids.items()) :
+                    if now - self._heartbeats[slot] > self.WorkerTimeoutSec :
+                        print( 'MicroWebSrv worker %d is not responding, killing it'
+                               % pid )
+                        try :
+                            os.kill(pid, signal.SIGKILL)
+                        except OSError :
+                            pass
+                        self._heartbeats[slot] = now
+                while self._workerPids :
+                    try :
+                        pid, status = os.waitpid(-1, os.WNOHANG)
+                    except ChildProcessError :
+                        break
+                    if not pid :
+                        break
+                    if self._workerPids is None or pid not in self._workerPids :
+                        continue
+                    started, slot = self._workerPids.pop(pid)
+                    print( 'MicroWebSrv worker %d exited (status %d), restarting'
+                           % (pid, status) )
+                    if time.time() - started < self.WorkerRestartDelaySec :
+                        # Don't spin when workers die right away.
+                        time.sleep(self.WorkerRestartDelaySec)
+        finally :
+            self._stopWorkers()
+
+    # ----------------------------------------------------------------------------
+
+    def _checkSupervisor(self) :
+        # Workers don't outlive a supervisor that was killed, and tell the
+        # supervisor they are still serving.
+        import os
+        import time
+        if os.getppid() != self._supervisorPid :
+            os._exit(0)
+        self._heartbeats[self._workerSlot] = time.time()
+
+    # ----------------------------------------------------------------------------
+
+    def _stopWorkers(self) :
+        import os
+        import signal
+        pids, self._workerPids = self._workerPids, None
+        for pid in pids or () :
+            try :
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except OSError :
+                pass
+
+    # ----------------------------------------------------------------------------
+
     def Stop(self) :
+        if self._workerPids is not None :
+            self._stopWorkers()
         if self._started :
             self._server.close()
 
@@ -246,21 +521,61 @@ class MicroWebSrv :
 
     # ----------------------------------------------------------------------------
 
+    def GetCompressionStats(self) :
+        # -> list indexed by MicroWebSrv.COMPRESS_*
+        return self._compressStats
+
+    # ----------------------------------------------------------------------------
+
+    def GetPyHTMLStats(self) :
+        # -> list indexed by MicroWebSrv.PYHTML_*
+        return self._pyhtmlStats
+
+    # ----------------------------------------------------------------------------
+
+    def _getPyHTMLSource(self, filepath) :
+        # Template sources are kept by path, least recently used first, and
+        # only read again once the file's mtime changes. Only the source is
+        # kept, every request executes a template of its own.
+        mtime = stat(filepath)[8]
+        for i, entry in enumerate(self._pyhtmlCache) :
+            if entry[0] == filepath :
+                del self._pyhtmlCache[i]
+                if entry[1] == mtime :
+                    self._pyhtmlCache.append(entry)
+                    self._pyhtmlStats[MicroWebSrv.PYHTML_HITS] += 1
+                    return entry[2]
+                break
+        self._pyhtmlStats[MicroWebSrv.PYHTML_MISSES] += 1
+        with open(filepath, 'r') as file :
+            code = file.read()
+        if self.PyHTMLCacheSize :
+            if len(self._pyhtmlCache) >= self.PyHTMLCacheSize :
+                del self._pyhtmlCache[0]
+            self._pyhtmlCache.append((filepath, mtime, code))
+        return code
+
+    # ----------------------------------------------------------------------------
+
     def SetNotFoundPageUrl(self, url=None) :
         self._notFoundUrl = url
 
     # ----------------------------------------------------------------------------
 
     def GetMimeTypeFromFilename(self, filename) :
-        filename = filename.lower()
-        for ext in self._mimeTypes :
-            if filename.endswith(ext) :
-                return self._mimeTypes[ext]
-        return None
+        return MicroWebSrv._getMicroWebSrvStatic().GetMimeTypeFromFilename(filename)
 
     # ----------------------------------------------------------------------------
     
     def GetRouteHandler(self, resUrl, method) :
+        rh, routeArgs = self._getRoute(resUrl, method)
+        if rh :
+            return (rh.func, routeArgs)
+        return (None, None)
+
+    # ----------------------------------------------------------------------------
+
+    def _getRoute(self, resUrl, method) :
         if self._routeHandlers :
             #resUrl = resUrl.upper()
             if resUrl.endswith('/') :
@@ -279,24 +594,15 @@ class MicroWebSrv :
                                 except :
                                     pass
                                 routeArgs[name] = value
-                            return (rh.func, routeArgs)
+                            return (rh, routeArgs)
                         else :
-                            return (rh.func, None)
+                            return (rh, None)
         return (None, None)
 
     # ----------------------------------------------------------------------------
 
     def _physPathFromURLPath(self, urlPath) :
-        if urlPath == '/' :
-            for idxPage in self._indexPages :
-            	physPath = self._webPath + '/' + idxPage
-            	if MicroWebSrv._fileExists(physPath) :
-            		return physPath
-        else :
-            physPath = self._webPath + urlPath.replace('../', '/')
-            if MicroWebSrv._fileExists(physPath) :
-                return physPath
-        return None
+        return MicroWebSrv._getMicroWebSrvStatic().PhysPathFromURLPath(self._webPath, urlPath)
 
     # ============================================================================
     # ===( Class Client  )========================================================
@@ -304,41 +610,91 @@ class MicroWebSrv :
 
     class _client :
 
+        # Pooled by MicroWebSrv : one instance per connection slot, reset and
+        # reused for every accepted connection.
+        __slots__ = ( '_microWebSrv', '_response', '_buf', '_socket',
+                      '_socketfile', '_webSocket', '_addr', '_acceptWaitUs',
+                      '_route', '_resCode', '_resBytes', '_phaseUs',
+                      '_totalUs', '_method', '_path', '_httpVer', '_resPath',
+                      '_queryString', '_queryParams', '_headers',
+                      '_contentType', '_contentLength' )
+
         # ------------------------------------------------------------------------
 
-        def __init__(self, microWebSrv, socket, addr) :
-            socket.settimeout(2)
+        def __init__(self, microWebSrv) :
             self._microWebSrv   = microWebSrv
+            self._response      = MicroWebSrv._response(self)
+            self._buf           = bytearray(microWebSrv.ClientBufferSize)
+            self._socket        = None
+            self._socketfile    = None
+            self._webSocket     = None
+            self._phaseUs       = [0] * len(MicroWebSrv._phaseNames)
+            self._queryParams   = { }
+            self._headers       = { }
+
+        # ------------------------------------------------------------------------
+
+        def _isFree(self) :
+            if self._webSocket :
+                if not self._webSocket.IsClosed() :
+                    return False
+                self._webSocket = None
+            return self._socket is None
+
+        # ------------------------------------------------------------------------
+
+        def _reset(self, socket, addr, acceptWaitUs) :
+            socket.settimeout(2)
             self._socket        = socket
             self._addr          = addr
+            self._acceptWaitUs  = acceptWaitUs
+            self._route         = None
+            self._resCode       = None
+            self._resBytes      = 0
+            self._totalUs       = 0
             self._method        = None
             self._path          = None
             self._httpVer       = None
             self._resPath       = "/"
             self._queryString   = ""
-            self._queryParams   = { }
-            self._headers       = { }
             self._contentType   = None
             self._contentLength = 0
-            
+            self._queryParams.clear()
+            self._headers.clear()
+            for i in range(len(self._phaseUs)) :
+                self._phaseUs[i] = 0
+
             if hasattr(socket, 'readline'):   # MicroPython
                 self._socketfile = self._socket
             else:   # CPython
                 self._socketfile = self._socket.makefile('rwb')
-                        
-            self._processRequest()
 
         # ------------------------------------------------------------------------
 
-        def _processRequest(self) :
+        def _processRequest(self, socket, addr, acceptWaitUs=0) :
+            self._reset(socket, addr, acceptWaitUs)
+            start = ticks_us()
             try :
-                response = MicroWebSrv._response(self)
-                if self._parseFirstLine(response) :
-                    if self._parseHeader(response) :
+                response = self._response
+                t = self._beginPhase(MicroWebSrv.PHASE_FIRST_LINE)
+                ok = self._parseFirstLine(response)
+                self._endPhase(MicroWebSrv.PHASE_FIRST_LINE, t)
+                if ok and not self._admit() :
+                    response.WriteResponseTooManyRequests()
+                elif ok :
+                    t = self._beginPhase(MicroWebSrv.PHASE_HEADER)
+                    ok = self._parseHeader(response)
+                    self._endPhase(MicroWebSrv.PHASE_HEADER, t)
+                    if ok :
                         upg = self._getConnUpgrade()
                         if not upg :
-                            routeHandler, routeArgs = self._microWebSrv.GetRouteHandler(self._resPath, self._method)
-                            if routeHandler :
+                            t = self._beginPhase(MicroWebSrv.PHASE_ROUTE)
+                            route, routeArgs = self._microWebSrv._getRoute(self._resPath, self._method)
+                            self._endPhase(MicroWebSrv.PHASE_ROUTE, t)
+                            t = self._beginPhase(MicroWebSrv.PHASE_HANDLER)
+                            if route :
+                                self._route = route.route
+                                routeHandler = route.func
                                 try :
                                     if routeArgs is not None:
                                         routeHandler(self, response, routeArgs)
@@ -371,14 +727,17 @@ class MicroWebSrv :
                                     response.WriteResponseNotFound()
                             else :
                                 response.WriteResponseMethodNotAllowed()
-                        elif upg == 'websocket' and 'MicroWebSocket' in globals() \
-                             and self._microWebSrv.AcceptWebSocketCallback :
+                            self._endPhase(MicroWebSrv.PHASE_HANDLER, t)
+                        elif upg == 'websocket' and self._microWebSrv.AcceptWebSocketCallback \
+                             and MicroWebSrv._getMicroWebSocket() :
+                                self._webSocket = \
                                 MicroWebSocket( socket         = self._socket,
                                                 httpClient     = self,
                                                 httpResponse   = response,
                                                 maxRecvLen     = self._microWebSrv.MaxWebSocketRecvLen,
                                                 threaded       = self._microWebSrv.WebSocketThreaded,
                                                 acceptCallback = self._microWebSrv.AcceptWebSocketCallback )
+                                self._socket = None
                                 return
                         else :
                             response.WriteResponseNotImplemented()
@@ -386,12 +745,38 @@ class MicroWebSrv :
                         response.WriteResponseBadRequest()
             except :
                 response.WriteResponseInternalServerError()
+            self._totalUs = ticks_diff(ticks_us(), start)
             try :
                 if self._socketfile is not self._socket:
                     self._socketfile.close()
                 self._socket.close()
             except :
                 pass
+            self._socket     = None
+            self._socketfile = None
+
+        # ------------------------------------------------------------------------
+
+        def _admit(self) :
+            # Called before the headers are read, only method, path and
+            # address are known at this point.
+            admissionCallback = self._microWebSrv.AdmissionCallback
+            return not admissionCallback or admissionCallback(self)
+
+        # ------------------------------------------------------------------------
+
+        def _beginPhase(self, phase) :
+            for hook in self._microWebSrv.BeforePhaseHooks :
+                hook(self, phase)
+            return ticks_us()
+
+        # ------------------------------------------------------------------------
+
+        def _endPhase(self, phase, t) :
+            us = ticks_diff(ticks_us(), t)
+            self._phaseUs[phase] += us
+            for hook in self._microWebSrv.AfterPhaseHooks :
+                hook(self, phase, us)
 
         # ------------------------------------------------------------------------
 
@@ -492,6 +877,37 @@ class MicroWebSrv :
 
         # ------------------------------------------------------------------------
 
+        def GetRoute(self) :
+            return self._route
+
+        # ------------------------------------------------------------------------
+
+        def GetResponseCode(self) :
+            return self._resCode
+
+        # ------------------------------------------------------------------------
+
+        def GetResponseBytesSent(self) :
+            return self._resBytes
+
+        # ------------------------------------------------------------------------
+
+        def GetAcceptWaitUs(self) :
+            return self._acceptWaitUs
+
+        # ------------------------------------------------------------------------
+
+        def GetPhaseTimings(self) :
+            # -> list of microseconds indexed by MicroWebSrv.PHASE_*, reused by the next connection
+            return self._phaseUs
+
+        # ------------------------------------------------------------------------
+
+        def GetTotalUs(self) :
+            return self._totalUs
+
+        # ------------------------------------------------------------------------
+
         def GetRequestContentType(self) :
             return self._contentType
 
@@ -543,6 +959,8 @@ class MicroWebSrv :
 
     class _response :
 
+        __slots__ = ( '_client', )
+
         # ------------------------------------------------------------------------
 
         def __init__(self, client) :
@@ -552,21 +970,27 @@ class MicroWebSrv :
 
         def _write(self, data, strEncoding='ISO-8859-1') :
             if data :
+                t = self._client._beginPhase(MicroWebSrv.PHASE_WRITE)
                 if type(data) == str :
                     data = data.encode(strEncoding)
                 data = memoryview(data)
-                while data :
-                    n = self._client._socketfile.write(data)
-                    if n is None :
-                        return False
-                    data = data[n:]
-                return True
+                try :
+                    while data :
+                        n = self._client._socketfile.write(data)
+                        if n is None :
+                            return False
+                        self._client._resBytes += n
+                        data = data[n:]
+                    return True
+                finally :
+                    self._client._endPhase(MicroWebSrv.PHASE_WRITE, t)
             return False
 
         # ------------------------------------------------------------------------
 
         def _writeFirstLine(self, code) :
-            reason = self._responseCodes.get(code, ('Unknown reason', ))[0]
+            self._client._resCode = code
+            reason = self._responseReasons.get(code, 'Unknown reason')
             return self._write("HTTP/1.1 %s %s\r\n" % (code, reason))
 
         # ------------------------------------------------------------------------
@@ -624,11 +1048,81 @@ class MicroWebSrv :
 
         # ------------------------------------------------------------------------
 
+        def _acceptedEncoding(self) :
+            # -> 'gzip', 'deflate' or None from the Accept-Encoding header
+            accept = self._client._headers.get('accept-encoding')
+            if not accept :
+                return None
+            accepted = None
+            for part in accept.split(',') :
+                elements = part.split(';')
+                encoding = elements[0].strip().lower()
+                if encoding not in ('gzip', 'deflate') :
+                    continue
+                if len(elements) > 1 and elements[1].strip().replace(' ', '').rstrip('0') in ('q=', 'q=0.') :
+                    continue
+                if encoding == 'gzip' :
+                    return encoding
+                accepted = encoding
+            return accepted
+
+        # ------------------------------------------------------------------------
+
+        def _compressContent(self, content, headers) :
+            # -> (content, headers), compressed if the client accepts it and
+            # content is at least CompressMinSize bytes. Compressed bodies
+            # are cached by path and reused while the content is unchanged.
+            srv = self._client._microWebSrv
+            if srv.CompressMinSize is None or len(content) < srv.CompressMinSize :
+                return content, headers
+            encoding = self._acceptedEncoding()
+            if not encoding :
+                return content, headers
+            compress = MicroWebSrv._getCompressor()
+            if not compress :
+                return content, headers
+            t = self._client._beginPhase(MicroWebSrv.PHASE_COMPRESS)
+            try :
+                path = self._client._resPath
+                crc = crc32(content)
+                compressed = None
+                for entry in srv._compressCache :
+                    if entry[0] == path and entry[1] == encoding and entry[2] == crc and entry[3] == len(content) :
+                        compressed = entry[4]
+                        srv._compressStats[MicroWebSrv.COMPRESS_CACHE_HITS] += 1
+                        break
+                if compressed is None :
+                    compressed = compress(content, encoding == 'gzip', srv.CompressWindowBits)
+                    if srv.CompressCacheSize :
+                        entry = (path, encoding, crc, len(content), compressed)
+                        if len(srv._compressCache) < srv.CompressCacheSize :
+                            srv._compressCache.append(entry)
+                        else :
+                            srv._compressCache[srv._compressCacheNext] = entry
+                            srv._compressCacheNext = (srv._compressCacheNext + 1) % srv.CompressCacheSize
+            except Exception as ex :
+                print('MicroWebSrv compression exception: %s' % ex)
+                return content, headers
+            finally :
+                self._client._endPhase(MicroWebSrv.PHASE_COMPRESS, t)
+            if len(compressed) >= len(content) :
+                return content, headers
+            srv._compressStats[MicroWebSrv.COMPRESS_RESPONSES] += 1
+            srv._compressStats[MicroWebSrv.COMPRESS_BYTES_IN]  += len(content)
+            srv._compressStats[MicroWebSrv.COMPRESS_BYTES_OUT] += len(compressed)
+            headers = dict(headers) if isinstance(headers, dict) else { }
+            headers["Content-Encoding"] = encoding
+            headers["Vary"] = "Accept-Encoding"
+            return compressed, headers
+
+        # ------------------------------------------------------------------------
+
         def WriteResponse(self, code, headers, contentType, contentCharset, content) :
             try :
                 if content :
                     if type(content) == str :
                         content = content.encode(contentCharset)
+                    content, headers = self._compressContent(content, headers)
                     contentLength = len(content)
                 else :
                     contentLength = 0
@@ -641,50 +1135,43 @@ class MicroWebSrv :
 
         # ------------------------------------------------------------------------
 
+        def WriteResponseStream(self, chunks, contentLength, contentType=None, headers=None) :
+            # Streams an iterable of bytes-like chunks totalling contentLength bytes.
+            try :
+                self._writeBeforeContent(200, headers, contentType, None, contentLength)
+                for chunk in chunks :
+                    if not self._write(chunk) :
+                        return False
+                return True
+            except :
+                return False
+
+        # ------------------------------------------------------------------------
+
         def WriteResponsePyHTMLFile(self, filepath, headers=None, vars=None) :
-            if 'MicroWebTemplate' in globals() :
-                with open(filepath, 'r') as file :
-                    code = file.read()
+            if MicroWebSrv._getMicroWebTemplate() :
+                srv = self._client._microWebSrv
+                code = srv._getPyHTMLSource(filepath)
                 mWebTmpl = MicroWebTemplate(code, escapeStrFunc=MicroWebSrv.HTMLEscape, filepath=filepath)
                 try :
+                    t = ticks_us()
                     tmplResult = mWebTmpl.Execute(None, vars)
+                    srv._pyhtmlStats[MicroWebSrv.PYHTML_RENDERS]   += 1
+                    srv._pyhtmlStats[MicroWebSrv.PYHTML_RENDER_US] += ticks_diff(ticks_us(), t)
                     return self.WriteResponse(200, headers, "text/html", "UTF-8", tmplResult)
                 except Exception as ex :
                     return self.WriteResponse( 500,
     	                                       None,
     	                                       "text/html",
     	                                       "UTF-8",
-    	                                       self._execErrCtnTmpl % {
-    	                                            'module'  : 'PyHTML',
-    	                                            'message' : str(ex)
-    	                                       } )
+    	                                       MicroWebSrv._getMicroWebSrvStatic().GetExecErrorPage(
+    	                                            'PyHTML', str(ex) ) )
             return self.WriteResponseNotImplemented()
 
         # ------------------------------------------------------------------------
 
         def WriteResponseFile(self, filepath, contentType=None, headers=None) :
-            try :
-                size = stat(filepath)[6]
-                if size > 0 :
-                    with open(filepath, 'rb') as file :
-                        self._writeBeforeContent(200, headers, contentType, None, size)
-                        try :
-                            buf = bytearray(1024)
-                            while size > 0 :
-                                x = file.readinto(buf)
-                                if x < len(buf) :
-                                    buf = memoryview(buf)[:x]
-                                if not self._write(buf) :
-                                    return False
-                                size -= x
-                            return True
-                        except :
-                            self.WriteResponseInternalServerError()
-                            return False
-            except :
-                pass
-            self.WriteResponseNotFound()
-            return False
+            return MicroWebSrv._getMicroWebSrvStatic().WriteResponseFile(self, filepath, contentType, headers)
 
         # ------------------------------------------------------------------------
 
@@ -713,16 +1200,13 @@ class MicroWebSrv :
         # ------------------------------------------------------------------------
 
         def WriteResponseError(self, code) :
-            responseCode = self._responseCodes.get(code, ('Unknown reason', ''))
             return self.WriteResponse( code,
                                        None,
                                        "text/html",
                                        "UTF-8",
-                                       self._errCtnTmpl % {
-                                            'code'    : code,
-                                            'reason'  : responseCode[0],
-                                            'message' : responseCode[1]
-                                       } )
+                                       MicroWebSrv._getMicroWebSrvStatic().GetErrorPage(
+                                            code,
+                                            self._responseReasons.get(code, 'Unknown reason') ) )
 
         # ------------------------------------------------------------------------
 
@@ -768,110 +1252,65 @@ class MicroWebSrv :
 
         # ------------------------------------------------------------------------
 
+        def WriteResponseTooManyRequests(self) :
+            return self.WriteResponseError(429)
+
+        # ------------------------------------------------------------------------
+
         def WriteResponseNotImplemented(self) :
             return self.WriteResponseError(501)
 
         # ------------------------------------------------------------------------
 
         def FlashMessage(self, messageText, messageStyle='') :
-            if 'MicroWebTemplate' in globals() :
+            if MicroWebSrv._getMicroWebTemplate() :
                 MicroWebTemplate.MESSAGE_TEXT = messageText
                 MicroWebTemplate.MESSAGE_STYLE = messageStyle
 
         # ------------------------------------------------------------------------
 
-        _errCtnTmpl = """\
-        <html>
-            <head>
-                <title>Error</title>
-            </head>
-            <body>
-                <h1>%(code)d %(reason)s</h1>
-                %(message)s
-            </body>
-        </html>
-        """
-
-        # ------------------------------------------------------------------------
-
-        _execErrCtnTmpl = """\
-        <html>
-            <head>
-                <title>Page execution error</title>
-            </head>
-            <body>
-                <h1>%(module)s page execution error</h1>
-                %(message)s
-            </body>
-        </html>
-        """
-
-        # ------------------------------------------------------------------------
-
-        _responseCodes = {
-            100: ('Continue', 'Request received, please continue'),
-            101: ('Switching Protocols',
-                  'Switching to new protocol; obey Upgrade header'),
-
-            200: ('OK', 'Request fulfilled, document follows'),
-            201: ('Created', 'Document created, URL follows'),
-            202: ('Accepted',
-                  'Request accepted, processing continues off-line'),
-            203: ('Non-Authoritative Information', 'Request fulfilled from cache'),
-            204: ('No Content', 'Request fulfilled, nothing follows'),
-            205: ('Reset Content', 'Clear input form for further input.'),
-            206: ('Partial Content', 'Partial content follows.'),
-
-            300: ('Multiple Choices',
-                  'Object has several resources -- see URI list'),
-            301: ('Moved Permanently', 'Object moved permanently -- see URI list'),
-            302: ('Found', 'Object moved temporarily -- see URI list'),
-            303: ('See Other', 'Object moved -- see Method and URL list'),
-            304: ('Not Modified',
-                  'Document has not changed since given time'),
-            305: ('Use Proxy',
-                  'You must use proxy specified in Location to access this '
-                  'resource.'),
-            307: ('Temporary Redirect',
-                  'Object moved temporarily -- see URI list'),
-
-            400: ('Bad Request',
-                  'Bad request syntax or unsupported method'),
-            401: ('Unauthorized',
-                  'No permission -- see authorization schemes'),
-            402: ('Payment Required',
-                  'No payment -- see charging schemes'),
-            403: ('Forbidden',
-                  'Request forbidden -- authorization will not help'),
-            404: ('Not Found', 'Nothing matches the given URI'),
-            405: ('Method Not Allowed',
-                  'Specified method is invalid for this resource.'),
-            406: ('Not Acceptable', 'URI not available in preferred format.'),
-            407: ('Proxy Authentication Required', 'You must authenticate with '
-                  'this proxy before proceeding.'),
-            408: ('Request Timeout', 'Request timed out; try again later.'),
-            409: ('Conflict', 'Request conflict.'),
-            410: ('Gone',
-                  'URI no longer exists and has been permanently removed.'),
-            411: ('Length Required', 'Client must specify Content-Length.'),
-            412: ('Precondition Failed', 'Precondition in headers is false.'),
-            413: ('Request Entity Too Large', 'Entity is too large.'),
-            414: ('Request-URI Too Long', 'URI is too long.'),
-            415: ('Unsupported Media Type', 'Entity body in unsupported format.'),
-            416: ('Requested Range Not Satisfiable',
-                  'Cannot satisfy request range.'),
-            417: ('Expectation Failed',
-                  'Expect condition could not be satisfied.'),
-
-            500: ('Internal Server Error', 'Server got itself in trouble'),
-            501: ('Not Implemented',
-                  'Server does not support this operation'),
-            502: ('Bad Gateway', 'Invalid responses from another server/proxy.'),
-            503: ('Service Unavailable',
-                  'The server cannot process the request due to a high load'),
-            504: ('Gateway Timeout',
-                  'The gateway server did not receive a timely response'),
-            505: ('HTTP Version Not Supported', 'Cannot fulfill request.'),
+        _responseReasons = {
+            100: 'Continue',
+            101: 'Switching Protocols',
+            200: 'OK',
+            201: 'Created',
+            202: 'Accepted',
+            203: 'Non-Authoritative Information',
+            204: 'No Content',
+            205: 'Reset Content',
+            206: 'Partial Content',
+            300: 'Multiple Choices',
+            301: 'Moved Permanently',
+            302: 'Found',
+            303: 'See Other',
+            304: 'Not Modified',
+            305: 'Use Proxy',
+            307: 'Temporary Redirect',
+            400: 'Bad Request',
+            401: 'Unauthorized',
+            402: 'Payment Required',
+            403: 'Forbidden',
+            404: 'Not Found',
+            405: 'Method Not Allowed',
+            406: 'Not Acceptable',
+            407: 'Proxy Authentication Required',
+            408: 'Request Timeout',
+            409: 'Conflict',
+            410: 'Gone',
+            411: 'Length Required',
+            412: 'Precondition Failed',
+            413: 'Request Entity Too Large',
+            414: 'Request-URI Too Long',
+            415: 'Unsupported Media Type',
+            416: 'Requested Range Not Satisfiable',
+            417: 'Expectation Failed',
+            429: 'Too Many Requests',
+            500: 'Internal Server Error',
+            501: 'Not Implemented',
+            502: 'Bad Gateway',
+            503: 'Service Unavailable',
+            504: 'Gateway Timeout',
+            505: 'HTTP Version Not Supported',
         }
 
     # ============================================================================
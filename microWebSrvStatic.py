@@ -0,0 +1,187 @@
+"""
+The MIT License (MIT)
+Copyright © 2018 Jean-Christophe Bos & HC² (www.hc2.fr)
+"""
+
+# Static file serving and error pages of MicroWebSrv, only imported on first
+# use (see MicroWebSrv._getMicroWebSrvStatic) since the controller mostly
+# answers from routes.
+
+from    os          import stat
+
+indexPages = [
+    "index.pyhtml",
+    "index.html",
+    "index.htm",
+    "default.pyhtml",
+    "default.html",
+    "default.htm"
+]
+
+mimeTypes = {
+    ".txt"   : "text/plain",
+    ".htm"   : "text/html",
+    ".html"  : "text/html",
+    ".css"   : "text/css",
+    ".csv"   : "text/csv",
+    ".js"    : "application/javascript",
+    ".xml"   : "application/xml",
+    ".xhtml" : "application/xhtml+xml",
+    ".json"  : "application/json",
+    ".zip"   : "application/zip",
+    ".pdf"   : "application/pdf",
+    ".ts"    : "application/typescript",
+    ".woff"  : "font/woff",
+    ".woff2" : "font/woff2",
+    ".ttf"   : "font/ttf",
+    ".otf"   : "font/otf",
+    ".jpg"   : "image/jpeg",
+    ".jpeg"  : "image/jpeg",
+    ".png"   : "image/png",
+    ".gif"   : "image/gif",
+    ".svg"   : "image/svg+xml",
+    ".ico"   : "image/x-icon"
+}
+
+errCtnTmpl = """\
+<html>
+    <head>
+        <title>Error</title>
+    </head>
+    <body>
+        <h1>%(code)d %(reason)s</h1>
+        %(message)s
+    </body>
+</html>
+"""
+
+execErrCtnTmpl = """\
+<html>
+    <head>
+        <title>Page execution error</title>
+    </head>
+    <body>
+        <h1>%(module)s page execution error</h1>
+        %(message)s
+    </body>
+</html>
+"""
+
+responseMessages = {
+    100: 'Request received, please continue',
+    101: 'Switching to new protocol; obey Upgrade header',
+    200: 'Request fulfilled, document follows',
+    201: 'Document created, URL follows',
+    202: 'Request accepted, processing continues off-line',
+    203: 'Request fulfilled from cache',
+    204: 'Request fulfilled, nothing follows',
+    205: 'Clear input form for further input.',
+    206: 'Partial content follows.',
+    300: 'Object has several resources -- see URI list',
+    301: 'Object moved permanently -- see URI list',
+    302: 'Object moved temporarily -- see URI list',
+    303: 'Object moved -- see Method and URL list',
+    304: 'Document has not changed since given time',
+    305: 'You must use proxy specified in Location to access this resource.',
+    307: 'Object moved temporarily -- see URI list',
+    400: 'Bad request syntax or unsupported method',
+    401: 'No permission -- see authorization schemes',
+    402: 'No payment -- see charging schemes',
+    403: 'Request forbidden -- authorization will not help',
+    404: 'Nothing matches the given URI',
+    405: 'Specified method is invalid for this resource.',
+    406: 'URI not available in preferred format.',
+    407: 'You must authenticate with this proxy before proceeding.',
+    408: 'Request timed out; try again later.',
+    409: 'Request conflict.',
+    410: 'URI no longer exists and has been permanently removed.',
+    411: 'Client must specify Content-Length.',
+    412: 'Precondition in headers is false.',
+    413: 'Entity is too large.',
+    414: 'URI is too long.',
+    415: 'Entity body in unsupported format.',
+    416: 'Cannot satisfy request range.',
+    417: 'Expect condition could not be satisfied.',
+    429: 'The user has sent too many requests in a given amount of time.',
+    500: 'Server got itself in trouble',
+    501: 'Server does not support this operation',
+    502: 'Invalid responses from another server/proxy.',
+    503: 'The server cannot process the request due to a high load',
+    504: 'The gateway server did not receive a timely response',
+    505: 'Cannot fulfill request.',
+}
+
+# ============================================================================
+
+def _fileExists(path) :
+    try :
+        stat(path)
+        return True
+    except :
+        return False
+
+# ----------------------------------------------------------------------------
+
+def GetMimeTypeFromFilename(filename) :
+    filename = filename.lower()
+    for ext in mimeTypes :
+        if filename.endswith(ext) :
+            return mimeTypes[ext]
+    return None
+
+# ----------------------------------------------------------------------------
+
+def PhysPathFromURLPath(webPath, urlPath) :
+    if urlPath == '/' :
+        for idxPage in indexPages :
+            physPath = webPath + '/' + idxPage
+            if _fileExists(physPath) :
+                return physPath
+    else :
+        physPath = webPath + urlPath.replace('../', '/')
+        if _fileExists(physPath) :
+            return physPath
+    return None
+
+# ----------------------------------------------------------------------------
+
+def GetErrorPage(code, reason) :
+    return errCtnTmpl % {
+        'code'    : code,
+        'reason'  : reason,
+        'message' : responseMessages.get(code, '')
+    }
+
+# ----------------------------------------------------------------------------
+
+def GetExecErrorPage(module, message) :
+    return execErrCtnTmpl % {
+        'module'  : module,
+        'message' : message
+    }
+
+# ----------------------------------------------------------------------------
+
+def WriteResponseFile(response, filepath, contentType=None, headers=None) :
+    try :
+        size = stat(filepath)[6]
+        if size > 0 :
+            with open(filepath, 'rb') as file :
+                response._writeBeforeContent(200, headers, contentType, None, size)
+                try :
+                    buf = response._client._buf
+                    while size > 0 :
+                        x = file.readinto(buf)
+                        if x < len(buf) :
+                            buf = memoryview(buf)[:x]
+                        if not response._write(buf) :
+                            return False
+                        size -= x
+                    return True
+                except :
+                    response.WriteResponseInternalServerError()
+                    return False
+    except :
+        pass
+    response.WriteResponseNotFound()
+    return False
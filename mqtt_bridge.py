@@ -0,0 +1,320 @@
+from array import array
+import _thread
+import binascii
+import config
+import controller
+import machine
+import sensor
+import time
+import wlan
+
+MQTTClient = None
+mqtt_client = None
+mqtt_bridge_running = False
+wlan_connected = False
+
+state_topics = []
+command_topic = None
+command_prefix = None
+status_topic = None
+sensor_topics = {}
+
+# Messages waiting for the broker, oldest first. A retained message replaces
+# a queued one for the same topic, so an outage only keeps the latest state
+# of every output, and the oldest message is dropped once the queue is full.
+queue_topics = [None] * config.mqtt_queue_size
+queue_payloads = [None] * config.mqtt_queue_size
+queue_retain = bytearray(config.mqtt_queue_size)
+queue_head = 0
+queue_count = 0
+
+# published, dropped, connects, commands
+counters = array('L', [0, 0, 0, 0])
+PUBLISHED = 0
+DROPPED = 1
+CONNECTS = 2
+COMMANDS = 3
+
+
+def initialize_mqtt_bridge():
+    global MQTTClient
+    global command_topic
+    global command_prefix
+    global status_topic
+
+    if MQTTClient is not None:
+        print('MQTT bridge is already initialized')
+
+    elif config.mqtt_broker is None:
+        print('MQTT bridge is disabled')
+
+    else:
+        try:
+            from umqtt.simple import MQTTClient
+        except ImportError:
+            print('MQTT bridge is unavailable, umqtt.simple is not installed')
+            return
+
+        print('Initializing MQTT bridge...')
+
+        prefix = config.mqtt_topic_prefix
+        for name in controller.output_names:
+            state_topics.append(('%s/%s/state' % (prefix, name)).encode())
+        command_topic = ('%s/+/set' % prefix).encode()
+        command_prefix = ('%s/' % prefix).encode()
+        status_topic = ('%s/status' % prefix).encode()
+        for channel in config.ads1115_channels:
+            sensor_topics[channel] = \
+                ('%s/sensor/%d' % (prefix, channel)).encode()
+
+        controller.add_change_callback(output_change_handler)
+        wlan.add_wlan_status_callback(wlan_status_handler)
+        wlan_status_handler(wlan.wlan_state)
+        queue_states()
+
+        start_mqtt_bridge()
+
+        print('MQTT bridge initialized')
+
+
+def enqueue(topic, payload, retain):
+    global queue_head
+    global queue_count
+
+    size = len(queue_topics)
+
+    irq_state = machine.disable_irq()
+    try:
+        if retain:
+            for offset in range(queue_count):
+                index = (queue_head + offset) % size
+                if queue_retain[index] and queue_topics[index] == topic:
+                    queue_payloads[index] = payload
+                    return
+
+        if queue_count == size:
+            queue_head = (queue_head + 1) % size
+            queue_count -= 1
+            counters[DROPPED] += 1
+
+        index = (queue_head + queue_count) % size
+        queue_topics[index] = topic
+        queue_payloads[index] = payload
+        queue_retain[index] = retain
+        queue_count += 1
+    finally:
+        machine.enable_irq(irq_state)
+
+
+def peek():
+    # -> (topic, payload, retain) of the oldest message, or None
+    if not queue_count:
+        return None
+
+    return queue_topics[queue_head], queue_payloads[queue_head], \
+        queue_retain[queue_head]
+
+
+def pop(topic, payload):
+    # Removes the oldest message once it is published, unless enqueue()
+    # replaced or dropped it meanwhile.
+    global queue_head
+    global queue_count
+
+    irq_state = machine.disable_irq()
+    try:
+        if queue_count and queue_topics[queue_head] is topic \
+                and queue_payloads[queue_head] is payload:
+            queue_topics[queue_head] = None
+            queue_payloads[queue_head] = None
+            queue_head = (queue_head + 1) % len(queue_topics)
+            queue_count -= 1
+    finally:
+        machine.enable_irq(irq_state)
+
+
+def queue_states():
+    state = controller.get_state()
+    for index in range(len(state_topics)):
+        enqueue(state_topics[index], b'on' if state & (1 << index) else b'off',
+                True)
+
+
+def queue_readings():
+    for channel, reading in sensor.get_readings().items():
+        if reading['average_mv'] is not None:
+            enqueue(sensor_topics[channel],
+                    ('%d' % reading['average_mv']).encode(), True)
+
+
+def output_change_handler(output, enable):
+    enqueue(state_topics[controller.output_index[output]],
+            b'on' if enable else b'off', True)
+
+
+def wlan_status_handler(state):
+    global wlan_connected
+
+    wlan_connected = state == wlan.WLAN_STATE_CONNECTED
+
+
+def message_handler(topic, message):
+    # <prefix>/<output>/set with on, off or toggle
+    if not topic.startswith(command_prefix) or not topic.endswith(b'/set'):
+        return
+
+    counters[COMMANDS] += 1
+
+    name = topic[len(command_prefix):-4].decode()
+    if name not in controller.output_index:
+        print('MQTT command for unknown output:', name)
+        return
+
+    if message == b'toggle':
+        applied = controller.toggle_enable(name)
+    elif message in (b'on', b'off'):
+        applied = controller.set_enable(name, message == b'on')
+    else:
+        print('MQTT command not understood:', message)
+        return
+
+    if applied is None:
+        # Within the dwell time, republish so the sender sees the state.
+        output_change_handler(name, controller.is_enabled(name))
+
+
+def get_client_id():
+    if config.mqtt_client_id is not None:
+        return config.mqtt_client_id
+
+    return 'nft-controller-' + \
+        binascii.hexlify(machine.unique_id()).decode()
+
+
+def connect():
+    global mqtt_client
+
+    client = MQTTClient(
+        get_client_id(),
+        config.mqtt_broker,
+        port=config.mqtt_port,
+        user=config.mqtt_user,
+        password=config.mqtt_password,
+        keepalive=config.mqtt_keepalive_s
+    )
+    client.set_callback(message_handler)
+    client.set_last_will(status_topic, b'offline', retain=True)
+    # Set before connecting, so disconnect() closes the socket when the
+    # broker refuses the connection or the subscription.
+    mqtt_client = client
+    client.connect()
+    client.subscribe(command_topic)
+    client.publish(status_topic, b'online', retain=True)
+
+    counters[CONNECTS] += 1
+    print('MQTT connected to', config.mqtt_broker)
+
+
+def disconnect():
+    global mqtt_client
+
+    client = mqtt_client
+    mqtt_client = None
+    if client is None:
+        return
+
+    try:
+        client.disconnect()
+    except Exception:
+        if client.sock is not None:
+            client.sock.close()
+
+
+def publish_batch():
+    for _ in range(config.mqtt_batch_size):
+        message = peek()
+        if message is None:
+            return
+
+        topic, payload, retain = message
+        mqtt_client.publish(topic, payload, retain=bool(retain))
+        pop(topic, payload)
+        counters[PUBLISHED] += 1
+
+
+def mqtt_bridge_process():
+    retry_at = time.ticks_ms()
+    sensor_at = retry_at
+    ping_at = retry_at
+
+    while mqtt_bridge_running:
+        now = time.ticks_ms()
+
+        if time.ticks_diff(now, sensor_at) >= 0:
+            sensor_at = time.ticks_add(now, config.mqtt_sensor_interval_ms)
+            queue_readings()
+
+        if mqtt_client is None:
+            if wlan_connected and time.ticks_diff(now, retry_at) >= 0:
+                # MQTTException when the broker refuses the connection or
+                # the subscription, OSError for the network.
+                try:
+                    connect()
+                    ping_at = time.ticks_add(
+                        now, config.mqtt_keepalive_s * 500
+                    )
+                except Exception as exception:
+                    print('MQTT connection failed:', exception)
+                    disconnect()
+                    retry_at = time.ticks_add(now, config.mqtt_retry_ms)
+
+        elif not wlan_connected:
+            disconnect()
+
+        else:
+            # Queued messages go out a batch per poll, commands are read in
+            # between so a long queue can't hold them up.
+            try:
+                mqtt_client.check_msg()
+                publish_batch()
+
+                if time.ticks_diff(now, ping_at) >= 0:
+                    mqtt_client.ping()
+                    ping_at = time.ticks_add(
+                        now, config.mqtt_keepalive_s * 500
+                    )
+            except Exception as exception:
+                print('MQTT connection lost:', exception)
+                disconnect()
+                retry_at = time.ticks_add(now, config.mqtt_retry_ms)
+
+        time.sleep_ms(config.mqtt_poll_ms)
+
+
+def start_mqtt_bridge():
+    global mqtt_bridge_running
+
+    if mqtt_bridge_running:
+        return
+
+    mqtt_bridge_running = True
+    _thread.start_new_thread(mqtt_bridge_process, ())
+
+
+def stop_mqtt_bridge():
+    global mqtt_bridge_running
+
+    mqtt_bridge_running = False
+    disconnect()
+
+
+def get_status():
+    return {
+        'enabled': MQTTClient is not None,
+        'connected': mqtt_client is not None,
+        'queued': queue_count,
+        'published': counters[PUBLISHED],
+        'dropped': counters[DROPPED],
+        'connects': counters[CONNECTS],
+        'commands': counters[COMMANDS]
+    }
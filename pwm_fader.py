@@ -0,0 +1,123 @@
+from array import array
+from machine import PWM, Pin, Timer
+import config
+import controller
+import machine
+
+# Brightness 0-255 to gamma 2.2 corrected 16 bit duty.
+gamma = array('H', [
+    int(((brightness / 255) ** 2.2) * 65535 + 0.5)
+    for brightness in range(256)
+])
+
+# One channel per PWM pin of config.pwm_outputs, in declaration order.
+# Brightness is kept in 1/256 steps so fades of any length are integer.
+pwms = []
+channel_outputs = []
+current = array('l')
+target = array('l')
+step = array('l')
+
+active = 0
+timer = None
+
+
+def initialize_pwm():
+    global timer
+
+    if timer is not None:
+        print('PWM is already initialized')
+
+    else:
+        print('Initializing PWM...')
+
+        for name, label, pins, interrupt in config.outputs:
+            if name not in config.pwm_outputs:
+                continue
+
+            for pin in pins:
+                pwms.append(PWM(Pin(pin), freq=config.pwm_frequency, duty_u16=0))
+                channel_outputs.append(name)
+                current.append(0)
+                target.append(0)
+                step.append(0)
+
+            controller.set_output_driver(name, create_output_driver(name))
+
+        timer = Timer(config.pwm_timer_id)
+
+        print('PWM initialized')
+
+
+def create_output_driver(name):
+    def output_driver(enable):
+        brightness = config.pwm_on_brightness if enable else 0
+        for channel, output in enumerate(channel_outputs):
+            if output == name:
+                set_brightness(channel, brightness, config.pwm_fade_ms)
+
+    return output_driver
+
+
+def set_brightness(channel, brightness, fade_ms=0):
+    # Returns immediately, the fade is stepped by the PWM timer.
+    global active
+
+    if not 0 <= brightness <= 255:
+        raise ValueError('brightness must be 0-255')
+
+    ticks = max(fade_ms // config.pwm_tick_ms, 1)
+
+    # tick() may finish the last fade and stop the timer in between, the
+    # fade and the timer are updated together with IRQs disabled.
+    irq_state = machine.disable_irq()
+    try:
+        target[channel] = brightness << 8
+        step[channel] = (target[channel] - current[channel]) // ticks
+        if not step[channel]:
+            step[channel] = 1 if target[channel] > current[channel] else -1
+
+        start_timer = not active
+        active |= 1 << channel
+        if start_timer:
+            timer.init(
+                mode=Timer.PERIODIC, period=config.pwm_tick_ms, callback=tick
+            )
+    finally:
+        machine.enable_irq(irq_state)
+
+
+def tick(timer):
+    # O(1) per fading channel and allocation free.
+    global active
+
+    irq_state = machine.disable_irq()
+    try:
+        for channel in range(len(pwms)):
+            if not active & (1 << channel):
+                continue
+
+            value = current[channel] + step[channel]
+            if (step[channel] > 0 and value >= target[channel]) \
+                    or (step[channel] < 0 and value <= target[channel]):
+                value = target[channel]
+                active &= ~(1 << channel)
+
+            current[channel] = value
+            pwms[channel].duty_u16(gamma[value >> 8])
+
+        if not active:
+            timer.deinit()
+    finally:
+        machine.enable_irq(irq_state)
+
+
+def get_status():
+    return [
+        {
+            'output': channel_outputs[channel],
+            'brightness': current[channel] >> 8,
+            'target': target[channel] >> 8
+        }
+        for channel in range(len(pwms))
+    ]
@@ -0,0 +1,75 @@
+from array import array
+
+
+class Rollup:
+    """Count/min/max/sum per fixed time bucket in a ring of bucket_count.
+
+    A slot is reused once its bucket is older than the ring, so updates and
+    queries only touch the buckets involved, never the samples.
+    """
+
+    def __init__(self, bucket_s, bucket_count):
+        self.bucket_s = bucket_s
+        self.bucket_count = bucket_count
+        self.buckets = array('L', [0xffffffff] * bucket_count)
+        self.counts = array('L', [0] * bucket_count)
+        self.minimums = array('l', [0] * bucket_count)
+        self.maximums = array('l', [0] * bucket_count)
+        self.sums = array('q', [0] * bucket_count)
+
+    def slot(self, bucket, value):
+        slot = bucket % self.bucket_count
+
+        if self.buckets[slot] != bucket:
+            self.buckets[slot] = bucket
+            self.counts[slot] = 0
+            self.minimums[slot] = value
+            self.maximums[slot] = value
+            self.sums[slot] = 0
+
+        return slot
+
+    def add(self, timestamp, value):
+        slot = self.slot(timestamp // self.bucket_s, value)
+
+        self.counts[slot] += 1
+        self.sums[slot] += value
+        if value < self.minimums[slot]:
+            self.minimums[slot] = value
+        if value > self.maximums[slot]:
+            self.maximums[slot] = value
+
+    def add_duration(self, start, end):
+        # Adds the seconds of [start, end) falling into each bucket to its
+        # sum, e.g. the on-time of an output.
+        start = max(start, end - self.bucket_s * self.bucket_count)
+
+        while start < end:
+            bucket = start // self.bucket_s
+            bucket_end = min((bucket + 1) * self.bucket_s, end)
+            slot = self.slot(bucket, 0)
+
+            self.counts[slot] += 1
+            self.sums[slot] += bucket_end - start
+            self.maximums[slot] = 1
+            start = bucket_end
+
+    def get_buckets(self, now, count=None):
+        # -> [(bucket start, count, min, max, sum)] oldest first, up to now
+        if count is None or count > self.bucket_count:
+            count = self.bucket_count
+
+        last = now // self.bucket_s
+        result = []
+        for bucket in range(last - count + 1, last + 1):
+            slot = bucket % self.bucket_count
+            if bucket >= 0 and self.buckets[slot] == bucket:
+                result.append((
+                    bucket * self.bucket_s,
+                    self.counts[slot],
+                    self.minimums[slot],
+                    self.maximums[slot],
+                    self.sums[slot]
+                ))
+
+        return result
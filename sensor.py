@@ -0,0 +1,49 @@
+from ads1115 import ADS1115
+from i2c_bus import PRIORITY_HIGH
+import config
+
+ads1115 = None
+
+
+def initialize_ads1115():
+    global ads1115
+
+    if ads1115 is not None:
+        print('ADS1115 is already initialized')
+
+    else:
+        print('Initializing ADS1115...')
+
+        ads1115 = ADS1115(
+            config.get_i2c(PRIORITY_HIGH),
+            address=config.ads1115_address,
+            channels=config.ads1115_channels,
+            full_scale_mv=config.ads1115_full_scale_mv,
+            data_rate=config.ads1115_data_rate,
+            decimation=config.ads1115_decimation,
+            window=config.ads1115_window
+        )
+        ads1115.start(config.ads1115_interrupt)
+
+        print('ADS1115 initialized')
+
+
+def get_readings():
+    readings = {}
+
+    if ads1115 is None:
+        return readings
+
+    for channel in ads1115.channels:
+        latest = ads1115.latest(channel)
+        average = ads1115.window_average(channel)
+        readings[channel] = {
+            'latest': latest,
+            'average': average,
+            'latest_mv': None if latest is None
+            else ads1115.to_millivolts(latest),
+            'average_mv': None if average is None
+            else ads1115.to_millivolts(average)
+        }
+
+    return readings
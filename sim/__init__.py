@@ -0,0 +1,136 @@
+"""CPython simulation of the controller board.
+
+install() puts fake machine, network, ntptime, tinypico and MicroPython
+helper modules first on sys.path, adds the MicroPython-only functions to
+time and gc, wires the DS3231 and ADS1115 models to the I2C bus and points
+the config at a scratch directory and port, optionally with MQTT through
+the in-process sim.broker. Importing main afterwards
+boots the firmware unchanged:
+
+    import sim
+    sim.install(port=8080)
+    import main
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import time
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_MODULES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modules')
+
+_TICKS_PERIOD = 1 << 30
+_time = time.time
+_reset = time.monotonic()
+
+ds3231 = None
+ads1115 = None
+
+
+def ticks_ms():
+    return int((time.monotonic() - _reset) * 1000) & (_TICKS_PERIOD - 1)
+
+
+def ticks_us():
+    return int((time.monotonic() - _reset) * 1000000) & (_TICKS_PERIOD - 1)
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & (_TICKS_PERIOD - 1)
+
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) & (_TICKS_PERIOD - 1)
+    return diff - _TICKS_PERIOD if diff >= _TICKS_PERIOD // 2 else diff
+
+
+def sleep_ms(ms):
+    time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    time.sleep(us / 1000000)
+
+
+def _patch_time():
+    # MicroPython's time.time() returns whole seconds.
+    time.time = lambda: int(_time())
+    time.ticks_ms = ticks_ms
+    time.ticks_us = ticks_us
+    time.ticks_add = ticks_add
+    time.ticks_diff = ticks_diff
+    time.sleep_ms = sleep_ms
+    time.sleep_us = sleep_us
+
+
+def _patch_gc(heap_size):
+    gc.mem_alloc = lambda: 0
+    gc.mem_free = lambda: heap_size
+    gc.threshold = lambda amount=None: None if amount is not None else -1
+
+
+def _reset_after_fork():
+    # The fake IRQ and bus locks may be held by a thread of the parent,
+    # which doesn't exist in a forked worker.
+    import threading
+    import machine
+
+    machine.Pin._irq_lock = threading.RLock()
+    machine.I2C._lock = threading.Lock()
+    if ads1115 is not None:
+        ads1115.lock = threading.Lock()
+
+
+def install(port=8080, path=None, wlan=True, heap_size=4 * 1024 * 1024,
+            signal=None, mqtt=False):
+    global ds3231
+    global ads1115
+
+    for directory in (_ROOT, _MODULES):
+        if directory not in sys.path:
+            sys.path.insert(0, directory)
+
+    _patch_time()
+    _patch_gc(heap_size)
+
+    import machine
+
+    # sim.modules.machine and machine must be the same module.
+    sys.modules['sim.modules.machine'] = machine
+
+    from sim.devices import DS3231Model, ADS1115Model
+
+    import config
+
+    if ds3231 is None:
+        os.register_at_fork(after_in_child=_reset_after_fork)
+
+    ds3231 = DS3231Model()
+    ads1115 = ADS1115Model(27, signal)
+    machine.I2C.devices = {0x68: ds3231, config.ads1115_address: ads1115}
+
+    if path is None:
+        path = tempfile.mkdtemp(prefix='nft-controller-')
+
+    config.web_server_port = port
+    config.web_server_path = os.path.join(path, 'www')
+    config.history_log_path = os.path.join(path, 'log')
+    config.state_store_path = os.path.join(path, 'state')
+    if wlan:
+        config.wlan_ssid = config.wlan_ssid or 'simulation'
+        config.wlan_password = config.wlan_password or 'simulation'
+    if mqtt:
+        # umqtt.simple from sim/modules talks to sim.broker.broker.
+        config.mqtt_broker = 'simulation'
+        config.mqtt_poll_ms = 10
+        config.mqtt_retry_ms = 200
+
+    return path
+
+
+def press(pin):
+    # Presses and releases a button wired to pull the pin low.
+    import machine
+    machine.Pin.pulse(pin)
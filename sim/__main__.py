@@ -0,0 +1,17 @@
+"""Boots the firmware in the simulation: python -m sim [port] [seconds]"""
+
+import sys
+import time
+
+import sim
+
+port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3
+
+print('Simulation directory:', sim.install(port=port))
+
+import main
+import metrics
+
+time.sleep(seconds)
+print(metrics.render())
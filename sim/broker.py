@@ -0,0 +1,95 @@
+"""In-process stand-in for an MQTT broker, used by sim.modules.umqtt.
+
+Keeps retained messages, matches + and # wildcards, publishes last wills
+and can be taken offline to simulate outages, or refuse connections and
+subscriptions like a broker rejecting the credentials or the topic:
+
+    from sim.broker import broker
+    broker.publish(b'nft-controller/pump/set', b'on')
+    broker.set_available(False)
+    broker.connect_code = 5  # CONNACK not authorized
+    broker.subscribe_allowed = False
+"""
+
+import threading
+
+
+def topic_matches(pattern, topic):
+    pattern = pattern.split(b'/')
+    topic = topic.split(b'/')
+
+    for index, level in enumerate(pattern):
+        if level == b'#':
+            return True
+        if index >= len(topic) or (level != b'+' and level != topic[index]):
+            return False
+
+    return len(pattern) == len(topic)
+
+
+class Broker:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.available = True
+        # CONNACK return code, non-zero refuses connections.
+        self.connect_code = 0
+        self.subscribe_allowed = True
+        self.clients = []
+        self.retained = {}
+        # Every message published, (topic, payload, retain)
+        self.messages = []
+
+    def set_available(self, available):
+        with self.lock:
+            self.available = available
+            if not available:
+                for client in list(self.clients):
+                    self.drop(client)
+
+    def connect(self, client):
+        with self.lock:
+            if not self.available:
+                raise OSError(111, 'ECONNREFUSED')
+
+            if self.connect_code:
+                return self.connect_code
+
+            self.clients.append(client)
+            return 0
+
+    def drop(self, client, clean=False):
+        with self.lock:
+            if client not in self.clients:
+                return
+
+            self.clients.remove(client)
+            client.connected = False
+            if not clean and client.last_will is not None:
+                self.publish(*client.last_will)
+
+    def publish(self, topic, payload, retain=False):
+        with self.lock:
+            self.messages.append((topic, payload, retain))
+            if retain:
+                self.retained[topic] = payload
+
+            for client in self.clients:
+                if any(topic_matches(pattern, topic)
+                       for pattern in client.subscriptions):
+                    client.inbox.append((topic, payload))
+
+    def subscribe(self, client, pattern):
+        # -> False when the subscription is refused
+        with self.lock:
+            if not self.subscribe_allowed:
+                return False
+
+            client.subscriptions.append(pattern)
+            for topic, payload in self.retained.items():
+                if topic_matches(pattern, topic):
+                    client.inbox.append((topic, payload))
+
+            return True
+
+
+broker = Broker()
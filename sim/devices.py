@@ -0,0 +1,101 @@
+"""Register level models of the I2C devices on the controller board."""
+
+import datetime
+import threading
+import time
+
+from sim.modules.machine import Pin
+
+
+def _bcd(value):
+    return (value // 10) << 4 | value % 10
+
+
+def _bin(value):
+    return (value >> 4) * 10 + (value & 0x0f)
+
+
+class DS3231Model:
+    """Time registers 0x00-0x06 follow the host clock plus a set offset."""
+
+    def __init__(self):
+        self.registers = bytearray(0x13)
+        self.registers[0x0e] = 0x1c
+        self.registers[0x0f] = 0x80   # oscillator stop flag, lost power
+        self.offset = datetime.timedelta()
+
+    def now(self):
+        return datetime.datetime.now() + self.offset
+
+    def read(self, register, length):
+        now = self.now()
+        self.registers[0:7] = bytes((
+            _bcd(now.second), _bcd(now.minute), _bcd(now.hour),
+            _bcd(now.isoweekday()), _bcd(now.day), _bcd(now.month),
+            _bcd(now.year - 2000)
+        ))
+        return self.registers[register:register + length]
+
+    def write(self, register, data):
+        self.registers[register:register + len(data)] = data
+
+        if register < 7:
+            registers = self.registers
+            self.offset = datetime.datetime(
+                _bin(registers[6]) + 2000, _bin(registers[5]),
+                _bin(registers[4]), _bin(registers[2] & 0x3f),
+                _bin(registers[1]), _bin(registers[0] & 0x7f)
+            ) - datetime.datetime.now()
+
+
+class ADS1115Model:
+    """Converts signal(channel, seconds) at the configured data rate.
+
+    In continuous mode with the RDY thresholds set, every conversion pulses
+    the ALERT/RDY pin low.
+    """
+
+    _DATA_RATES = (8, 16, 32, 64, 128, 250, 475, 860)
+
+    def __init__(self, alert_pin, signal=None):
+        self.alert_pin = alert_pin
+        self.signal = signal or (lambda channel, seconds: 0)
+        self.registers = [0x0000, 0x8583, 0x8000, 0x7fff]
+        self.conversions = 0
+        self.lock = threading.Lock()
+        self.thread = None
+        self.started = time.monotonic()
+
+    def read(self, register, length):
+        with self.lock:
+            value = self.registers[register & 0x03]
+        return bytes((value >> 8, value & 0xff))[:length]
+
+    def write(self, register, data):
+        with self.lock:
+            self.registers[register & 0x03] = (data[0] << 8) | data[1]
+
+        if register & 0x03 == 1 and not self.registers[1] & 0x0100 \
+                and self.thread is None:
+            self.thread = threading.Thread(target=self.convert, daemon=True)
+            self.thread.start()
+
+    def convert(self):
+        while not self.registers[1] & 0x0100:
+            config = self.registers[1]
+            time.sleep(1 / self._DATA_RATES[(config >> 5) & 0x07])
+
+            mux = (config >> 12) & 0x07
+            channel = mux - 4 if mux >= 4 else 0
+            value = int(self.signal(channel, time.monotonic() - self.started))
+            value = max(-32768, min(32767, value))
+
+            with self.lock:
+                self.registers[0] = value & 0xffff
+            self.conversions += 1
+
+            if self.registers[3] & 0x8000 and not self.registers[2] & 0x8000 \
+                    and config & 0x0003 != 0x0003:
+                Pin.pulse(self.alert_pin)
+
+        self.thread = None
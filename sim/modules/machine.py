@@ -0,0 +1,220 @@
+"""Simulated machine module: Pin, I2C, RTC, Timer and PWM."""
+
+import datetime as _datetime
+import threading
+import time
+
+
+def disable_irq():
+    Pin._irq_lock.acquire()
+    return 1
+
+
+def enable_irq(state):
+    Pin._irq_lock.release()
+
+
+def call_irq_handler(handler, argument, hard):
+    # A hard handler runs with interrupts off. A soft one is scheduled: it
+    # waits for disable_irq() sections to end, but then runs with
+    # interrupts on, so it can block on a lock whose owner needs
+    # disable_irq() to release it.
+    with Pin._irq_lock:
+        if hard:
+            handler(argument)
+            return
+    handler(argument)
+
+
+def freq(hz=None):
+    return 240000000
+
+
+def unique_id():
+    return b'\x24\x0a\xc4\x00\x00\x01'
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_FALLING = 2
+    IRQ_RISING = 1
+
+    # State is shared by number, like the hardware behind Pin(number).
+    _values = {}
+    _irqs = {}
+    _irq_lock = threading.RLock()
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        if value is not None:
+            Pin._values[id] = 1 if value else 0
+        elif pull == Pin.PULL_UP:
+            Pin._values.setdefault(id, 1)
+        else:
+            Pin._values.setdefault(id, 0)
+
+    def value(self, value=None):
+        if value is None:
+            return Pin._values.get(self.id, 0)
+        Pin._values[self.id] = 1 if value else 0
+
+    on = lambda self: self.value(1)
+    off = lambda self: self.value(0)
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        if handler is None:
+            Pin._irqs.pop(self.id, None)
+        else:
+            Pin._irqs[self.id] = (handler, trigger, self, hard)
+
+    @staticmethod
+    def inject(id, value):
+        # Drives an input pin from the outside, calling its IRQ handler on a
+        # matching edge in the calling thread.
+        previous = Pin._values.get(id, 0)
+        value = 1 if value else 0
+        Pin._values[id] = value
+
+        irq = Pin._irqs.get(id)
+        if irq is None or previous == value:
+            return
+
+        handler, trigger, pin, hard = irq
+        if (value == 0 and trigger & Pin.IRQ_FALLING) \
+                or (value == 1 and trigger & Pin.IRQ_RISING):
+            call_irq_handler(handler, pin, hard)
+
+    @staticmethod
+    def pulse(id, active=0):
+        Pin.inject(id, active)
+        Pin.inject(id, not active)
+
+
+class I2C:
+    # address -> device model with read(register, length) and
+    # write(register, data), see sim.devices.
+    devices = {}
+    # Every transaction takes this long, and overlapping transactions,
+    # which would corrupt a real bus, are counted.
+    transaction_s = 0
+    overlaps = 0
+    # Addresses -> number of transactions to fail with a NACK.
+    nacks = {}
+    _active = 0
+    _lock = threading.Lock()
+
+    def __init__(self, id=-1, scl=None, sda=None, freq=400000):
+        self.freq = freq
+        self.transactions = 0
+
+    def _transaction(self, addr, function):
+        with I2C._lock:
+            I2C._active += 1
+            if I2C._active > 1:
+                I2C.overlaps += 1
+            self.transactions += 1
+        try:
+            if I2C.transaction_s:
+                time.sleep(I2C.transaction_s)
+            if I2C.nacks.get(addr):
+                I2C.nacks[addr] -= 1
+                raise OSError(5)   # EIO, NACK
+            try:
+                device = I2C.devices[addr]
+            except KeyError:
+                raise OSError(19)   # ENODEV, no ACK
+            return function(device)
+        finally:
+            with I2C._lock:
+                I2C._active -= 1
+
+    def scan(self):
+        return sorted(I2C.devices)
+
+    def readfrom_mem(self, addr, memaddr, nbytes):
+        return self._transaction(
+            addr, lambda device: bytes(device.read(memaddr, nbytes))
+        )
+
+    def readfrom_mem_into(self, addr, memaddr, buf):
+        def read(device):
+            buf[:] = device.read(memaddr, len(buf))
+        self._transaction(addr, read)
+
+    def writeto_mem(self, addr, memaddr, buf):
+        self._transaction(
+            addr, lambda device: device.write(memaddr, bytes(buf))
+        )
+
+
+class RTC:
+    _offset = _datetime.timedelta()
+
+    def datetime(self, datetimetuple=None):
+        if datetimetuple is None:
+            now = _datetime.datetime.now() + RTC._offset
+            return (now.year, now.month, now.day, now.weekday(), now.hour,
+                    now.minute, now.second, now.microsecond)
+
+        year, month, day, _weekday, hour, minute, second = datetimetuple[:7]
+        RTC._offset = _datetime.datetime(
+            year, month, day, hour, minute, second
+        ) - _datetime.datetime.now()
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1):
+        self.id = id
+        self._stop = None
+
+    def init(self, mode=PERIODIC, period=-1, callback=None, freq=None):
+        self.deinit()
+        if freq is not None:
+            period = 1000 / freq
+
+        stop = threading.Event()
+        self._stop = stop
+
+        def run():
+            while not stop.wait(period / 1000):
+                with Pin._irq_lock:
+                    if stop.is_set():
+                        return
+                # Timer callbacks are scheduled, like on the ESP32.
+                call_irq_handler(callback, self, False)
+                if mode == Timer.ONE_SHOT:
+                    return
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def deinit(self):
+        if self._stop is not None:
+            self._stop.set()
+            self._stop = None
+
+
+class PWM:
+    def __init__(self, pin, freq=5000, duty_u16=0):
+        self.pin = pin
+        self._freq = freq
+        self._duty = duty_u16
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty_u16(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+
+    def deinit(self):
+        pass
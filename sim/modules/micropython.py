@@ -0,0 +1,14 @@
+"""Simulated micropython module."""
+
+
+def const(value):
+    return value
+
+
+def schedule(function, argument):
+    function(argument)
+    return True
+
+
+def mem_info(verbose=None):
+    pass
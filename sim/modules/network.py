@@ -0,0 +1,62 @@
+"""Simulated network module with ESP32 WLAN status transitions."""
+
+import threading
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 1000
+STAT_CONNECTING = 1001
+STAT_GOT_IP = 1010
+STAT_NO_AP_FOUND = 201
+STAT_WRONG_PASSWORD = 202
+STAT_CONNECT_FAIL = 205
+
+# Set by simulations before connecting.
+connect_delay_s = 0.1
+connect_result = STAT_GOT_IP
+rssi = -60
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self._active = False
+        self._status = STAT_IDLE
+        self._config = {}
+        self._timer = None
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = bool(value)
+
+    def config(self, **kwargs):
+        self._config.update(kwargs)
+
+    def connect(self, ssid=None, password=None):
+        self._status = STAT_CONNECTING
+
+        def connected():
+            if self._status == STAT_CONNECTING:
+                self._status = connect_result
+
+        self._timer = threading.Timer(connect_delay_s, connected)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def disconnect(self):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._status = STAT_IDLE
+
+    def isconnected(self):
+        return self._status == STAT_GOT_IP
+
+    def status(self, param=None):
+        if param == 'rssi':
+            return rssi
+        return self._status
+
+    def ifconfig(self):
+        return ('127.0.0.1', '255.0.0.0', '127.0.0.1', '127.0.0.1')
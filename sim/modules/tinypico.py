@@ -0,0 +1,12 @@
+"""Simulated tinypico board module."""
+
+I2C_SDA = 21
+I2C_SCL = 22
+SPI_MOSI = 23
+SPI_CLK = 18
+SPI_MISO = 19
+DOTSTAR_PWR = 13
+DOTSTAR_DATA = 2
+DOTSTAR_CLK = 12
+BAT_VOLTAGE = 35
+BAT_CHARGE = 34
@@ -0,0 +1 @@
+from collections import *
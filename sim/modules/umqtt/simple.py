@@ -0,0 +1,64 @@
+"""umqtt.simple.MQTTClient talking to the in-process sim.broker."""
+
+from sim.broker import broker
+
+
+class MQTTException(Exception):
+    pass
+
+
+class MQTTClient:
+    def __init__(self, client_id, server, port=0, user=None, password=None,
+                 keepalive=0, ssl=False, ssl_params={}):
+        self.client_id = client_id
+        self.server = server
+        self.port = port
+        self.sock = None
+        self.callback = None
+        self.last_will = None
+        self.connected = False
+        self.subscriptions = []
+        self.inbox = []
+
+    def set_callback(self, callback):
+        self.callback = callback
+
+    def set_last_will(self, topic, message, retain=False, qos=0):
+        self.last_will = (topic, message, retain)
+
+    def check_connected(self):
+        if not self.connected:
+            raise OSError(104, 'ECONNRESET')
+
+    def connect(self, clean_session=True):
+        # Like umqtt, a refused CONNECT raises with the CONNACK return code.
+        code = broker.connect(self)
+        if code:
+            raise MQTTException(code)
+        self.connected = True
+        return 0
+
+    def disconnect(self):
+        broker.drop(self, clean=True)
+
+    def ping(self):
+        self.check_connected()
+
+    def publish(self, topic, message, retain=False, qos=0):
+        self.check_connected()
+        broker.publish(topic, message, retain)
+
+    def subscribe(self, topic, qos=0):
+        self.check_connected()
+        if not broker.subscribe(self, topic):
+            # SUBACK return code 0x80, the subscription failed.
+            raise MQTTException(0x80)
+
+    def wait_msg(self):
+        self.check_connected()
+        if self.inbox:
+            topic, message = self.inbox.pop(0)
+            self.callback(topic, message)
+
+    def check_msg(self):
+        return self.wait_msg()
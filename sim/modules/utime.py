@@ -0,0 +1,19 @@
+"""utime with MicroPython's 2000-01-01 epoch for localtime/mktime."""
+
+from time import *
+import time as _time
+
+_EPOCH = 946684800
+
+
+def localtime(seconds=None):
+    if seconds is None:
+        seconds = _time.time() - _EPOCH
+    return tuple(_time.gmtime(seconds + _EPOCH))[:8]
+
+
+def mktime(datetime):
+    import calendar
+    year, month, day, hour, minute, second = datetime[:6]
+    return calendar.timegm((year, month, day, hour, minute, second, 0, 0, 0)) \
+        - _EPOCH
@@ -0,0 +1,64 @@
+from array import array
+from microWebSrv import MicroWebSrv
+import config
+
+# Keeps the config.slow_request_log_size slowest requests in fixed slots. A
+# request faster than the fastest kept one is rejected with one comparison.
+slots = config.slow_request_log_size
+phase_count = len(MicroWebSrv._phaseNames)
+
+total_us = array('L', [0] * slots)
+phase_us = array('L', [0] * (slots * phase_count))
+response_codes = array('H', [0] * slots)
+methods = [None] * slots
+paths = [None] * slots
+fastest_slot = 0
+
+
+def record_request(http_client):
+    global fastest_slot
+
+    total = http_client.GetTotalUs()
+    slot = fastest_slot
+
+    if total <= total_us[slot]:
+        return
+
+    total_us[slot] = total
+    response_codes[slot] = http_client.GetResponseCode() or 0
+    methods[slot] = http_client.GetRequestMethod()
+    paths[slot] = http_client.GetRequestPath()
+
+    timings = http_client.GetPhaseTimings()
+    offset = slot * phase_count
+    for phase in range(phase_count):
+        phase_us[offset + phase] = timings[phase]
+
+    fastest_slot = 0
+    for slot in range(1, slots):
+        if total_us[slot] < total_us[fastest_slot]:
+            fastest_slot = slot
+
+
+def get_slow_requests():
+    slow_requests = []
+
+    for slot in range(slots):
+        if not total_us[slot]:
+            continue
+
+        offset = slot * phase_count
+        phases = {}
+        for phase, name in enumerate(MicroWebSrv._phaseNames):
+            phases[name] = phase_us[offset + phase]
+
+        slow_requests.append({
+            'method': methods[slot],
+            'path': paths[slot],
+            'code': response_codes[slot],
+            'total_us': total_us[slot],
+            'phases_us': phases
+        })
+
+    slow_requests.sort(key=lambda request: request['total_us'], reverse=True)
+    return slow_requests
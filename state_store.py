@@ -0,0 +1,186 @@
+from machine import Timer
+import binascii
+import config
+import controller
+import struct
+import time
+
+# magic, sequence, controller.state, reserved, crc32 of the preceding bytes
+RECORD_FORMAT = '<2sHBBI'
+RECORD_SIZE = 10
+RECORD_MAGIC = b'NS'
+
+
+def pack_record(sequence, outputs):
+    record = bytearray(RECORD_SIZE)
+    struct.pack_into('<2sHBB', record, 0, RECORD_MAGIC, sequence, outputs, 0)
+    struct.pack_into('<I', record, 6, binascii.crc32(record[:6]))
+    return record
+
+
+def unpack_record(record):
+    # -> (sequence, outputs) or None when the record is missing or corrupt
+    if record is None or len(record) != RECORD_SIZE:
+        return None
+
+    magic, sequence, outputs, _reserved, crc = \
+        struct.unpack(RECORD_FORMAT, record)
+    if magic != RECORD_MAGIC or crc != binascii.crc32(record[:6]):
+        return None
+
+    return sequence, outputs
+
+
+class NVRAMBackend:
+    """Keeps the record in the battery backed RAM of a urtc.DS1307."""
+
+    def __init__(self, rtc, address=0):
+        self.rtc = rtc
+        self.address = address
+
+    def read(self):
+        try:
+            record = bytes(
+                self.rtc.memory(self.address + offset)
+                for offset in range(RECORD_SIZE)
+            )
+        except OSError:
+            return None
+
+        return unpack_record(record)
+
+    def write(self, sequence, outputs):
+        self.rtc.memory(self.address, pack_record(sequence, outputs))
+
+
+class FlashBackend:
+    """Alternates between two files so one valid record always survives."""
+
+    def __init__(self, path):
+        self.paths = (path + '.0', path + '.1')
+        self.next_path = 0
+
+    def read_path(self, path):
+        try:
+            with open(path, 'rb') as file:
+                return unpack_record(file.read(RECORD_SIZE))
+        except OSError:
+            return None
+
+    def read(self):
+        records = [self.read_path(path) for path in self.paths]
+
+        if records[0] is None and records[1] is None:
+            return None
+
+        if records[1] is None:
+            newest = 0
+        elif records[0] is None:
+            newest = 1
+        else:
+            # Sequence numbers wrap, the newer one is less than half a turn ahead.
+            ahead = (records[1][0] - records[0][0]) & 0xffff
+            newest = 1 if 0 < ahead < 0x8000 else 0
+
+        self.next_path = newest ^ 1
+        return records[newest]
+
+    def write(self, sequence, outputs):
+        with open(self.paths[self.next_path], 'wb') as file:
+            file.write(pack_record(sequence, outputs))
+
+        self.next_path ^= 1
+
+
+backend = None
+sequence = 0
+stored_outputs = None
+written_ms = None
+write_count = 0
+flush_timer = None
+flush_pending = False
+
+
+def restore_state():
+    global backend
+    global sequence
+    global stored_outputs
+    global flush_timer
+
+    if backend is not None:
+        print('State is already restored')
+        return
+
+    print('Restoring state...')
+
+    nvram = config.state_store_nvram
+    if nvram and config.state_store_nvram_address == config.ds3231_address:
+        # The NVRAM offsets are the DS3231's alarm and control registers.
+        print('DS1307 NVRAM is at the DS3231 address, storing state in flash')
+        nvram = False
+
+    if nvram:
+        from urtc import DS1307
+        backend = NVRAMBackend(
+            DS1307(config.get_i2c(), address=config.state_store_nvram_address)
+        )
+    else:
+        backend = FlashBackend(config.state_store_path)
+
+    record = backend.read()
+    if record is None:
+        print('No stored state found')
+
+    else:
+        sequence, stored_outputs = record
+        controller.set_state(stored_outputs)
+
+        print('State restored:', stored_outputs)
+
+    flush_timer = Timer(config.state_store_timer_id)
+    controller.add_change_callback(output_change_handler)
+
+
+def output_change_handler(output, enable):
+    # Coalesces changes into at most one write per
+    # config.state_store_min_interval_ms, which bounds the writes per hour.
+    global flush_pending
+
+    if flush_pending:
+        return
+
+    delay_ms = config.state_store_coalesce_ms
+    if written_ms is not None:
+        delay_ms = max(
+            delay_ms,
+            config.state_store_min_interval_ms
+            - time.ticks_diff(time.ticks_ms(), written_ms)
+        )
+
+    flush_pending = True
+    flush_timer.init(mode=Timer.ONE_SHOT, period=delay_ms, callback=flush)
+
+
+def flush(timer=None):
+    global sequence
+    global stored_outputs
+    global written_ms
+    global write_count
+    global flush_pending
+
+    flush_pending = False
+
+    outputs = controller.get_state()
+    if outputs == stored_outputs:
+        return
+
+    sequence = (sequence + 1) & 0xffff
+    try:
+        backend.write(sequence, outputs)
+    except OSError as exception:
+        print('Failed to store state:', exception)
+        return
+
+    stored_outputs = outputs
+    written_ms = time.ticks_ms()
+    write_count += 1
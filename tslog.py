@@ -0,0 +1,258 @@
+from array import array
+import _thread
+import machine
+import os
+import struct
+
+# timestamp (seconds), channel, flags (unused), value
+RECORD_FORMAT = '<IBBh'
+RECORD_SIZE = 8
+
+
+def bisect_right(index, count, value):
+    low = 0
+    high = count
+
+    while low < high:
+        middle = (low + high) // 2
+        if value < index[middle]:
+            high = middle
+        else:
+            low = middle + 1
+
+    return low
+
+
+class TimeSeriesLog:
+    """Append-only log of fixed size records in a ring of segment files.
+
+    Records are collected in one of two RAM pages and a full page is written
+    by flush() in one write. Each segment keeps the first timestamp of each
+    of its pages in RAM, so a time range is located by binary search and
+    only its two boundary pages are scanned. Records are expected to arrive
+    in time order.
+    """
+
+    def __init__(self, path, segment_count=8, segment_pages=32, page_size=512):
+        self.path = path
+        self.segment_count = segment_count
+        self.segment_pages = segment_pages
+        self.page_size = page_size
+        self.records_per_page = page_size // RECORD_SIZE
+
+        self.pages = (bytearray(page_size), bytearray(page_size))
+        self.active = 0
+        self.active_records = 0
+        self.pending = False
+        self.dropped = 0
+
+        self.index = [
+            array('L', [0] * segment_pages) for _ in range(segment_count)
+        ]
+        self.segment_page_counts = array('H', [0] * segment_count)
+        self.segment = 0
+
+        self.read_buffer = bytearray(page_size)
+        self.lock = _thread.allocate_lock()
+
+        try:
+            os.mkdir(path)
+        except OSError:
+            pass
+
+        self.load()
+
+    def reset_lock(self):
+        # In a forked process, a flush by another thread of the parent never
+        # completes there.
+        self.lock = _thread.allocate_lock()
+
+    def segment_path(self, segment):
+        return '%s/%d.bin' % (self.path, segment)
+
+    def load(self):
+        latest = None
+        timestamp = memoryview(self.read_buffer)[:4]
+
+        for segment in range(self.segment_count):
+            try:
+                size = os.stat(self.segment_path(segment))[6]
+            except OSError:
+                size = 0
+
+            pages = min(size // self.page_size, self.segment_pages)
+            self.segment_page_counts[segment] = pages
+            if not pages:
+                continue
+
+            with open(self.segment_path(segment), 'rb') as file:
+                for page in range(pages):
+                    file.seek(page * self.page_size)
+                    file.readinto(timestamp)
+                    self.index[segment][page] = \
+                        struct.unpack_from('<I', timestamp)[0]
+
+            if latest is None \
+                    or self.index[segment][0] > self.index[latest][0]:
+                latest = segment
+
+        if latest is not None:
+            self.segment = latest
+
+    def append(self, channel, value, timestamp):
+        if value > 32767:
+            value = 32767
+        elif value < -32768:
+            value = -32768
+
+        # Samples arrive from IRQ handlers and output changes from the web
+        # server thread, so the record slot is taken with IRQs disabled.
+        irq_state = machine.disable_irq()
+        try:
+            records = self.active_records
+            if records < self.records_per_page:
+                struct.pack_into(
+                    RECORD_FORMAT, self.pages[self.active],
+                    records * RECORD_SIZE, timestamp, channel, 0, value
+                )
+                self.active_records = records + 1
+        finally:
+            machine.enable_irq(irq_state)
+
+        if records >= self.records_per_page:
+            # Another caller filled the page and is switching to the next.
+            self.dropped += 1
+            return
+
+        if records + 1 < self.records_per_page:
+            return
+
+        if self.pending and not self.flush():
+            # The previous page is still being written, drop this one.
+            self.active_records = 0
+            self.dropped += self.records_per_page
+            return
+
+        self.active ^= 1
+        self.active_records = 0
+        self.pending = True
+
+    def flush(self):
+        if not self.pending:
+            return True
+
+        if not self.lock.acquire(0):
+            return False
+
+        try:
+            self.write_page(self.pages[self.active ^ 1])
+            self.pending = False
+        finally:
+            self.lock.release()
+
+        return True
+
+    def write_page(self, page):
+        segment = self.segment
+        pages = self.segment_page_counts[segment]
+
+        if pages == self.segment_pages:
+            segment = (segment + 1) % self.segment_count
+            pages = 0
+            self.segment = segment
+            self.segment_page_counts[segment] = 0
+
+        with open(self.segment_path(segment), 'r+b' if pages else 'wb') as file:
+            file.seek(pages * self.page_size)
+            file.write(page)
+
+        self.index[segment][pages] = struct.unpack_from('<I', page)[0]
+        self.segment_page_counts[segment] = pages + 1
+
+    def find_record(self, page, records, timestamp, after):
+        # First record with a timestamp >= (or > when after) timestamp.
+        for record in range(records):
+            value = struct.unpack_from('<I', page, record * RECORD_SIZE)[0]
+            if value > timestamp or (not after and value == timestamp):
+                return record
+        return records
+
+    def read_page(self, segment, page):
+        with open(self.segment_path(segment), 'rb') as file:
+            file.seek(page * self.page_size)
+            file.readinto(self.read_buffer)
+        return self.read_buffer
+
+    def find_spans(self, start, end):
+        # -> [(segment, offset, length)], RAM pages as segment -1 and -2
+        spans = []
+
+        for position in range(1, self.segment_count + 1):
+            segment = (self.segment + position) % self.segment_count
+            pages = self.segment_page_counts[segment]
+            if not pages:
+                continue
+
+            index = self.index[segment]
+            first = max(bisect_right(index, pages, start) - 1, 0)
+            last = bisect_right(index, pages, end) - 1
+            if last < first:
+                continue
+
+            first_record = self.find_record(
+                self.read_page(segment, first), self.records_per_page,
+                start, False
+            )
+            last_record = self.find_record(
+                self.read_page(segment, last), self.records_per_page,
+                end, True
+            )
+
+            offset = first * self.page_size + first_record * RECORD_SIZE
+            length = last * self.page_size + last_record * RECORD_SIZE - offset
+            if length > 0:
+                spans.append((segment, offset, length))
+
+        ram_pages = ((self.active ^ 1, self.records_per_page),) \
+            if self.pending else ()
+        ram_pages += ((self.active, self.active_records),)
+
+        for page, records in ram_pages:
+            first_record = self.find_record(
+                self.pages[page], records, start, False
+            )
+            last_record = self.find_record(self.pages[page], records, end, True)
+            if last_record > first_record:
+                spans.append((
+                    -1 - page,
+                    first_record * RECORD_SIZE,
+                    (last_record - first_record) * RECORD_SIZE
+                ))
+
+        return spans
+
+    def read_spans(self, spans):
+        # Yields chunks of raw records reusing one page sized buffer.
+        buffer = memoryview(self.read_buffer)
+
+        for segment, offset, length in spans:
+            if segment < 0:
+                # RAM pages are refilled by append() from IRQ handlers, copy
+                # the records out before the caller sees them.
+                page = memoryview(self.pages[-1 - segment])
+                irq_state = machine.disable_irq()
+                try:
+                    buffer[:length] = page[offset:offset + length]
+                finally:
+                    machine.enable_irq(irq_state)
+                yield buffer[:length]
+                continue
+
+            with open(self.segment_path(segment), 'rb') as file:
+                file.seek(offset)
+                while length > 0:
+                    count = file.readinto(buffer[:min(length, self.page_size)])
+                    if not count:
+                        break
+                    yield buffer[:count]
+                    length -= count
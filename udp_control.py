@@ -0,0 +1,228 @@
+from array import array
+from metrics import Histogram
+import _thread
+import config
+import controller
+import socket
+import time
+import udp_protocol
+
+udp_socket = None
+udp_control_running = False
+
+# Per client id, the newest sequence number and its reply, a retransmitted
+# request gets the same reply again instead of toggling a second time. Bit i
+# of a client's window is set once newest - i has been accepted, older or
+# already accepted sequences are replays and dropped. The id is part of the
+# signed request and indexes these directly, so there is nothing to evict.
+REPLAY_WINDOW = 32
+client_sequences = array('H', [0] * config.udp_control_clients)
+client_windows = array('L', [0] * config.udp_control_clients)
+client_replies = [None] * config.udp_control_clients
+
+subscriber_addresses = [None] * config.udp_control_subscribers
+subscriber_ms = [0] * config.udp_control_subscribers
+broadcast_version = 0
+
+handle_us = Histogram()
+status_counts = array('L', [0] * len(udp_protocol.status_name))
+dropped = 0
+replayed = 0
+
+
+def initialize_udp_control():
+    global udp_socket
+
+    if udp_socket is not None:
+        print('UDP control is already initialized')
+
+    elif config.udp_control_port is None:
+        print('UDP control is disabled')
+
+    else:
+        print('Initializing UDP control...')
+
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        udp_socket.bind(
+            socket.getaddrinfo('0.0.0.0', config.udp_control_port)[0][-1]
+        )
+        udp_socket.settimeout(config.udp_control_poll_ms / 1000)
+
+        start_udp_control()
+
+        print('UDP control initialized on port', config.udp_control_port)
+
+
+def accept_sequence(client, sequence):
+    # -> whether sequence is new for the client, and marks it as accepted
+    window = client_windows[client]
+    newest = client_sequences[client]
+
+    if not window:
+        client_sequences[client] = sequence
+        client_windows[client] = 1
+        return True
+
+    ahead = (sequence - newest) & 0xffff
+    if 0 < ahead < 0x8000:
+        if ahead < REPLAY_WINDOW:
+            window = ((window << ahead) | 1) & 0xffffffff
+        else:
+            window = 1
+        client_sequences[client] = sequence
+        client_windows[client] = window
+        return True
+
+    behind = (newest - sequence) & 0xffff
+    if behind >= REPLAY_WINDOW or window & (1 << behind):
+        return False
+
+    client_windows[client] = window | (1 << behind)
+    return True
+
+
+def subscribe(address):
+    now = time.ticks_ms()
+    oldest = 0
+
+    for index in range(len(subscriber_addresses)):
+        if subscriber_addresses[index] == address:
+            oldest = index
+            break
+
+        if subscriber_addresses[index] is None \
+                or time.ticks_diff(subscriber_ms[index],
+                                   subscriber_ms[oldest]) < 0:
+            oldest = index
+
+    subscriber_addresses[oldest] = address
+    subscriber_ms[oldest] = now
+
+
+def handle(packet, address):
+    # -> the reply to send, or None
+    global dropped
+    global replayed
+
+    request = udp_protocol.unpack_request(packet, config.udp_control_key)
+    if request is None or request[3] >= len(client_windows):
+        dropped += 1
+        return None
+
+    command, output, value, client, sequence = request
+
+    if client_replies[client] is not None \
+            and client_sequences[client] == sequence:
+        return client_replies[client]
+
+    # A signed request captured on the network can't be sent again, from
+    # any address, while the device is up.
+    if not accept_sequence(client, sequence):
+        replayed += 1
+        return None
+
+    status = udp_protocol.STATUS_OK
+    snapshot = None
+
+    if command == udp_protocol.COMMAND_SET \
+            or command == udp_protocol.COMMAND_TOGGLE:
+        if output >= len(controller.output_names):
+            status = udp_protocol.STATUS_BAD_OUTPUT
+
+        else:
+            name = controller.output_names[output]
+            if command == udp_protocol.COMMAND_SET:
+                snapshot = controller.set_enable(name, bool(value))
+            else:
+                snapshot = controller.toggle_enable(name)
+
+            if snapshot is None:
+                status = udp_protocol.STATUS_DWELL
+
+    elif command == udp_protocol.COMMAND_SUBSCRIBE:
+        subscribe(address)
+
+    elif command != udp_protocol.COMMAND_GET:
+        status = udp_protocol.STATUS_BAD_COMMAND
+
+    if snapshot is None:
+        snapshot = controller.get_snapshot()
+
+    status_counts[status] += 1
+    reply = udp_protocol.pack_reply(
+        command, status, sequence, snapshot[0], snapshot[1],
+        config.udp_control_key
+    )
+    if client_sequences[client] == sequence:
+        # Only the newest request is retransmitted.
+        client_replies[client] = reply
+    return reply
+
+
+def broadcast():
+    # Sends the state to subscribers once per version, changes from buttons
+    # and HTTP reach them within config.udp_control_poll_ms.
+    global broadcast_version
+
+    state, version = controller.get_snapshot()
+    if version == broadcast_version:
+        return
+
+    broadcast_version = version
+    packet = udp_protocol.pack_reply(
+        udp_protocol.COMMAND_GET, udp_protocol.STATUS_OK, 0, state, version,
+        config.udp_control_key
+    )
+    now = time.ticks_ms()
+
+    for index in range(len(subscriber_addresses)):
+        address = subscriber_addresses[index]
+        if address is None:
+            continue
+
+        if time.ticks_diff(now, subscriber_ms[index]) \
+                > config.udp_control_subscriber_timeout_ms:
+            subscriber_addresses[index] = None
+            continue
+
+        try:
+            udp_socket.sendto(packet, address)
+        except OSError as exception:
+            print('UDP broadcast failed:', exception)
+
+
+def udp_control_process():
+    while udp_control_running:
+        try:
+            packet, address = udp_socket.recvfrom(64)
+        except OSError:
+            packet = None
+
+        if packet is not None:
+            started_us = time.ticks_us()
+            reply = handle(packet, address)
+            if reply is not None:
+                try:
+                    udp_socket.sendto(reply, address)
+                except OSError as exception:
+                    print('UDP reply failed:', exception)
+            handle_us.observe(time.ticks_diff(time.ticks_us(), started_us))
+
+        broadcast()
+
+
+def start_udp_control():
+    global udp_control_running
+
+    if udp_control_running:
+        return
+
+    udp_control_running = True
+    _thread.start_new_thread(udp_control_process, ())
+
+
+def stop_udp_control():
+    global udp_control_running
+
+    udp_control_running = False
@@ -0,0 +1,121 @@
+# Binary UDP control protocol, shared by the device (udp_control) and host
+# side clients, so it only uses what both MicroPython and CPython have.
+#
+# request: magic, command, output, value, client, sequence [, mac]
+# reply:   magic, command | REPLY, status, sequence, state, version [, mac]
+#
+# A reply always carries the whole output state word, and broadcasts to
+# subscribers are replies to COMMAND_GET with sequence 0. With a key the
+# packet is followed by the first MAC_SIZE bytes of its HMAC-SHA256.
+# Every client has its own id below config.udp_control_clients and counts
+# sequences up per request. The device drops sequences it has already
+# accepted for the client id or that are too old to tell; both are covered
+# by the MAC, so a captured request is dropped whatever address it comes
+# from.
+import hashlib
+import struct
+
+MAGIC = b'NC'
+
+REQUEST_FORMAT = '<2sBBBBH'
+REQUEST_SIZE = struct.calcsize(REQUEST_FORMAT)
+REPLY_FORMAT = '<2sBBHHI'
+REPLY_SIZE = struct.calcsize(REPLY_FORMAT)
+MAC_SIZE = 8
+
+COMMAND_GET = 0
+COMMAND_SET = 1
+COMMAND_TOGGLE = 2
+COMMAND_SUBSCRIBE = 3
+REPLY = 0x80
+
+# output for commands that don't address one
+OUTPUT_NONE = 0xff
+
+STATUS_OK = 0
+STATUS_DWELL = 1
+STATUS_BAD_OUTPUT = 2
+STATUS_BAD_COMMAND = 3
+
+status_name = ('ok', 'dwell', 'bad_output', 'bad_command')
+
+BLOCK_SIZE = 64
+
+
+def hmac_sha256(key, message):
+    if len(key) > BLOCK_SIZE:
+        key = hashlib.sha256(key).digest()
+    key = key + bytes(BLOCK_SIZE - len(key))
+
+    inner = hashlib.sha256(bytes(byte ^ 0x36 for byte in key))
+    inner.update(message)
+    outer = hashlib.sha256(bytes(byte ^ 0x5c for byte in key))
+    outer.update(inner.digest())
+    return outer.digest()
+
+
+def sign(packet, key):
+    if key is None:
+        return packet
+
+    return packet + hmac_sha256(key, packet)[:MAC_SIZE]
+
+
+def verify(packet, size, key):
+    # -> the packet without its MAC, or None if it doesn't check out
+    if key is None:
+        return packet if len(packet) == size else None
+
+    if len(packet) != size + MAC_SIZE:
+        return None
+
+    message = packet[:size]
+    expected = hmac_sha256(key, message)[:MAC_SIZE]
+    difference = 0
+    for index in range(MAC_SIZE):
+        difference |= expected[index] ^ packet[size + index]
+
+    return None if difference else message
+
+
+def pack_request(command, output, value, client, sequence, key=None):
+    return sign(struct.pack(
+        REQUEST_FORMAT, MAGIC, command, output, value, client,
+        sequence & 0xffff
+    ), key)
+
+
+def unpack_request(packet, key=None):
+    # -> (command, output, value, client, sequence), or None for foreign
+    # packets
+    message = verify(packet, REQUEST_SIZE, key)
+    if message is None:
+        return None
+
+    magic, command, output, value, client, sequence = \
+        struct.unpack(REQUEST_FORMAT, message)
+    if magic != MAGIC:
+        return None
+
+    return command, output, value, client, sequence
+
+
+def pack_reply(command, status, sequence, state, version, key=None):
+    return sign(struct.pack(
+        REPLY_FORMAT, MAGIC, command | REPLY, status, sequence, state,
+        version
+    ), key)
+
+
+def unpack_reply(packet, key=None):
+    # -> (command, status, sequence, state, version), or None
+    message = verify(packet, REPLY_SIZE, key)
+    if message is None:
+        return None
+
+    magic, command, status, sequence, state, version = \
+        struct.unpack(REPLY_FORMAT, message)
+    if magic != MAGIC or not command & REPLY:
+        return None
+
+    return command & ~REPLY, status, sequence, state, version
@@ -1,9 +1,22 @@
 from microWebSrv import MicroWebSrv
+import admission
+import autopump
+import config
 import controller
+import gc_policy
+import history
+import metrics
+import mqtt_bridge
+import pwm_fader
+import sensor
+import slow_requests
+
+web_server = None
 
 
 @MicroWebSrv.route('/')
 def index(httpClient, httpResponse):
+    state, version = controller.get_snapshot()
     response = """\
     <!DOCTYPE html>
     <html lang='en'>
@@ -12,26 +25,47 @@ def index(httpClient, httpResponse):
             <meta name='viewport' content='width=device-width,minimum-scale=1,maximum-scale=1,user-scalable=no'>
             <title>CyberController</title>
             <script>
+                let version = %d
+
+                function setButton(button, enable) {
+                    const onOff = enable ? 'On' : 'Off'
+                    button.innerText = button.innerText.replace(/(On|Off)$/, onOff)
+                }
+
                 async function buttonHandler(event) {
                     const button = event.target
                     const url = button.dataset.url
                     const response = await fetch(url)
                     const json = await response.json()
-                    const onOff = json.enable ? 'On' : 'Off'
-                    button.innerText = button.innerText.replace(/(On|Off)$/, onOff)
+                    setButton(button, json.enable)
+                }
+
+                // Buttons pressed on the controller show up within a poll.
+                async function poll() {
+                    const response = await fetch('/state')
+                    const json = await response.json()
+                    if (json.version !== version) {
+                        version = json.version
+                        for (const name in json.outputs) {
+                            setButton(document.getElementById(name), json.outputs[name])
+                        }
+                    }
                 }
+
+                setInterval(poll, 2000)
             </script>
         </head>
         <body>
             <h1>CyberController</h1>
-            <button data-url='/toggle_pump_enable' onclick='buttonHandler(event)'>Pump is %s</button>
-            <button data-url='/toggle_led_enable' onclick='buttonHandler(event)'>LEDs are %s</button>
+            %s
         </body>
     </html>
-    """ % (
-        'On' if controller.pump_enable else 'Off',
-        'On' if controller.led_enable else 'Off'
-    )
+    """ % (version, ''.join(
+        "<button id='%s' data-url='/toggle_%s_enable' onclick='buttonHandler(event)'>%s: %s</button>" % (
+            name, name, label, 'On' if controller.is_enabled(name, state) else 'Off'
+        )
+        for name, label, pins, interrupt in config.outputs
+    ))
 
     httpResponse.WriteResponseOk(
         contentType='text/html',
@@ -40,20 +74,191 @@ def index(httpClient, httpResponse):
     )
 
 
-@MicroWebSrv.route('/toggle_pump_enable')
-def toggle_pump_enable_handler(httpClient, httpResponse):
-    controller.toggle_pump_enable()
-    response = {"enable": controller.pump_enable}
+def create_toggle_enable_handler(name):
+    def toggle_enable_handler(httpClient, httpResponse):
+        # Reports the state the toggle applied, not whatever a button IRQ
+        # may have changed since.
+        state, version = controller.toggle_enable(name) \
+            or controller.get_snapshot()
+        response = {
+            "enable": controller.is_enabled(name, state),
+            "version": version
+        }
+        httpResponse.WriteResponseJSONOk(obj=response)
+
+    return toggle_enable_handler
+
+
+for output_name in controller.output_names:
+    MicroWebSrv.route('/toggle_%s_enable' % output_name)(
+        create_toggle_enable_handler(output_name)
+    )
+
+
+@MicroWebSrv.route('/state')
+def state_handler(httpClient, httpResponse):
+    state, version = controller.get_snapshot()
+    response = {
+        "version": version,
+        "outputs": {
+            name: controller.is_enabled(name, state)
+            for name in controller.output_names
+        }
+    }
     httpResponse.WriteResponseJSONOk(obj=response)
 
 
-@MicroWebSrv.route('/toggle_led_enable')
-def toggle_led_enable_handler(httpClient, httpResponse):
-    controller.toggle_led_enable()
-    response = {"enable": controller.led_enable}
+@MicroWebSrv.route('/pwm/<channel>/<brightness>/<fadeMs>')
+def pwm_handler(httpClient, httpResponse, routeArgs):
+    try:
+        pwm_fader.set_brightness(
+            routeArgs['channel'], routeArgs['brightness'], routeArgs['fadeMs']
+        )
+    except (IndexError, TypeError, ValueError):
+        httpResponse.WriteResponseBadRequest()
+        return
+
+    httpResponse.WriteResponseJSONOk(obj=pwm_fader.get_status())
+
+
+@MicroWebSrv.route('/mqtt')
+def mqtt_status_handler(httpClient, httpResponse):
+    httpResponse.WriteResponseJSONOk(obj=mqtt_bridge.get_status())
+
+
+@MicroWebSrv.route('/pwm')
+def pwm_status_handler(httpClient, httpResponse):
+    httpResponse.WriteResponseJSONOk(obj=pwm_fader.get_status())
+
+
+@MicroWebSrv.route('/toggle_autopump_enable')
+def toggle_autopump_enable_handler(httpClient, httpResponse):
+    autopump.toggle_autopump_enable()
+    response = {"enable": autopump.autopump_enable}
     httpResponse.WriteResponseJSONOk(obj=response)
 
 
+@MicroWebSrv.route('/autopump')
+def autopump_handler(httpClient, httpResponse):
+    httpResponse.WriteResponseJSONOk(obj=autopump.get_status())
+
+
+@MicroWebSrv.route('/sensor')
+def sensor_handler(httpClient, httpResponse):
+    httpResponse.WriteResponseJSONOk(obj=sensor.get_readings())
+
+
+@MicroWebSrv.route('/history')
+def history_handler(httpClient, httpResponse):
+    queryParams = httpClient.GetRequestQueryParams()
+    try:
+        count = int(queryParams['count']) if 'count' in queryParams else None
+    except ValueError:
+        count = None
+
+    response = history.get_rollup(
+        queryParams.get('series', 'pump'),
+        queryParams.get('resolution', 'hour'),
+        count
+    )
+    if response is None:
+        httpResponse.WriteResponseNotFound()
+    else:
+        httpResponse.WriteResponseJSONOk(obj=response)
+
+
+@MicroWebSrv.route('/history/export')
+def history_export_handler(httpClient, httpResponse):
+    queryParams = httpClient.GetRequestQueryParams()
+    try:
+        start = int(queryParams.get('start', 0))
+        end = int(queryParams.get('end', 0xffffffff))
+    except ValueError:
+        httpResponse.WriteResponseBadRequest()
+        return
+
+    spans = history.find_spans(start, end)
+    httpResponse.WriteResponseStream(
+        history.read_spans(spans),
+        sum(span[2] for span in spans),
+        contentType='application/octet-stream'
+    )
+
+
+@MicroWebSrv.route('/metrics')
+def metrics_handler(httpClient, httpResponse):
+    httpResponse.WriteResponseOk(
+        contentType='text/plain; version=0.0.4',
+        contentCharset='utf-8',
+        content=metrics.render()
+    )
+
+
+@MicroWebSrv.route('/slow_requests')
+def slow_requests_handler(httpClient, httpResponse):
+    httpResponse.WriteResponseJSONOk(obj=slow_requests.get_slow_requests())
+
+
+@MicroWebSrv.route('/heap')
+def heap_handler(httpClient, httpResponse):
+    httpResponse.WriteResponseJSONOk(obj=gc_policy.get_heap_report())
+
+
+def start_worker():
+    # Runs first in every prefork worker. The worker only has the thread
+    # that forked it, locks other threads held at the fork stay locked.
+    controller.reset_locks()
+    if config.i2c is not None:
+        config.i2c.reset_owner()
+    if history.log is not None:
+        history.log.reset_lock()
+
+    # History, the state store and MQTT only run in the supervisor, which
+    # applies the worker's changes, see controller.forward_changes().
+    controller.forward_changes()
+    web_server.IdleHooks.remove(history.flush)
+
+
 def start_web_server():
-    web_server = MicroWebSrv()
-    web_server.Start(threaded=True)
+    global web_server
+
+    if web_server is not None:
+        print('Web server is already started')
+
+    else:
+        print('Starting web server...')
+
+        web_server = MicroWebSrv(
+            port=config.web_server_port,
+            webPath=config.web_server_path
+        )
+        web_server.MaxConnections = config.web_server_max_connections
+        web_server.AdmissionCallback = admission.admit
+        web_server.RequestDoneHooks.append(metrics.record_request)
+        web_server.RequestDoneHooks.append(slow_requests.record_request)
+        web_server.RequestDoneHooks.append(gc_policy.record_request)
+        web_server.IdleHooks.append(gc_policy.idle)
+        web_server.IdleHooks.append(history.flush)
+        web_server.IdleIntervalSec = config.web_server_idle_interval_sec
+        web_server.CompressMinSize = config.web_server_compress_min_size
+        web_server.CompressWindowBits = config.web_server_compress_window_bits
+        web_server.CompressCacheSize = config.web_server_compress_cache_size
+        web_server.PyHTMLCacheSize = config.web_server_pyhtml_cache_size
+
+        if config.gc_policy_enabled:
+            gc_policy.enable_gc_policy()
+
+        if config.web_server_workers > 1:
+            controller.share_state()
+            web_server.AfterForkHooks.append(start_worker)
+            web_server.SupervisorHooks.append(
+                controller.apply_forwarded_changes
+            )
+            web_server.SupervisorIntervalSec = \
+                config.web_server_supervisor_interval_ms / 1000
+            web_server.WorkerTimeoutSec = config.web_server_worker_timeout_sec
+            web_server.StartPrefork(config.web_server_workers, threaded=True)
+        else:
+            web_server.Start(threaded=True)
+
+        print('Web server started')
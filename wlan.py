@@ -1,5 +1,7 @@
+import _thread
 import config
 import network
+import time
 
 network_STAT_CONNECT_FAIL = 205
 
@@ -11,7 +13,27 @@ wlan_status_code[network.STAT_NO_AP_FOUND] = 'No AP Found'
 wlan_status_code[network_STAT_CONNECT_FAIL] = 'Connection Failed'
 wlan_status_code[network.STAT_GOT_IP] = 'Connected'
 
+wlan_failure_status = (
+    network.STAT_WRONG_PASSWORD,
+    network.STAT_NO_AP_FOUND,
+    network_STAT_CONNECT_FAIL
+)
+
+WLAN_STATE_DISCONNECTED = 0
+WLAN_STATE_CONNECTING = 1
+WLAN_STATE_CONNECTED = 2
+WLAN_STATE_BACKOFF = 3
+
+wlan_state_name = {}
+wlan_state_name[WLAN_STATE_DISCONNECTED] = 'Disconnected'
+wlan_state_name[WLAN_STATE_CONNECTING] = 'Connecting'
+wlan_state_name[WLAN_STATE_CONNECTED] = 'Connected'
+wlan_state_name[WLAN_STATE_BACKOFF] = 'Backoff'
+
 wlan = None
+wlan_state = WLAN_STATE_DISCONNECTED
+wlan_status_callbacks = []
+wlan_manager_running = False
 
 
 def initialize_wlan():
@@ -30,26 +52,142 @@ def initialize_wlan():
         print('WLAN initialized')
 
 
+def add_wlan_status_callback(callback):
+    # Callbacks are called with the new WLAN_STATE_* from the manager thread.
+    wlan_status_callbacks.append(callback)
+
+
+def set_wlan_state(state):
+    global wlan_state
+
+    if state == wlan_state:
+        return
+
+    wlan_state = state
+    print('WLAN State:', wlan_state_name[state])
+
+    for callback in wlan_status_callbacks:
+        try:
+            callback(state)
+        except Exception as exception:
+            print('WLAN status callback failed:', exception)
+
+
 def connect_to_wlan():
     global wlan
 
-    if wlan.status() == network.STAT_GOT_IP:
+    # Only issues the connect request, the WLAN manager follows it up.
+    status = wlan.status()
+
+    if status == network.STAT_GOT_IP:
         print('WLAN is already connected')
         print('WLAN IP:', wlan.ifconfig()[0])
 
-    if wlan.status() == network.STAT_CONNECTING:
+    elif status == network.STAT_CONNECTING:
         print('WLAN is already connecting...')
 
-    if wlan.status() == network.STAT_IDLE \
-            or wlan.status() == network.STAT_WRONG_PASSWORD \
-            or wlan.status() == network.STAT_NO_AP_FOUND \
-            or wlan.status() == network_STAT_CONNECT_FAIL:
+    else:
         print('Connecting to WLAN...')
 
         wlan.connect(config.wlan_ssid, config.wlan_password)
-        while wlan.status() == network.STAT_CONNECTING:
-            pass
 
-        print('WLAN Status:', wlan_status_code[wlan.status()])
-        if wlan.status() == network.STAT_GOT_IP:
-            print('WLAN IP:', wlan.ifconfig()[0])
+
+def get_wlan_rssi():
+    try:
+        return wlan.status('rssi')
+    except BaseException:
+        return None
+
+
+def wlan_manager_process():
+    backoff_ms = config.wlan_backoff_initial_ms
+    backoff_until = 0
+    connect_started = 0
+    weak_rssi_polls = 0
+
+    while wlan_manager_running:
+        status = wlan.status()
+        now = time.ticks_ms()
+
+        if wlan_state == WLAN_STATE_DISCONNECTED:
+            connect_to_wlan()
+            connect_started = now
+            set_wlan_state(WLAN_STATE_CONNECTING)
+
+        elif wlan_state == WLAN_STATE_CONNECTING:
+            if status == network.STAT_GOT_IP:
+                print('WLAN IP:', wlan.ifconfig()[0])
+
+                backoff_ms = config.wlan_backoff_initial_ms
+                weak_rssi_polls = 0
+                set_wlan_state(WLAN_STATE_CONNECTED)
+
+            elif status in wlan_failure_status \
+                    or time.ticks_diff(now, connect_started) \
+                    >= config.wlan_connect_timeout_ms:
+                print('WLAN Status:', wlan_status_code.get(status, status))
+                print('Retrying WLAN connection in', backoff_ms, 'ms')
+
+                wlan.disconnect()
+                backoff_until = time.ticks_add(now, backoff_ms)
+                backoff_ms = min(backoff_ms * 2, config.wlan_backoff_max_ms)
+                set_wlan_state(WLAN_STATE_BACKOFF)
+
+        elif wlan_state == WLAN_STATE_BACKOFF:
+            if time.ticks_diff(now, backoff_until) >= 0:
+                set_wlan_state(WLAN_STATE_DISCONNECTED)
+
+        elif wlan_state == WLAN_STATE_CONNECTED:
+            if status != network.STAT_GOT_IP:
+                print('WLAN Status:', wlan_status_code.get(status, status))
+                set_wlan_state(WLAN_STATE_DISCONNECTED)
+
+            else:
+                rssi = get_wlan_rssi()
+                if rssi is not None and rssi < config.wlan_rssi_threshold:
+                    weak_rssi_polls += 1
+                else:
+                    weak_rssi_polls = 0
+
+                if weak_rssi_polls >= config.wlan_rssi_weak_polls:
+                    print('WLAN RSSI is weak, reconnecting:', rssi)
+
+                    weak_rssi_polls = 0
+                    wlan.disconnect()
+                    set_wlan_state(WLAN_STATE_DISCONNECTED)
+
+        time.sleep_ms(config.wlan_poll_interval_ms)
+
+
+def start_wlan_manager():
+    global wlan_manager_running
+
+    if wlan_manager_running:
+        print('WLAN manager is already running')
+
+    else:
+        print('Starting WLAN manager...')
+
+        wlan_manager_running = True
+        _thread.start_new_thread(wlan_manager_process, ())
+
+        print('WLAN manager started')
+
+
+def wait_for_wlan_connection(timeout_ms=None):
+    started = time.ticks_ms()
+
+    while wlan_state != WLAN_STATE_CONNECTED:
+        if timeout_ms is not None \
+                and time.ticks_diff(time.ticks_ms(), started) >= timeout_ms:
+            return False
+
+        time.sleep_ms(config.wlan_poll_interval_ms)
+
+    return True
+
+
+def stop_wlan_manager():
+    global wlan_manager_running
+
+    wlan_manager_running = False